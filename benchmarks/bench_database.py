@@ -0,0 +1,237 @@
+"""
+قياس أداء دوال database.py على أعداد مستخدمين واقعية (بدون إنترنت)
+
+يولّد مستخدمين وهميين بشجرة إحالات (قلة من المحيلين لديهم أغلب الإحالات)
+وسجل daily_downloads قديم لكل مستخدم، ثم يقيس كل دالة عامة (p50/p99)
+وأقصى استهلاك للذاكرة (RSS). كل حجم يُشغّل في عملية منفصلة ومجلد مؤقت.
+
+الاستخدام:
+    python benchmarks/bench_database.py                       # 10k و 100k
+    python benchmarks/bench_database.py --sizes 10000 100000 1000000 --backend sqlite
+    python benchmarks/bench_database.py --output results/before.json
+
+مقارنة نتيجتين: diff بين ملفي JSON أو أي أداة مقارنة JSON
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_SIZES = [10_000, 100_000]
+DEFAULT_OPS = 2000
+SEED = 42
+
+# ============ توليد البيانات ============
+
+def _referrer_index(rng, count):
+    """توزيع ذو ذيل طويل: أغلب الإحالات لعدد قليل من المستخدمين"""
+    return min(int(rng.paretovariate(1.1)) - 1, count - 1)
+
+def generate_population(count, seed=SEED):
+    """مستخدمون بصيغة JSON الحالية (مع daily_downloads القديم)"""
+    rng = random.Random(seed)
+    today = date.today()
+    users = {}
+    referrers = rng.sample(range(1, count + 1), max(1, count // 100))
+
+    for user_id in range(1, count + 1):
+        history = {}
+        active_days = rng.randint(0, 60)
+        for _ in range(active_days):
+            day = (today - timedelta(days=rng.randint(0, 365))).isoformat()
+            history[day] = history.get(day, 0) + rng.randint(1, 5)
+        downloads = sum(history.values())
+
+        referred_by = None
+        if rng.random() < 0.3:
+            referred_by = referrers[_referrer_index(rng, len(referrers))]
+            if referred_by == user_id:
+                referred_by = None
+
+        users[str(user_id)] = {
+            "user_id": user_id,
+            "username": f"user_{user_id}" if rng.random() < 0.8 else None,
+            "full_name": f"User {user_id}",
+            "referral_code": f"REF{user_id:08X}",
+            "language": "ar" if rng.random() < 0.7 else "en",
+            "registration_date": (datetime.now() - timedelta(days=rng.randint(0, 700))).isoformat(),
+            "download_count": downloads,
+            "daily_downloads": history,
+            "subscription_end": (datetime.now() + timedelta(days=rng.randint(-30, 60))).isoformat()
+                if rng.random() < 0.05 else None,
+            "is_lifetime_vip": rng.random() < 0.002,
+            "referred_by": referred_by,
+            "referrals": [],
+            "successful_referrals": 0,
+            "bonus_downloads": 50,
+            "achievements": {},
+        }
+
+    for user in users.values():
+        referrer = users.get(str(user["referred_by"])) if user["referred_by"] else None
+        if referrer:
+            referrer["referrals"].append(user["user_id"])
+            if user["download_count"] >= 10:
+                referrer["successful_referrals"] += 1
+                referrer["bonus_downloads"] += 10
+    return users
+
+# ============ القياس ============
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def _measure(fn, args_list):
+    """تشغيل fn لكل مجموعة معاملات وإرجاع p50/p99/المتوسط بالميكروثانية"""
+    samples = []
+    for args in args_list:
+        started = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - started) * 1e6)
+    return {
+        "n": len(samples),
+        "p50_us": round(_percentile(samples, 50), 2),
+        "p99_us": round(_percentile(samples, 99), 2),
+        "mean_us": round(sum(samples) / len(samples), 2),
+    }
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # لينكس بالكيلوبايت، macOS بالبايت
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def run_worker(count, ops, backend):
+    """قياس حجم واحد - يعمل داخل مجلد مؤقت في عملية منفصلة"""
+    rng = random.Random(SEED)
+    users = generate_population(count)
+    with open("temp_database.json", "w", encoding="utf-8") as f:
+        json.dump({"users": users, "config": {}}, f, ensure_ascii=False)
+    codes = [u["referral_code"] for u in rng.sample(list(users.values()), min(ops, count))]
+    usernames = [u["username"] for u in users.values() if u["username"]][:ops]
+    del users
+
+    os.environ["DB_BACKEND"] = backend
+    os.environ["SQLITE_DB_FILE"] = "bench.sqlite3"
+    sys.path.insert(0, ROOT)
+    if backend == "sqlite":
+        import database_sqlite
+        database_sqlite.migrate_from_json("temp_database.json", "bench.sqlite3")
+
+    import database
+    started = time.perf_counter()
+    database.init_db()
+    load_s = time.perf_counter() - started
+
+    existing = [(rng.randint(1, count),) for _ in range(ops)]
+    new_ids = [(count + i + 1, f"new_{i}", f"New {i}") for i in range(ops)]
+    results = {
+        "add_user": _measure(database.add_user, new_ids),
+        "get_user": _measure(database.get_user, existing),
+        "increment_download_count": _measure(database.increment_download_count, existing),
+        "get_daily_download_count": _measure(database.get_daily_download_count, existing),
+        "is_subscribed": _measure(database.is_subscribed, existing),
+        "get_entitlements": _measure(database.get_entitlements, existing),
+        "use_bonus_download": _measure(database.use_bonus_download, existing),
+        "register_referral": _measure(
+            database.register_referral, [(uid, code) for (uid, *_), code in zip(new_ids, codes)]
+        ),
+        "get_user_by_referral_code": _measure(database.get_user_by_referral_code, [(c,) for c in codes]),
+        "get_user_by_username": _measure(database.get_user_by_username, [(u,) for u in usernames]),
+        "generate_referral_code": _measure(database.generate_referral_code, [()] * ops),
+        "get_users_count": _measure(database.get_users_count, [()] * ops),
+        "get_referral_statistics": _measure(database.get_referral_statistics, [()] * ops),
+        "get_total_downloads_count": _measure(database.get_total_downloads_count, [()] * ops),
+        "get_top_referrers": _measure(database.get_top_referrers, [(20,)] * ops),
+        "get_referrer_rank": _measure(database.get_referrer_rank, existing),
+        "reserve_release_download": _measure(
+            lambda uid: database.release_download(database.reserve_download(uid, 5)), existing
+        ),
+        "update_user_interaction": _measure(database.update_user_interaction, existing),
+        "flush_user_interactions": _measure(database.flush_user_interactions, [()] * 5),
+        "verify_counters": _measure(database.verify_counters, [()] * 5),
+        "flush_db": _measure(database.flush_db, [()] * 5),
+    }
+
+    started = time.perf_counter()
+    database.shutdown_db()
+    shutdown_s = time.perf_counter() - started
+
+    return {
+        "users": count,
+        "backend": backend,
+        "init_db_s": round(load_s, 3),
+        "shutdown_db_s": round(shutdown_s, 3),
+        "snapshot_mb": round(os.path.getsize("temp_database.json") / 1024 / 1024, 1),
+        "peak_rss_mb": _peak_rss_mb(),
+        "ops": results,
+    }
+
+def _git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="قياس أداء database.py")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--ops", type=int, default=DEFAULT_OPS, help="عدد الاستدعاءات لكل دالة")
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.ops, args.backend)))
+        return
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": args.backend,
+            "ops": args.ops,
+        },
+        "results": [],
+    }
+    for size in args.sizes:
+        print(f"⏳ {size} مستخدم ({args.backend})...", file=sys.stderr)
+        with tempfile.TemporaryDirectory(prefix="bench_db_") as workdir:
+            env = dict(os.environ, DB_WRITE_INTERVAL=os.getenv("DB_WRITE_INTERVAL", "1.0"))
+            proc = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--worker", str(size),
+                 "--ops", str(args.ops), "--backend", args.backend],
+                cwd=workdir, env=env, capture_output=True, text=True,
+            )
+        if proc.returncode != 0:
+            print(proc.stderr[-4000:], file=sys.stderr)
+            sys.exit(f"❌ فشل القياس لـ {size} مستخدم")
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        report["results"].append(result)
+        print(
+            f"✅ {size}: init {result['init_db_s']}s، ذاكرة {result['peak_rss_mb']}MB، "
+            f"increment p99 {result['ops']['increment_download_count']['p99_us']}µs",
+            file=sys.stderr,
+        )
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"📄 النتائج: {args.output}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
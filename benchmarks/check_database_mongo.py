@@ -0,0 +1,185 @@
+"""
+فحص database_mongo.py على عميل MongoDB وهمي داخل العملية (mongomock_motor) بدون خادم
+
+يمر على المسارات الأساسية: إضافة المستخدمين (مع تصادم كود الإحالة)، القراءة والتحديث،
+الإحالات ومكافأة التحميل العاشر، الاشتراكات، العدادات الإجمالية، حجز الحصة، الترحيل من JSON،
+والواجهة المتزامنة database_mongo_sync.py المستخدمة مع DB_BACKEND=mongo.
+يطبع نتيجة كل فحص ويفشل (رمز خروج 1) إن لم تطابق أي نتيجة المتوقع.
+
+الاستخدام:
+    pip install mongomock-motor
+    python benchmarks/check_database_mongo.py
+"""
+import os
+import sys
+import json
+import asyncio
+import inspect
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import database_mongo as mdb  # noqa: E402
+
+_results = []
+
+def check(name, actual, expected):
+    ok = actual == expected
+    _results.append(ok)
+    print(f"{'✅' if ok else '❌'} {name}: {actual!r}" + ("" if ok else f" (المتوقع {expected!r})"))
+
+async def check_users():
+    check("إضافة مستخدم", await mdb.add_user(1, "Alice", "Alice A"), True)
+    check("إضافة مكررة", await mdb.add_user(1, "Alice", "Alice A"), True)
+    user = await mdb.get_user(1)
+    check("قراءة المستخدم", (user.user_id, user.username, user.bonus_downloads), (1, "Alice", 50))
+    check("البحث باليوزر نيم", (await mdb.get_user_by_username("@alice")).user_id, 1)
+    check("البحث بكود الإحالة", (await mdb.get_user_by_referral_code(user.referral_code)).user_id, 1)
+
+    await mdb.update_user_language(1, "en")
+    check("تحديث اللغة", await mdb.get_user_language(1), "en")
+
+    # تصادم كود الإحالة: الكود الأول محجوز مسبقاً - يجب إنشاء المستخدم بكود جديد
+    codes = iter([user.referral_code, "REFCOLLIDE2"])
+    original = mdb.generate_referral_code
+
+    async def colliding_code():
+        return next(codes)
+
+    mdb.generate_referral_code = colliding_code
+    try:
+        check("إضافة مع تصادم كود الإحالة", await mdb.add_user(2, "bob", "Bob"), True)
+    finally:
+        mdb.generate_referral_code = original
+    bob = await mdb.get_user(2)
+    check("المستخدم أُنشئ فعلاً بكود جديد", bob and bob.referral_code, "REFCOLLIDE2")
+
+async def check_referrals():
+    alice = await mdb.get_user(1)
+    check("كود الإحالة الخاص", (await mdb.register_referral(1, alice.referral_code))[0], False)
+    check("كود غير صحيح", (await mdb.register_referral(2, "REFNOPE"))[0], False)
+    check("تسجيل إحالة", await mdb.register_referral(2, alice.referral_code), (True, "تم تسجيل الإحالة بنجاح"))
+    check("قائمة الإحالات", (await mdb.get_user(1)).referrals, [2])
+
+    for _ in range(10):
+        await mdb.increment_download_count(2)
+    bob = await mdb.get_user(2)
+    check("عداد التحميل", bob.download_count, 10)
+    check("التحميلات اليومية", await mdb.get_daily_download_count(2), 10)
+    check("المجموع الشهري", sum(bob.monthly_downloads.values()), 10)
+    alice = await mdb.get_user(1)
+    check("مكافأة المحيل", (alice.successful_referrals, alice.bonus_downloads), (1, 60))
+    check("ترتيب المحيل", await mdb.get_referrer_rank(1), 1)
+    check("عدد المحيلين", await mdb.get_referrers_count(), 1)
+    check("أكثر المحيلين", [u.user_id for u in await mdb.get_top_referrers()], [1])
+
+async def check_counters():
+    await mdb.add_subscription(2, 30)
+    await mdb.set_lifetime_vip(1)
+    check("اشتراك VIP", await mdb.is_subscribed(2), True)
+    check("عدد المستخدمين", await mdb.get_users_count(), {"total": 2, "vip": 1, "lifetime_vip": 1, "free": 0})
+    check("إجمالي التحميلات", await mdb.get_total_downloads_count(), 10)
+    check("العدادات مطابقة لإعادة العد", await mdb.verify_counters(), True)
+
+    await mdb.set_logo_status(False)
+    check("حالة اللوجو", await mdb.is_logo_enabled(), False)
+    await mdb.save_user_interactions({1: "2026-01-01T12:00:00"})
+    check("آخر تفاعل", (await mdb.get_user(1)).last_interaction.isoformat(), "2026-01-01T12:00:00")
+
+async def check_reservations():
+    await mdb.add_user(3, "carol", "Carol")
+    first = await mdb.reserve_download(3, daily_limit=1)
+    check("حجز من الحصة اليومية", mdb.get_reservation_kind(first), "daily")
+    check("الحصة محجوزة بالكامل", await mdb.reserve_download(3, daily_limit=1), None)
+    bonus = await mdb.reserve_download(3, daily_limit=1, allow_bonus=True)
+    check("حجز من الرصيد الإضافي", mdb.get_reservation_kind(bonus), "bonus")
+
+    check("تأكيد الحجز اليومي", await mdb.commit_download(first), True)
+    check("تأكيد حجز غير موجود", await mdb.commit_download(first), None)
+    check("تأكيد الحجز الإضافي", await mdb.commit_download(bonus), True)
+    carol = await mdb.get_user(3)
+    check("الاحتساب والخصم", (carol.download_count, carol.bonus_downloads), (2, 49))
+
+    released = await mdb.reserve_download(3, daily_limit=1, allow_bonus=True)
+    check("إلغاء الحجز", await mdb.release_download(released), True)
+    check("الإلغاء لا يحتسب", (await mdb.get_user(3)).download_count, 2)
+
+    vip = await mdb.reserve_download(2, daily_limit=0)
+    check("حجز بدون حد لـ VIP", mdb.get_reservation_kind(vip), "unlimited")
+    await mdb.commit_download(vip)
+    check("VIP لا يُحتسب", (await mdb.get_user(2)).download_count, 10)
+    check("العدادات بعد الحجوزات", await mdb.verify_counters(), True)
+
+async def check_migration():
+    users = {
+        "100": {"user_id": 100, "username": "legacy", "referral_code": "REFLEGACY01",
+                "download_count": 3, "bonus_downloads": 5, "daily_downloads": {"2025-01-02": 3}},
+        # مستخدمان قديمان بدون كود إحالة: لا تعارض على الفهرس الفريد
+        "101": {"user_id": 101, "username": "nocode1"},
+        "102": {"user_id": 102, "username": "nocode2"},
+    }
+    with tempfile.TemporaryDirectory(prefix="mongo_check_") as workdir:
+        path = os.path.join(workdir, "temp_database.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"users": users, "config": {"logo_enabled": True}}, f)
+        check("الترحيل من JSON", await mdb.migrate_from_json(path), 3)
+    legacy = await mdb.get_user(100)
+    check("المستخدم المرحّل", (legacy.download_count, legacy.monthly_downloads), (3, {"2025-01": 3}))
+    check("بدون كود إحالة", (await mdb.get_user(102)).referral_code, None)
+    check("العدادات بعد الترحيل", (await mdb.get_users_count())["total"], 6)
+
+def _patch_fake_bulk_write():
+    """mongomock لا يقبل معامل sort الذي يمرره UpdateOne في pymongo 4.11+ (يكون None عندنا دائماً)"""
+    from mongomock.collection import BulkOperationBuilder
+    add_update = BulkOperationBuilder.add_update
+    if "sort" in inspect.signature(add_update).parameters:
+        return
+
+    def add_update_without_sort(self, *args, sort=None, **kwargs):
+        if sort is not None:
+            raise NotImplementedError("mongomock لا يدعم sort في bulk_write")
+        return add_update(self, *args, **kwargs)
+
+    BulkOperationBuilder.add_update = add_update_without_sort
+
+async def run():
+    from mongomock_motor import AsyncMongoMockClient
+
+    _patch_fake_bulk_write()
+
+    if not await mdb.init_db(client=AsyncMongoMockClient(), db_name="check"):
+        sys.exit("❌ فشل تهيئة قاعدة البيانات الوهمية")
+    try:
+        await check_users()
+        await check_referrals()
+        await check_counters()
+        await check_reservations()
+        await check_migration()
+    finally:
+        await mdb.close_db()
+
+def check_sync_bridge():
+    """DB_BACKEND=mongo: نفس الدوال عبر الواجهة المتزامنة وحلقة MongoDB الخاصة"""
+    import database_mongo_sync as sdb
+
+    mdb.MONGODB_URI = "mongomock://"
+    check("تهيئة الواجهة المتزامنة", sdb.init_db(), True)
+    try:
+        check("إضافة مستخدم (متزامن)", sdb.add_user(7, "dave", "Dave"), True)
+        check("الصلاحيات (متزامن)", sdb.get_entitlements(7).bonus_downloads, 50)
+        check("عداد التحميل (متزامن)", (sdb.increment_download_count(7), sdb.get_daily_download_count(7)), (True, 1))
+    finally:
+        sdb.close_db()
+    check("إيقاف حلقة MongoDB", sdb._loop, None)
+
+def main():
+    asyncio.run(run())
+    check_sync_bridge()
+    failed = _results.count(False)
+    if failed:
+        sys.exit(f"❌ فشل {failed} من {len(_results)} فحص")
+    print(f"✅ نجحت كل الفحوص ({len(_results)})", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+فحص ذاكرة الرفع: هل يبقى استهلاك الذاكرة (RSS) ثابتاً أثناء رفع ملفات كبيرة؟
+
+يشغّل خادم Bot API وهمي محلي (يقرأ الطلب ويهمله) ثم يرفع ملفاً عشوائياً بـ send_video
+عبر upload_stream بعدة رفعات متزامنة، ويقيس أقصى زيادة في RSS. يفشل (رمز خروج 1)
+إذا تجاوزت الزيادة الحد. كل وضع يعمل في عملية منفصلة حتى لا تتأثر القياسات ببعضها.
+
+الاستخدام:
+    python benchmarks/check_upload_rss.py                         # 300MB × 2 رفع متزامن
+    python benchmarks/check_upload_rss.py --size-mb 1500 --concurrency 3
+    python benchmarks/check_upload_rss.py --buffered              # للمقارنة: الطريقة القديمة (الملف كاملاً في الذاكرة)
+"""
+import os
+import sys
+import json
+import asyncio
+import argparse
+import tempfile
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_SIZE_MB = 300
+DEFAULT_CONCURRENCY = 2
+DEFAULT_MAX_GROWTH_MB = 32
+SAMPLE_INTERVAL = 0.05
+
+class _FakeBotApi(BaseHTTPRequestHandler):
+    """خادم Bot API وهمي: getMe وأي دالة رفع تعيد رسالة فيديو"""
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        remaining = int(self.headers.get('Content-Length', 0))
+        received = 0
+        while remaining > 0:
+            chunk = self.rfile.read(min(1 << 20, remaining))
+            if not chunk:
+                break
+            received += len(chunk)
+            remaining -= len(chunk)
+
+        user = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        if self.path.endswith("/getMe"):
+            result = user
+        else:
+            result = {
+                "message_id": 1, "date": 0, "chat": {"id": 1, "type": "private"},
+                "video": {"file_id": f"bench_{received}", "file_unique_id": "bench",
+                          "width": 1, "height": 1, "duration": 1},
+            }
+        body = json.dumps({"ok": True, "result": result}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def _rss_mb():
+    """RSS الحالي من /proc (لينكس) أو الأقصى من getrusage"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+def _make_file(path, size_mb):
+    block = os.urandom(1 << 20)
+    with open(path, 'wb') as f:
+        for _ in range(size_mb):
+            f.write(block)
+
+async def _upload_all(base_url, path, concurrency, buffered):
+    from telegram import Bot
+    import upload_stream
+
+    progress = [0] * concurrency
+
+    async def upload(index, bot):
+        with open(path, 'rb') as f:
+            if buffered:
+                source = f
+            else:
+                def on_progress(sent, total, index=index):
+                    progress[index] = sent * 100 // total
+                source = upload_stream.input_file(f, on_progress)
+            message = await bot.send_video(1, source, write_timeout=120)
+        return message.video.file_id
+
+    async with Bot("1:bench", base_url=base_url) as bot:
+        baseline = _rss_mb()
+        peak = baseline
+        done = asyncio.Event()
+
+        async def sample():
+            nonlocal peak
+            while not done.is_set():
+                peak = max(peak, _rss_mb())
+                await asyncio.sleep(SAMPLE_INTERVAL)
+
+        sampler = asyncio.create_task(sample())
+        file_ids = await asyncio.gather(*(upload(i, bot) for i in range(concurrency)))
+        done.set()
+        await sampler
+    return {
+        "baseline_mb": round(baseline, 1),
+        "peak_mb": round(peak, 1),
+        "growth_mb": round(peak - baseline, 1),
+        "uploaded_bytes": [int(fid.split("_")[1]) for fid in file_ids],
+        "progress_final": progress if not buffered else None,
+    }
+
+def run_worker(size_mb, concurrency, buffered):
+    sys.path.insert(0, ROOT)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _FakeBotApi)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    with tempfile.TemporaryDirectory(prefix="upload_rss_") as workdir:
+        path = os.path.join(workdir, "video.mp4")
+        _make_file(path, size_mb)
+        result = asyncio.run(_upload_all(f"http://127.0.0.1:{server.server_port}/bot", path, concurrency, buffered))
+    server.shutdown()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="فحص ذاكرة الرفع المتدفق")
+    parser.add_argument("--size-mb", type=int, default=DEFAULT_SIZE_MB)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--max-growth-mb", type=float, default=DEFAULT_MAX_GROWTH_MB,
+                        help="أقصى زيادة مسموحة في RSS")
+    parser.add_argument("--buffered", action="store_true", help="رفع الملف كاملاً من الذاكرة (الطريقة القديمة)")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.size_mb, args.concurrency, args.buffered)))
+        return
+
+    mode = "buffered" if args.buffered else "streamed"
+    print(f"⏳ رفع {args.concurrency} × {args.size_mb}MB ({mode})...", file=sys.stderr)
+    command = [sys.executable, os.path.abspath(__file__), "--worker",
+               "--size-mb", str(args.size_mb), "--concurrency", str(args.concurrency)]
+    if args.buffered:
+        command.append("--buffered")
+    proc = subprocess.run(command, capture_output=True, text=True)
+    if proc.returncode != 0:
+        print(proc.stderr[-4000:], file=sys.stderr)
+        sys.exit("❌ فشل تشغيل الفحص")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    print(json.dumps(result, indent=2))
+
+    expected = args.size_mb * 1024 * 1024
+    if any(size < expected for size in result["uploaded_bytes"]):
+        sys.exit("❌ الخادم لم يستلم الملف كاملاً")
+    if result["growth_mb"] > args.max_growth_mb:
+        sys.exit(f"❌ زيادة الذاكرة {result['growth_mb']}MB تتجاوز الحد {args.max_growth_mb}MB")
+    print(f"✅ زيادة الذاكرة {result['growth_mb']}MB ضمن الحد {args.max_growth_mb}MB", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,19 @@
 import os
+import time
 import logging
 
+# قياس زمن كل مرحلة من مراحل بدء التشغيل
+_startup_started = time.perf_counter()
+_startup_last = _startup_started
+_startup_phases = []
+
+def _startup_phase(name):
+    """تسجيل زمن المرحلة المنتهية منذ المرحلة السابقة"""
+    global _startup_last
+    now = time.perf_counter()
+    _startup_phases.append((name, now - _startup_last))
+    _startup_last = now
+
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -13,6 +26,7 @@ from telegram.ext import (
     filters,
     ContextTypes,
 )
+_startup_phase("import telegram")
 
 # استيراد المكونات - مصحح
 from handlers.start import (
@@ -30,7 +44,11 @@ from handlers.referral import referral_callback_handler, show_referral_menu
 from handlers.subscription import show_subscription_menu
 from handlers.video_info import handle_video_message
 from utils import get_message, escape_markdown, get_config, load_config, setup_bot_menu
-from database import init_db, update_user_interaction
+from database import init_db, update_user_interaction, shutdown_db
+import media_cache
+import info_cache
+import ytdlp_runner
+_startup_phase("import handlers")
 
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", 
@@ -42,6 +60,7 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 WEBHOOK_URL = os.getenv("RAILWAY_PUBLIC_DOMAIN")
 PORT = int(os.getenv("PORT", 8443))
 LOG_CHANNEL_ID = os.getenv("LOG_CHANNEL_ID")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "").rstrip("/")
 
 async def forward_to_log_channel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """إعادة توجيه الرسائل إلى قناة اللوج"""
@@ -75,6 +94,32 @@ async def track_user_activity(update: Update, context: ContextTypes.DEFAULT_TYPE
     if update.effective_user:
         update_user_interaction(update.effective_user.id)
 
+def _log_startup_report():
+    """طباعة تقرير زمن بدء التشغيل لكل مرحلة"""
+    total = sum(duration for _, duration in _startup_phases)
+    report = "\n".join(
+        f"   {name:<20} {duration * 1000:8.1f}ms" for name, duration in _startup_phases
+    )
+    logger.info(f"⏱️ زمن بدء التشغيل: {total * 1000:.0f}ms\n{report}")
+
+async def on_startup(application: Application):
+    """بعد الاتصال: إعداد قائمة البوت، تقرير زمن البدء، وتحميل yt-dlp في الخلفية"""
+    try:
+        await setup_bot_menu(application.bot)
+        logger.info("✅ تم إعداد قائمة البوت.")
+    except Exception as e:
+        logger.warning(f"⚠️ فشل إعداد قائمة البوت: {e}")
+    _startup_phase("connect + bot menu")
+    _log_startup_report()
+    ytdlp_runner.warmup_yt_dlp()
+
+async def on_shutdown(application: Application):
+    """حفظ البيانات المعلقة عند الإيقاف"""
+    shutdown_db()
+    media_cache.flush()
+    info_cache.flush()
+    ytdlp_runner.shutdown()
+
 def main():
     """تشغيل البوت"""
     
@@ -87,14 +132,31 @@ def main():
     if not init_db():
         logger.error("❌ فشل الاتصال بقاعدة البيانات!")
         return
+    _startup_phase("database")
     
     # تحميل الإعدادات
     if not load_config():
         logger.error("❌ فشل تحميل ملف الإعدادات!")
         return
+    _startup_phase("config")
     
     # إنشاء التطبيق
-    application = Application.builder().token(BOT_TOKEN).build()
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
+    if TELEGRAM_API_URL:
+        # خادم Bot API ذاتي: رفع حتى 2GB والملفات تُمرَّر كمسارات محلية بدون رفع عبر HTTP
+        logger.info(f"🏠 استخدام خادم Bot API محلي: {TELEGRAM_API_URL}")
+        builder = (
+            builder
+            .base_url(f"{TELEGRAM_API_URL}/bot")
+            .base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+            .local_mode(True)
+        )
+    application = builder.build()
     
     # تسجيل المعالجات
     logger.info("🔧 جاري تسجيل المعالجات...")
@@ -119,7 +181,7 @@ def main():
     application.add_handler(CallbackQueryHandler(show_referral_menu, pattern='^referral_menu$'))
     application.add_handler(CallbackQueryHandler(
         referral_callback_handler,
-        pattern='^(ref_friends_list|ref_achievements)$'
+        pattern='^(ref_friends_list|ref_achievements|ref_leaderboard)$'
     ))
     
     # معالج الاشتراك
@@ -147,14 +209,9 @@ def main():
     application.add_handler(MessageHandler(filters.ALL, track_user_activity), group=1)
     
     logger.info("✅ تم تسجيل جميع المعالجات بنجاح.")
+    _startup_phase("handlers")
     
-    # إعداد قائمة البوت
-    try:
-        import asyncio
-        asyncio.get_event_loop().run_until_complete(setup_bot_menu(application.bot))
-        logger.info("✅ تم إعداد قائمة البوت.")
-    except Exception as e:
-        logger.warning(f"⚠️ فشل إعداد قائمة البوت: {e}")
+    # قائمة البوت تُعد في on_startup داخل حلقة الأحداث الخاصة بالتطبيق
     
     # تشغيل البوت
     if WEBHOOK_URL:
@@ -4,35 +4,438 @@
 """
 import os
 import json
+import asyncio
 import random
 import string
 import logging
+import threading
+import time
+from itertools import count
 from datetime import datetime, timedelta
 
+import db_snapshot
+from sorted_chunks import SortedChunks
+from models import UserRecord, Entitlements
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# نوع التخزين: json (افتراضي) أو sqlite
+DB_BACKEND = os.getenv("DB_BACKEND", "json").lower()
+
 # ملف JSON للتخزين المؤقت
 DB_FILE = "temp_database.json"
 
+# صيغة اللقطة عند الحفظ: json (مقروء) أو binary (انظر db_snapshot.py) - التحميل يتعرف على الصيغة تلقائياً
+DB_SNAPSHOT_FORMAT = os.getenv("DB_SNAPSHOT_FORMAT", "json").lower()
+
+# سجل التغييرات (append-only): كل تعديل يُكتب كسطر صغير بدل إعادة كتابة الملف كاملاً
+DB_JOURNAL_FILE = os.getenv("DB_JOURNAL_FILE", "temp_database.journal")
+DB_JOURNAL_ENABLED = os.getenv("DB_JOURNAL", "1").lower() not in ("0", "false", "no")
+JOURNAL_COMPACT_INTERVAL = int(os.getenv("DB_COMPACT_INTERVAL", 300))
+JOURNAL_COMPACT_MAX_RECORDS = int(os.getenv("DB_COMPACT_MAX_RECORDS", 5000))
+
+# آخر تفاعل يُجمع في الذاكرة ويُحفظ دفعة واحدة كل N ثانية
+ACTIVITY_FLUSH_INTERVAL = int(os.getenv("ACTIVITY_FLUSH_INTERVAL", 30))
+
+# مدة التحقق الدوري من العدادات الإجمالية بإعادة العد الكامل
+COUNTERS_VERIFY_INTERVAL = int(os.getenv("COUNTERS_VERIFY_INTERVAL", 3600))
+
+# ضغط سجل التحميلات القديم (daily_downloads) - انظر models.UserRecord
+HISTORY_COMPACT_INTERVAL = 24 * 3600
+
+# مدة صلاحية حجز التحميل (إن لم يُؤكد أو يُلغَ يُحرر تلقائياً)
+DOWNLOAD_RESERVATION_TTL = int(os.getenv("DOWNLOAD_RESERVATION_TTL", 1800))
+
+# أقل مدة بين عمليتي كتابة على القرص (التعديلات بينهما تُدمج في كتابة واحدة)
+DB_WRITE_INTERVAL = float(os.getenv("DB_WRITE_INTERVAL", 1.0))
+
+# عدد المستخدمين المنسوخين في كل مرة يُحجز فيها القفل أثناء كتابة لقطة كاملة
+SNAPSHOT_BATCH_USERS = 2000
+
+# قفل يحمي البيانات في الذاكرة، وقفل منفصل لعمليات الملفات في خيط الكتابة
+_db_lock = threading.RLock()
+_io_lock = threading.Lock()
+_journal_file = None
+_journal_records = 0
+_compact_event = threading.Event()
+_flush_event = threading.Event()
+
+# طابور الكتابة: المعرفات المعدلة تُدمج، ورقم تسلسلي لمعرفة ما أصبح محفوظاً
+_writer_cond = threading.Condition(_db_lock)
+_writer_thread = None
+_pending_users = set()
+_pending_config = set()
+_write_seq = 0
+_durable_seq = 0
+
+# مستخدمون حُمّلوا بصيغة سجل التحميلات القديمة ويجب إعادة حفظهم
+_legacy_history_users = set()
+
+def _decode_user(user_id_str, data):
+    """فك ترميز مستخدم واحد من JSON"""
+    if 'daily_downloads' in data:
+        _legacy_history_users.add(user_id_str)
+    return UserRecord.from_dict(data)
+
+def _snapshot_db(data):
+    """
+    نسخة مستقلة من البيانات على دفعات قصيرة تحت القفل - الترميز البطيء يتم بعدها خارج القفل
+    كل مستخدم يُنسخ كاملاً؛ تعديل أثناء النسخ يبقى معلقاً ويُكتب في الدورة التالية
+    """
+    with _db_lock:
+        items = list(data['users'].items())
+        config = dict(data['config'])
+    users = {}
+    for start in range(0, len(items), SNAPSHOT_BATCH_USERS):
+        with _db_lock:
+            for uid, user in items[start:start + SNAPSHOT_BATCH_USERS]:
+                users[uid] = user.snapshot()
+    return users, config
+
+def _encode_db(users, config):
+    """ترميز قاعدة البيانات كاملة إلى بايتات بالصيغة المختارة"""
+    if DB_SNAPSHOT_FORMAT == "binary":
+        return db_snapshot.encode(users, config)
+    return json.dumps({"users": users, "config": config}, indent=2, ensure_ascii=False).encode('utf-8')
+
+def _read_journal(path, data):
+    """إعادة تطبيق سجلات ملف سجل واحد على البيانات"""
+    if not os.path.exists(path):
+        return 0
+    
+    applied = 0
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # سطر مقطوع بسبب توقف مفاجئ - نتجاهله
+                logger.warning(f"⚠️ سطر تالف في السجل {path}:{line_no} - تم تجاهله")
+                continue
+            
+            op = record.get('op')
+            if op == 'user':
+                data['users'][record['id']] = _decode_user(record['id'], record['data'])
+            elif op == 'config':
+                data['config'][record['key']] = record['value']
+            applied += 1
+    return applied
+
 def load_db():
-    """تحميل قاعدة البيانات من الملف"""
+    """تحميل قاعدة البيانات من الملف ثم إعادة تطبيق السجل"""
+    data = {"users": {}, "config": {}}
     if os.path.exists(DB_FILE):
-        with open(DB_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {"users": {}, "config": {}}
+        with open(DB_FILE, 'rb') as f:
+            raw = f.read()
+        with db_snapshot.paused_gc():
+            loaded = db_snapshot.decode(raw) if db_snapshot.is_snapshot(raw) else json.loads(raw)
+            data['config'] = loaded.get('config', {})
+            data['users'] = {uid: _decode_user(uid, u) for uid, u in loaded.get('users', {}).items()}
+    
+    # السجلات كلها حالة كاملة للمستخدم، لذلك إعادة تطبيقها فوق لقطة أحدث آمنة
+    replayed = _read_journal(DB_JOURNAL_FILE + ".compacting", data)
+    replayed += _read_journal(DB_JOURNAL_FILE, data)
+    if replayed:
+        logger.info(f"📜 تم تطبيق {replayed} سجل من ملف السجل")
+    return data
+
+def _write_snapshot(raw):
+    """كتابة اللقطة بشكل ذري (ملف مؤقت ثم استبدال)"""
+    tmp_path = DB_FILE + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(raw)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, DB_FILE)
 
 def save_db(data):
     """حفظ قاعدة البيانات في الملف"""
-    with open(DB_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False, default=str)
+    _write_snapshot(_encode_db(*_snapshot_db(data)))
 
-db = load_db()
+# البيانات تُحمّل في init_db وليس عند الاستيراد
+db = {"users": {}, "config": {}}
+_db_loaded = False
 
-def init_db():
-    """تهيئة قاعدة البيانات"""
+# فهارس ثانوية في الذاكرة: كود الإحالة / اليوزر نيم (بأحرف صغيرة) -> معرف المستخدم
+_referral_index = {}
+_username_index = {}
+
+def _index_user(user_id_str, user):
+    """إضافة مستخدم إلى الفهارس الثانوية"""
+    if user.referral_code:
+        _referral_index[user.referral_code] = user_id_str
+    if user.username:
+        # أول مستخدم يحجز اليوزر نيم - نفس نتيجة البحث الخطي السابق
+        _username_index.setdefault(user.username.lower(), user_id_str)
+
+def compact_download_history():
+    """إعادة حفظ المستخدمين الذين حُوّل سجل تحميلاتهم القديم عند التحميل (مرة واحدة)"""
+    with _db_lock:
+        compacted = [uid for uid in _legacy_history_users if uid in db['users']]
+        _legacy_history_users.clear()
+    if compacted:
+        _persist_users(*compacted)
+        logger.info(f"🗜️ تم ضغط سجل التحميلات لـ {len(compacted)} مستخدم")
+    return len(compacted)
+
+def _rebuild_indexes():
+    """إعادة بناء الفهارس من البيانات المحملة"""
+    with _db_lock:
+        _referral_index.clear()
+        _username_index.clear()
+        for user_id_str, user in db['users'].items():
+            _index_user(user_id_str, user)
+
+# عدادات إجمالية تُحدّث مع كل تعديل - إحصائيات الأدمن بدون المرور على كل المستخدمين
+_counters = {}
+
+def _count_users(users):
+    """إعادة عد كاملة للعدادات من بيانات المستخدمين"""
+    counters = {
+        "total": 0,
+        "vip": 0,
+        "lifetime_vip": 0,
+        "downloads": 0,
+        "successful_referrals": 0,
+        "bonus_downloads": 0,
+    }
+    for u in users:
+        counters["total"] += 1
+        if u.subscription_end:
+            counters["vip"] += 1
+        if u.is_lifetime_vip:
+            counters["lifetime_vip"] += 1
+        counters["downloads"] += u.download_count
+        counters["successful_referrals"] += u.successful_referrals
+        counters["bonus_downloads"] += u.bonus_downloads
+    return counters
+
+def _rebuild_counters():
+    """بناء العدادات من البيانات المحملة"""
+    with _db_lock:
+        _counters.clear()
+        _counters.update(_count_users(db['users'].values()))
+
+# لوحة المتصدرين: (-الإحالات الناجحة، معرف المستخدم) مرتبة لمن لديه إحالة ناجحة
+# أجزاء مرتبة بدل list واحدة: كل إحالة تزيح جزءاً صغيراً فقط وليس اللوحة كلها
+_leaderboard = SortedChunks()
+
+def _leaderboard_update(user_id: int, old: int, new: int):
+    """تحديث موقع مستخدم في لوحة المتصدرين (بحث ثنائي)"""
+    if old > 0:
+        _leaderboard.discard((-old, user_id))
+    if new > 0:
+        _leaderboard.add((-new, user_id))
+
+def _rebuild_leaderboard():
+    """بناء لوحة المتصدرين من البيانات المحملة"""
+    with _db_lock:
+        _leaderboard.reset(
+            (-u.successful_referrals, int(uid))
+            for uid, u in db['users'].items() if u.successful_referrals > 0
+        )
+
+def verify_counters():
+    """مقارنة العدادات بإعادة عد كاملة وتصحيحها عند الاختلاف"""
+    with _db_lock:
+        actual = _count_users(db['users'].values())
+        mismatched = {k: (_counters.get(k), v) for k, v in actual.items() if _counters.get(k) != v}
+        if mismatched:
+            logger.warning(f"⚠️ تصحيح العدادات: {mismatched}")
+            _counters.update(actual)
+    return not mismatched
+
+def _collect_records(user_ids, config_keys):
+    """نسخ المستخدمين/الإعدادات المعدلة كسجلات (يُستدعى تحت القفل)"""
+    records = [
+        {"op": "user", "id": uid, "data": db['users'][uid].snapshot()}
+        for uid in user_ids if uid in db['users']
+    ]
+    records += [
+        {"op": "config", "key": key, "value": db['config'].get(key)}
+        for key in config_keys
+    ]
+    return records
+
+def _serialize_records(records):
+    """تحويل السجلات إلى أسطر سجل (خارج القفل)"""
+    text = ''.join(
+        json.dumps(r, ensure_ascii=False, separators=(',', ':')) + '\n'
+        for r in records
+    )
+    return text, len(records)
+
+def _append_journal(text, count):
+    """إضافة سجلات إلى نهاية ملف السجل - التكلفة بحجم التغيير فقط"""
+    global _journal_file, _journal_records
+    if _journal_file is None:
+        _journal_file = open(DB_JOURNAL_FILE, 'a', encoding='utf-8')
+    _journal_file.write(text)
+    _journal_file.flush()
+    _journal_records += count
+    if _journal_records >= JOURNAL_COMPACT_MAX_RECORDS:
+        _compact_event.set()
+
+def _mark_dirty(user_ids=(), config_keys=()):
+    """تسجيل تعديل في الذاكرة - الكتابة الفعلية تتم في خيط الكتابة"""
+    global _write_seq
+    with _writer_cond:
+        _pending_users.update(user_ids)
+        _pending_config.update(config_keys)
+        _write_seq += 1
+        _writer_cond.notify()
+
+def _persist_users(*user_ids):
+    """حفظ تغييرات مستخدمين محددين"""
+    _mark_dirty(user_ids=user_ids)
+
+def _persist_config(key):
+    """حفظ قيمة إعداد واحدة"""
+    _mark_dirty(config_keys=(key,))
+
+def _write_pending():
+    """كتابة كل التعديلات المعلقة دفعة واحدة (سجل أو لقطة كاملة)"""
+    global _pending_users, _pending_config, _durable_seq
+    with _io_lock:
+        with _writer_cond:
+            _flush_event.clear()
+            target = _write_seq
+            if target == _durable_seq:
+                return
+            users, configs = _pending_users, _pending_config
+            _pending_users, _pending_config = set(), set()
+            if DB_JOURNAL_ENABLED:
+                records = _collect_records(users, configs)
+        
+        # الترميز والكتابة بعد تحرير القفل حتى لا تنتظر المعالجات
+        try:
+            if DB_JOURNAL_ENABLED:
+                _append_journal(*_serialize_records(records))
+            else:
+                _write_snapshot(_encode_db(*_snapshot_db(db)))
+        except Exception:
+            # إعادة التعديلات للمحاولة التالية
+            with _writer_cond:
+                _pending_users.update(users)
+                _pending_config.update(configs)
+            raise
+    
+    with _writer_cond:
+        _durable_seq = max(_durable_seq, target)
+        _writer_cond.notify_all()
+
+def compact_db():
+    """دمج السجل في لقطة جديدة ثم تفريغه"""
+    global _journal_file, _journal_records
+    rotated = DB_JOURNAL_FILE + ".compacting"
+    with _io_lock:
+        with _db_lock:
+            if _journal_records == 0 and not os.path.exists(DB_JOURNAL_FILE):
+                return False
+        raw = _encode_db(*_snapshot_db(db))
+        # تدوير السجل: التعديلات الجديدة تذهب لملف جديد بعد كتابة اللقطة
+        if _journal_file is not None:
+            _journal_file.close()
+            _journal_file = None
+        if os.path.exists(DB_JOURNAL_FILE):
+            os.replace(DB_JOURNAL_FILE, rotated)
+        compacted = _journal_records
+        _journal_records = 0
+        
+        _write_snapshot(raw)
+        if os.path.exists(rotated):
+            os.remove(rotated)
+    logger.info(f"🗜️ تم دمج {compacted} سجل في اللقطة")
+    return True
+
+def _writer_loop():
+    """خيط الكتابة: يجمع التعديلات ويكتبها بمعدل محدود، ويدمج السجل دورياً"""
+    last_write = 0.0
+    next_compact = time.monotonic() + JOURNAL_COMPACT_INTERVAL
+    while True:
+        with _writer_cond:
+            while _write_seq == _durable_seq and not _compact_event.is_set():
+                timeout = next_compact - time.monotonic()
+                if timeout <= 0:
+                    break
+                _writer_cond.wait(timeout)
+        
+        # حد أقصى لمعدل الكتابة - إلا إذا طلب أحدهم الحفظ الفوري
+        delay = last_write + DB_WRITE_INTERVAL - time.monotonic()
+        if delay > 0:
+            _flush_event.wait(delay)
+        
+        try:
+            _write_pending()
+            last_write = time.monotonic()
+            if _compact_event.is_set() or time.monotonic() >= next_compact:
+                _compact_event.clear()
+                next_compact = time.monotonic() + JOURNAL_COMPACT_INTERVAL
+                if DB_JOURNAL_ENABLED:
+                    compact_db()
+        except Exception as e:
+            logger.error(f"❌ خطأ في كتابة قاعدة البيانات: {e}")
+            time.sleep(1)
+
+def _start_writer():
+    """تشغيل خيط الكتابة مرة واحدة"""
+    global _writer_thread
+    if _writer_thread is not None:
+        return
+    _writer_thread = threading.Thread(target=_writer_loop, name="db-writer", daemon=True)
+    _writer_thread.start()
+
+def flush_db(timeout: float = None):
+    """انتظار حتى تُكتب كل التعديلات الحالية على القرص"""
+    with _writer_cond:
+        target = _write_seq
+        if _durable_seq >= target:
+            return True
+    
+    if _writer_thread is None:
+        _write_pending()
+        return True
+    
+    _flush_event.set()
+    with _writer_cond:
+        _writer_cond.notify()
+        return _writer_cond.wait_for(lambda: _durable_seq >= target, timeout)
+
+def close_db():
+    """إغلاق قاعدة البيانات: حفظ المعلق ودمج السجل قبل الإيقاف"""
+    global _journal_file
     try:
-        logger.info("✅ قاعدة البيانات المؤقتة جاهزة (JSON)")
+        flush_db(timeout=30)
+        if DB_JOURNAL_ENABLED:
+            compact_db()
+    except Exception as e:
+        logger.error(f"❌ خطأ في الحفظ النهائي: {e}")
+    with _io_lock:
+        if _journal_file is not None:
+            _journal_file.close()
+            _journal_file = None
+
+def _init_json_db():
+    """تحميل ملف JSON وسجل التغييرات وبناء الفهارس والعدادات (مرة واحدة)"""
+    global _db_loaded
+    try:
+        with _db_lock:
+            if not _db_loaded:
+                loaded = load_db()
+                db['users'] = loaded['users']
+                db['config'] = loaded['config']
+                _rebuild_indexes()
+                _rebuild_counters()
+                _rebuild_leaderboard()
+                _db_loaded = True
+        _start_writer()
+        compact_download_history()
+        mode = "JSON + سجل تغييرات" if DB_JOURNAL_ENABLED else "JSON"
+        logger.info(f"✅ قاعدة البيانات المؤقتة جاهزة ({mode})")
         return True
     except Exception as e:
         logger.error(f"❌ خطأ: {e}")
@@ -42,37 +445,31 @@ def generate_referral_code():
     """توليد كود إحالة فريد"""
     while True:
         code = 'REF' + ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
-        if code not in [u.get('referral_code') for u in db['users'].values()]:
+        if code not in _referral_index:
             return code
 
 def add_user(user_id: int, username: str, full_name: str):
     """إضافة مستخدم جديد"""
     try:
         user_id_str = str(user_id)
-        if user_id_str in db['users']:
-            return True
-        
-        referral_code = generate_referral_code()
-        
-        db['users'][user_id_str] = {
-            "user_id": user_id,
-            "username": username,
-            "full_name": full_name,
-            "referral_code": referral_code,
-            "language": "ar",
-            "registration_date": datetime.now().isoformat(),
-            "download_count": 0,
-            "daily_downloads": {},
-            "subscription_end": None,
-            "is_lifetime_vip": False,
-            "referred_by": None,
-            "referrals": [],
-            "successful_referrals": 0,
-            "bonus_downloads": 50,
-            "achievements": {}
-        }
+        with _db_lock:
+            if user_id_str in db['users']:
+                return True
+            
+            referral_code = generate_referral_code()
+            
+            db['users'][user_id_str] = UserRecord(
+                user_id=user_id,
+                username=username,
+                full_name=full_name,
+                referral_code=referral_code,
+                registration_date=datetime.now(),
+            )
+            _index_user(user_id_str, db['users'][user_id_str])
+            _counters["total"] += 1
+            _counters["bonus_downloads"] += 50
         
-        save_db(db)
+        _persist_users(user_id_str)
         logger.info(f"✅ تم إضافة المستخدم: {user_id}")
         return True
     except Exception as e:
@@ -81,12 +478,7 @@ def add_user(user_id: int, username: str, full_name: str):
 
 def get_user(user_id: int):
     """الحصول على بيانات المستخدم"""
-    user = db['users'].get(str(user_id))
-    if user and 'registration_date' in user and isinstance(user['registration_date'], str):
-        user['registration_date'] = datetime.fromisoformat(user['registration_date'])
-    if user and 'subscription_end' in user and isinstance(user['subscription_end'], str):
-        user['subscription_end'] = datetime.fromisoformat(user['subscription_end'])
-    return user
+    return db['users'].get(str(user_id))
 
 def get_all_users():
     """الحصول على جميع المستخدمين"""
@@ -96,9 +488,11 @@ def update_user_language(user_id: int, language: str):
     """تحديث لغة المستخدم"""
     try:
         user_id_str = str(user_id)
-        if user_id_str in db['users']:
-            db['users'][user_id_str]['language'] = language
-            save_db(db)
+        with _db_lock:
+            if user_id_str not in db['users']:
+                return True
+            db['users'][user_id_str].language = language
+        _persist_users(user_id_str)
         return True
     except Exception as e:
         logger.error(f"❌ خطأ: {e}")
@@ -107,28 +501,25 @@ def update_user_language(user_id: int, language: str):
 def get_user_language(user_id: int):
     """الحصول على لغة المستخدم"""
     user = get_user(user_id)
-    return user.get('language', 'ar') if user else 'ar'
+    return user.language if user else 'ar'
 
 def register_referral(user_id: int, referral_code: str):
     """تسجيل إحالة جديدة"""
     try:
-        referrer = None
-        for u in db['users'].values():
-            if u.get('referral_code') == referral_code:
-                referrer = u
-                break
-        
-        if not referrer:
-            return False, "كود إحالة غير صحيح"
-        
-        referrer_id = referrer['user_id']
-        
-        if referrer_id == user_id:
-            return False, "لا يمكنك استخدام كود الإحالة الخاص بك"
-        
-        db['users'][str(user_id)]['referred_by'] = referrer_id
-        db['users'][str(referrer_id)]['referrals'].append(user_id)
-        save_db(db)
+        with _db_lock:
+            referrer = db['users'].get(_referral_index.get(referral_code))
+            
+            if not referrer:
+                return False, "كود إحالة غير صحيح"
+            
+            referrer_id = referrer.user_id
+            
+            if referrer_id == user_id:
+                return False, "لا يمكنك استخدام كود الإحالة الخاص بك"
+            
+            db['users'][str(user_id)].referred_by = referrer_id
+            referrer.referrals.append(user_id)
+        _persist_users(str(user_id), str(referrer_id))
         
         return True, "تم تسجيل الإحالة بنجاح"
     except Exception as e:
@@ -139,22 +530,32 @@ def increment_download_count(user_id: int):
     """زيادة عداد التحميل"""
     try:
         user_id_str = str(user_id)
-        today = datetime.now().strftime('%Y-%m-%d')
+        today = datetime.now().date()
         
-        if user_id_str in db['users']:
-            db['users'][user_id_str]['download_count'] += 1
-            
-            if today not in db['users'][user_id_str]['daily_downloads']:
-                db['users'][user_id_str]['daily_downloads'][today] = 0
-            db['users'][user_id_str]['daily_downloads'][today] += 1
-            
-            if db['users'][user_id_str]['download_count'] == 10:
-                referred_by = db['users'][user_id_str].get('referred_by')
-                if referred_by and str(referred_by) in db['users']:
-                    db['users'][str(referred_by)]['bonus_downloads'] += 10
-                    db['users'][str(referred_by)]['successful_referrals'] += 1
-            
-            save_db(db)
+        changed = []
+        
+        with _db_lock:
+            user = db['users'].get(user_id_str)
+            if user:
+                user.download_count += 1
+                _counters["downloads"] += 1
+                
+                user.record_download(today)
+                changed.append(user_id_str)
+                
+                if user.download_count == 10:
+                    referrer = db['users'].get(str(user.referred_by)) if user.referred_by else None
+                    if referrer:
+                        referrer.bonus_downloads += 10
+                        referrer.successful_referrals += 1
+                        referrals = referrer.successful_referrals
+                        _leaderboard_update(referrer.user_id, referrals - 1, referrals)
+                        _counters["bonus_downloads"] += 10
+                        _counters["successful_referrals"] += 1
+                        changed.append(str(referrer.user_id))
+        
+        if changed:
+            _persist_users(*changed)
         
         return True
     except Exception as e:
@@ -167,23 +568,25 @@ def get_daily_download_count(user_id: int):
     if not user:
         return 0
     
-    today = datetime.now().strftime('%Y-%m-%d')
-    return user.get('daily_downloads', {}).get(today, 0)
+    return user.downloads_on(datetime.now().date())
 
 def get_bonus_downloads(user_id: int):
     """الحصول على التحميلات الإضافية"""
     user = get_user(user_id)
-    return user.get('bonus_downloads', 0) if user else 0
+    return user.bonus_downloads if user else 0
 
 def use_bonus_download(user_id: int):
     """استخدام تحميل من الرصيد الاحتياطي"""
     try:
         user_id_str = str(user_id)
-        if user_id_str in db['users'] and db['users'][user_id_str].get('bonus_downloads', 0) > 0:
-            db['users'][user_id_str]['bonus_downloads'] -= 1
-            save_db(db)
-            return True
-        return False
+        with _db_lock:
+            user = db['users'].get(user_id_str)
+            if not user or user.bonus_downloads <= 0:
+                return False
+            user.bonus_downloads -= 1
+            _counters["bonus_downloads"] -= 1
+        _persist_users(user_id_str)
+        return True
     except Exception as e:
         logger.error(f"❌ خطأ: {e}")
         return False
@@ -191,37 +594,28 @@ def use_bonus_download(user_id: int):
 def is_subscribed(user_id: int):
     """التحقق من اشتراك VIP"""
     user = get_user(user_id)
-    if not user:
-        return False
-    
-    if user.get('is_lifetime_vip'):
-        return True
-    
-    subscription_end = user.get('subscription_end')
-    if subscription_end and subscription_end > datetime.now():
-        return True
-    
-    return False
+    return bool(user) and user.has_active_subscription()
 
 def add_subscription(user_id: int, days: int):
     """إضافة اشتراك VIP"""
     try:
         user_id_str = str(user_id)
-        if user_id_str not in db['users']:
-            return False
-        
-        current_end = db['users'][user_id_str].get('subscription_end')
-        
-        if current_end and isinstance(current_end, str):
-            current_end = datetime.fromisoformat(current_end)
-        
-        if current_end and current_end > datetime.now():
-            new_end = current_end + timedelta(days=days)
-        else:
-            new_end = datetime.now() + timedelta(days=days)
-        
-        db['users'][user_id_str]['subscription_end'] = new_end.isoformat()
-        save_db(db)
+        with _db_lock:
+            user = db['users'].get(user_id_str)
+            if not user:
+                return False
+            
+            current_end = user.subscription_end
+            
+            if current_end and current_end > datetime.now():
+                new_end = current_end + timedelta(days=days)
+            else:
+                new_end = datetime.now() + timedelta(days=days)
+            
+            if not current_end:
+                _counters["vip"] += 1
+            user.subscription_end = new_end
+        _persist_users(user_id_str)
         
         return True
     except Exception as e:
@@ -232,9 +626,14 @@ def set_lifetime_vip(user_id: int):
     """تعيين VIP مدى الحياة"""
     try:
         user_id_str = str(user_id)
-        if user_id_str in db['users']:
-            db['users'][user_id_str]['is_lifetime_vip'] = True
-            save_db(db)
+        with _db_lock:
+            user = db['users'].get(user_id_str)
+            if not user:
+                return True
+            if not user.is_lifetime_vip:
+                _counters["lifetime_vip"] += 1
+            user.is_lifetime_vip = True
+        _persist_users(user_id_str)
         return True
     except Exception as e:
         logger.error(f"❌ خطأ: {e}")
@@ -247,14 +646,13 @@ def is_admin(user_id: int):
 
 def get_total_downloads_count():
     """إجمالي التحميلات"""
-    total = sum(u.get('download_count', 0) for u in db['users'].values())
-    return total
+    return _counters["downloads"]
 
 def get_users_count():
     """عدد المستخدمين"""
-    total = len(db['users'])
-    vip = sum(1 for u in db['users'].values() if u.get('subscription_end'))
-    lifetime_vip = sum(1 for u in db['users'].values() if u.get('is_lifetime_vip'))
+    total = _counters["total"]
+    vip = _counters["vip"]
+    lifetime_vip = _counters["lifetime_vip"]
     free = total - vip - lifetime_vip
     
     return {
@@ -266,21 +664,30 @@ def get_users_count():
 
 def get_referral_statistics():
     """إحصائيات الإحالات"""
-    total_successful_referrals = sum(u.get('successful_referrals', 0) for u in db['users'].values())
-    total_bonus_downloads = sum(u.get('bonus_downloads', 0) for u in db['users'].values())
-    lifetime_vip_count = sum(1 for u in db['users'].values() if u.get('is_lifetime_vip'))
-    
     return {
-        'total_successful_referrals': total_successful_referrals,
-        'total_bonus_downloads': total_bonus_downloads,
-        'lifetime_vip_count': lifetime_vip_count
+        'total_successful_referrals': _counters["successful_referrals"],
+        'total_bonus_downloads': _counters["bonus_downloads"],
+        'lifetime_vip_count': _counters["lifetime_vip"]
     }
 
 def get_top_referrers(limit: int = 20):
     """أكثر المحيلين"""
-    users = [u for u in db['users'].values() if u.get('successful_referrals', 0) > 0]
-    users.sort(key=lambda x: x.get('successful_referrals', 0), reverse=True)
-    return users[:limit]
+    with _db_lock:
+        return [db['users'][str(uid)] for _, uid in _leaderboard.head(limit)]
+
+def get_referrer_rank(user_id: int):
+    """ترتيب المستخدم بين المحيلين (1 = الأول) أو None إن لم تكن لديه إحالات ناجحة"""
+    user = db['users'].get(str(user_id))
+    referrals = user.successful_referrals if user else 0
+    if referrals <= 0:
+        return None
+    with _db_lock:
+        # عدد من لديهم إحالات أكثر + 1
+        return _leaderboard.bisect_left((-referrals,)) + 1
+
+def get_referrers_count():
+    """عدد المستخدمين الذين لديهم إحالة ناجحة واحدة على الأقل"""
+    return len(_leaderboard)
 
 def is_logo_enabled():
     """حالة اللوجو"""
@@ -289,35 +696,233 @@ def is_logo_enabled():
 def set_logo_status(enabled: bool):
     """تفعيل/تعطيل اللوجو"""
     try:
-        db['config']['logo_enabled'] = enabled
-        save_db(db)
+        with _db_lock:
+            db['config']['logo_enabled'] = enabled
+        _persist_config('logo_enabled')
         return True
     except Exception as e:
         logger.error(f"❌ خطأ: {e}")
         return False
 
-def update_user_interaction(user_id: int):
-    """تحديث آخر تفاعل"""
+def save_user_interactions(interactions: dict):
+    """حفظ آخر تفاعل لمجموعة مستخدمين دفعة واحدة"""
     try:
-        user_id_str = str(user_id)
-        if user_id_str in db['users']:
-            db['users'][user_id_str]['last_interaction'] = datetime.now().isoformat()
-            save_db(db)
+        changed = []
+        with _db_lock:
+            for user_id, timestamp in interactions.items():
+                user_id_str = str(user_id)
+                if user_id_str in db['users']:
+                    db['users'][user_id_str].last_interaction = timestamp
+                    changed.append(user_id_str)
+        if changed:
+            _persist_users(*changed)
+        return True
     except Exception as e:
         logger.error(f"❌ خطأ: {e}")
+        return False
+
+# ============ تتبع النشاط (مشترك بين أنواع التخزين) ============
+
+_activity_buffer = {}
+_activity_lock = threading.Lock()
+_maintenance_thread = None
+
+def update_user_interaction(user_id: int):
+    """تحديث آخر تفاعل (في الذاكرة فقط - يُحفظ لاحقاً دفعة واحدة)"""
+    with _activity_lock:
+        _activity_buffer[user_id] = datetime.now()
+
+def get_activity_buffer_size():
+    """عدد التفاعلات المنتظرة للحفظ"""
+    return len(_activity_buffer)
+
+def flush_user_interactions():
+    """حفظ كل التفاعلات المجمّعة بعملية كتابة واحدة"""
+    global _activity_buffer
+    with _activity_lock:
+        if not _activity_buffer:
+            return 0
+        batch = _activity_buffer
+        _activity_buffer = {}
+    
+    if not save_user_interactions(batch):
+        # إعادة الدفعة للمحاولة التالية دون الكتابة فوق تفاعلات أحدث
+        with _activity_lock:
+            for user_id, timestamp in batch.items():
+                _activity_buffer.setdefault(user_id, timestamp)
+        return 0
+    return len(batch)
+
+def _maintenance_loop():
+    """خيط الصيانة الدوري: حفظ التفاعلات، التحقق من العدادات، وضغط سجل التحميلات"""
+    next_verify = time.monotonic() + COUNTERS_VERIFY_INTERVAL
+    next_history_compact = time.monotonic()
+    while True:
+        time.sleep(ACTIVITY_FLUSH_INTERVAL)
+        try:
+            flush_user_interactions()
+        except Exception as e:
+            logger.error(f"❌ خطأ في حفظ التفاعلات: {e}")
+        
+        if time.monotonic() >= next_verify:
+            next_verify = time.monotonic() + COUNTERS_VERIFY_INTERVAL
+            try:
+                verify_counters()
+            except Exception as e:
+                logger.error(f"❌ خطأ في التحقق من العدادات: {e}")
+        
+        if time.monotonic() >= next_history_compact:
+            next_history_compact = time.monotonic() + HISTORY_COMPACT_INTERVAL
+            try:
+                compact_download_history()
+            except Exception as e:
+                logger.error(f"❌ خطأ في ضغط سجل التحميلات: {e}")
+
+def _start_maintenance():
+    """تشغيل خيط الصيانة مرة واحدة"""
+    global _maintenance_thread
+    if _maintenance_thread is not None:
+        return
+    _maintenance_thread = threading.Thread(target=_maintenance_loop, name="db-maintenance", daemon=True)
+    _maintenance_thread.start()
+
+async def wait_until_durable(timeout: float = None):
+    """انتظار (دون حجب الحلقة) حتى تصل التعديلات الحالية إلى القرص"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, flush_db, timeout)
+
+def shutdown_db():
+    """حفظ التفاعلات المعلقة وإغلاق قاعدة البيانات عند إيقاف البوت"""
+    flushed = flush_user_interactions()
+    if flushed:
+        logger.info(f"💾 تم حفظ {flushed} تفاعل قبل الإيقاف")
+    close_db()
+
+def get_entitlements(user_id: int):
+    """حساب اللغة وحالة VIP/الأدمن والاستخدام اليومي والرصيد الإضافي بقراءة واحدة"""
+    user = get_user(user_id)
+    if not user:
+        return Entitlements(user_id=user_id, exists=False, is_admin=is_admin(user_id))
+    now = datetime.now()
+    return Entitlements(
+        user_id=user_id,
+        exists=True,
+        language=user.language or 'ar',
+        is_admin=is_admin(user_id),
+        is_vip=user.has_active_subscription(now),
+        daily_downloads=user.downloads_on(now.date()),
+        bonus_downloads=user.bonus_downloads,
+    )
+
+def get_update_entitlements(update, context):
+    """لقطة الصلاحيات للتحديث الحالي - تُحسب مرة واحدة وتُحفظ في context.user_data"""
+    cached = context.user_data.get('_entitlements')
+    if cached and cached[0] == update.update_id:
+        return cached[1]
+    entitlements = get_entitlements(update.effective_user.id)
+    context.user_data['_entitlements'] = (update.update_id, entitlements)
+    return entitlements
+
+# ============ حجز حصة التحميل (مشترك بين أنواع التخزين) ============
+
+# معرف الحجز -> (معرف المستخدم، النوع: daily/bonus/unlimited، وقت الانتهاء)
+_reservations = {}
+_reservation_lock = threading.Lock()
+_reservation_ids = count(1)
+
+def _expire_reservations(now):
+    """حذف الحجوزات المنتهية (يُستدعى تحت القفل)"""
+    for reservation_id in [r for r, (_, _, expires) in _reservations.items() if expires <= now]:
+        del _reservations[reservation_id]
+
+def _held_reservations(user_id, kind):
+    return sum(1 for uid, k, _ in _reservations.values() if uid == user_id and k == kind)
+
+def reserve_download(user_id: int, daily_limit: int, allow_bonus: bool = False):
+    """حجز تحميل من الحصة اليومية أو الرصيد الإضافي بخطوة واحدة - يعيد معرف الحجز أو None"""
+    with _reservation_lock:
+        now = time.monotonic()
+        _expire_reservations(now)
+        entitlements = get_entitlements(user_id)
+        if not entitlements.exists:
+            return None
+        
+        if entitlements.is_unlimited:
+            kind = "unlimited"
+        elif entitlements.daily_downloads + _held_reservations(user_id, "daily") < daily_limit:
+            kind = "daily"
+        elif allow_bonus and entitlements.bonus_downloads - _held_reservations(user_id, "bonus") > 0:
+            kind = "bonus"
+        else:
+            return None
+        
+        reservation_id = next(_reservation_ids)
+        _reservations[reservation_id] = (user_id, kind, now + DOWNLOAD_RESERVATION_TTL)
+        return reservation_id
+
+def get_reservation_kind(reservation_id):
+    """نوع الحجز (daily/bonus/unlimited) أو None إن لم يعد موجوداً"""
+    reservation = _reservations.get(reservation_id)
+    return reservation[1] if reservation else None
+
+def commit_download(reservation_id):
+    """
+    تأكيد الحجز بعد نجاح التحميل: احتساب التحميل وخصم الرصيد الإضافي إن لزم
+    يعيد None إن لم يعد الحجز موجوداً (انتهت صلاحيته)، وFalse إن فشل التحديث دون احتساب
+    """
+    with _reservation_lock:
+        reservation = _reservations.get(reservation_id)
+        if not reservation:
+            return None
+        user_id, kind, _ = reservation
+        ok = True
+        if kind == "bonus" and not use_bonus_download(user_id):
+            # لا رصيد يُخصم - لا يُحتسب التحميل حتى لا يُخصم من الحصة مرتين
+            logger.warning(f"⚠️ تعذر خصم الرصيد الإضافي للمستخدم {user_id}")
+            ok = False
+        elif kind != "unlimited":
+            ok = increment_download_count(user_id)
+        # الحذف بعد تحديث التخزين حتى لا تظهر الحصة فارغة لحجز متزامن
+        del _reservations[reservation_id]
+        return ok
+
+def release_download(reservation_id):
+    """إلغاء الحجز دون احتساب (فشل التحليل/التحميل أو رفض الطلب)"""
+    if reservation_id is None:
+        return False
+    with _reservation_lock:
+        return _reservations.pop(reservation_id, None) is not None
 
 def get_user_by_referral_code(referral_code: str):
     """الحصول على المستخدم من كود الإحالة"""
-    for user in db['users'].values():
-        if user.get('referral_code') == referral_code:
-            return user
-    return None
+    user_id_str = _referral_index.get(referral_code)
+    return get_user(user_id_str) if user_id_str else None
+
+def get_user_by_username(username: str):
+    """الحصول على المستخدم من اليوزر نيم (بدون حساسية لحالة الأحرف)"""
+    user_id_str = _username_index.get(username.lstrip('@').lower())
+    return get_user(user_id_str) if user_id_str else None
 
 def check_referral_achievements(user_id: int):
     """التحقق من إنجازات الإحالة"""
     # وظيفة بسيطة للنسخة المؤقتة
     pass
 
-# تهيئة عند الاستيراد
-init_db()
-logger.info("⚠️ تستخدم قاعدة بيانات JSON مؤقتة - ليست للإنتاج!")
\ No newline at end of file
+# اختيار التخزين: دوال SQLite أو MongoDB تحل محل دوال JSON بنفس الأسماء
+if DB_BACKEND == "sqlite":
+    from database_sqlite import *  # noqa: F401,F403
+    from database_sqlite import init_db as _init_backend
+elif DB_BACKEND == "mongo":
+    from database_mongo_sync import *  # noqa: F401,F403
+    from database_mongo_sync import init_db as _init_backend
+else:
+    _init_backend = _init_json_db
+
+def init_db():
+    """تهيئة قاعدة البيانات المختارة وتشغيل خيط الصيانة - يُستدعى من bot.main وليس عند الاستيراد"""
+    if not _init_backend():
+        return False
+    _start_maintenance()
+    if DB_BACKEND == "json":
+        logger.info("⚠️ تستخدم قاعدة بيانات JSON مؤقتة - ليست للإنتاج!")
+    return True
\ No newline at end of file
@@ -0,0 +1,648 @@
+"""
+قاعدة بيانات MongoDB غير متزامنة (asyncio) بنفس واجهة database.py
+كل الدوال awaitable وتستخدم AsyncMongoClient من pymongo فلا تحجب حلقة الأحداث
+
+الاستخدام داخل البوت: DB_BACKEND=mongo - database_mongo_sync.py يشغّل هذه الدوال
+في حلقة أحداث خاصة ويعرضها بنفس الواجهة المتزامنة لـ database_sqlite.py
+
+الاستخدام المباشر من كود غير متزامن (الاتصال يُنشأ في نفس حلقة الأحداث):
+    import database_mongo as mdb
+    await mdb.init_db()
+
+الاختبار بدون خادم: تمرير عميل وهمي متوافق (مثل mongomock_motor.AsyncMongoMockClient)
+    await mdb.init_db(client=AsyncMongoMockClient())
+أو MONGODB_URI=mongomock:// إن كانت الحزمة مثبتة
+فحص كامل على العميل الوهمي: python benchmarks/check_database_mongo.py
+
+الترحيل من ملف JSON:
+    python database_mongo.py migrate [temp_database.json]
+"""
+import os
+import sys
+import asyncio
+import time
+import random
+import string
+import logging
+from itertools import count
+from datetime import datetime, timedelta
+
+from pymongo import AsyncMongoClient, ReturnDocument, UpdateOne, ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from models import UserRecord, Entitlements, DAILY_HISTORY_DAYS, DEFAULT_BONUS_DOWNLOADS, parse_datetime
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
+MONGODB_DB_NAME = os.getenv("MONGODB_DB_NAME", "video_bot")
+
+# إعدادات مجمع الاتصالات
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", 50))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", 5))
+MONGODB_MAX_IDLE_MS = int(os.getenv("MONGODB_MAX_IDLE_MS", 60000))
+MONGODB_TIMEOUT_MS = int(os.getenv("MONGODB_TIMEOUT_MS", 5000))
+
+# محاولات إضافة المستخدم عند تصادم كود الإحالة مع إضافة متزامنة
+REFERRAL_CODE_RETRIES = 5
+
+# مدة صلاحية حجز التحميل (نفس database.py)
+DOWNLOAD_RESERVATION_TTL = int(os.getenv("DOWNLOAD_RESERVATION_TTL", 1800))
+
+STATS_ID = "global"
+STATS_FIELDS = ("total", "vip", "lifetime_vip", "downloads", "successful_referrals", "bonus_downloads")
+
+# الحقول المطلوبة لكل استدعاء - لا نجلب المستند كاملاً إلا عند الحاجة
+LIST_PROJECTION = {
+    "username": 1, "full_name": 1, "referral_code": 1, "language": 1, "registration_date": 1,
+    "download_count": 1, "subscription_end": 1, "is_lifetime_vip": 1, "referred_by": 1,
+    "successful_referrals": 1, "bonus_downloads": 1, "last_interaction": 1,
+}
+ENTITLEMENT_PROJECTION = {
+    "language": 1, "subscription_end": 1, "is_lifetime_vip": 1, "bonus_downloads": 1, "ring": 1,
+}
+
+_client = None
+_db = None
+
+# ============ الاتصال ============
+
+def _create_client(uri):
+    """إنشاء العميل مع إعدادات مجمع الاتصالات"""
+    if uri.startswith("mongomock://"):
+        from mongomock_motor import AsyncMongoMockClient
+        return AsyncMongoMockClient()
+    return AsyncMongoClient(
+        uri,
+        maxPoolSize=MONGODB_MAX_POOL_SIZE,
+        minPoolSize=MONGODB_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGODB_MAX_IDLE_MS,
+        serverSelectionTimeoutMS=MONGODB_TIMEOUT_MS,
+        connectTimeoutMS=MONGODB_TIMEOUT_MS,
+        retryWrites=True,
+        tz_aware=False,
+    )
+
+async def init_db(client=None, db_name: str = None):
+    """تهيئة الاتصال والفهارس ومستند الإحصائيات"""
+    global _client, _db
+    try:
+        _client = client or _create_client(MONGODB_URI)
+        _db = _client[db_name or MONGODB_DB_NAME]
+        await _create_referral_index()
+        await _db.users.create_index([("username_lower", ASCENDING)])
+        await _db.users.create_index([("successful_referrals", DESCENDING)])
+        await _db.users.create_index([("subscription_end", ASCENDING)])
+        await _db.users.create_index([("referred_by", ASCENDING)])
+
+        stats = await _db.stats.find_one({"_id": STATS_ID})
+        if stats is None:
+            await _db.stats.update_one(
+                {"_id": STATS_ID}, {"$set": await _count_users()}, upsert=True
+            )
+        logger.info(f"✅ قاعدة بيانات MongoDB جاهزة ({_db.name})")
+        return True
+    except Exception as e:
+        logger.error(f"❌ خطأ في الاتصال بـ MongoDB: {e}")
+        return False
+
+async def _create_referral_index():
+    """فهرس فريد لكود الإحالة على الأكواد النصية فقط (sparse يحتسب null المخزنة صراحة)"""
+    keys = [("referral_code", ASCENDING)]
+    options = {"unique": True, "partialFilterExpression": {"referral_code": {"$type": "string"}}}
+    try:
+        await _db.users.create_index(keys, **options)
+    except OperationFailure:
+        # فهرس sparse قديم بنفس الاسم: استبداله
+        await _db.users.drop_index("referral_code_1")
+        await _db.users.create_index(keys, **options)
+
+async def close_db():
+    """إغلاق العميل ومجمع الاتصالات"""
+    global _client, _db
+    if _client is not None:
+        result = _client.close()
+        if asyncio.iscoroutine(result):
+            await result
+        _client = None
+        _db = None
+
+async def flush_db(timeout: float = None):
+    """كل عملية تُحفظ فور تأكيد الخادم - لا يوجد شيء معلق"""
+    return True
+
+async def _inc_stats(**changes):
+    """تحديث العدادات الإجمالية بعملية $inc واحدة"""
+    changes = {k: v for k, v in changes.items() if v}
+    if changes:
+        await _db.stats.update_one({"_id": STATS_ID}, {"$inc": changes}, upsert=True)
+
+async def _get_stats():
+    stats = await _db.stats.find_one({"_id": STATS_ID}) or {}
+    return {k: stats.get(k, 0) for k in STATS_FIELDS}
+
+# ============ التحويل ============
+
+def _slot(day):
+    """خانة اليوم في حلقة الأيام الأخيرة"""
+    return str(day.toordinal() % DAILY_HISTORY_DAYS)
+
+def _ring_count(doc, day):
+    """عدد تحميلات يوم معين من حقل ring في المستند"""
+    slot = (doc.get("ring") or {}).get(_slot(day))
+    return slot["count"] if slot and slot.get("day") == day.isoformat() else 0
+
+def _user_to_doc(user: UserRecord):
+    """تحويل UserRecord إلى مستند (التواريخ تُحفظ كتواريخ BSON)"""
+    doc = user.to_dict()
+    doc["_id"] = doc.pop("user_id")
+    if doc.get("referral_code") is None:
+        # بدون كود: الحقل غير موجود حتى لا يتعارض مع الفهرس الفريد
+        doc.pop("referral_code", None)
+    doc["registration_date"] = user.registration_date
+    doc["subscription_end"] = user.subscription_end
+    doc["last_interaction"] = user.last_interaction
+    doc["username_lower"] = user.username.lower() if user.username else None
+    doc["ring"] = {
+        str(i): {"day": day, "count": count}
+        for i, (day, count) in enumerate(doc.pop("recent_downloads") or []) if day
+    }
+    return doc
+
+def _doc_to_user(doc):
+    """تحويل مستند (كامل أو جزئي) إلى UserRecord"""
+    ring = [[None, 0] for _ in range(DAILY_HISTORY_DAYS)]
+    for i, slot in (doc.get("ring") or {}).items():
+        ring[int(i)] = [slot["day"], slot["count"]]
+    return UserRecord(
+        user_id=doc["_id"],
+        username=doc.get("username"),
+        full_name=doc.get("full_name"),
+        referral_code=doc.get("referral_code"),
+        language=doc.get("language") or "ar",
+        registration_date=parse_datetime(doc.get("registration_date")),
+        download_count=doc.get("download_count", 0),
+        recent_downloads=ring if doc.get("ring") else [],
+        monthly_downloads=doc.get("monthly_downloads") or {},
+        subscription_end=parse_datetime(doc.get("subscription_end")),
+        is_lifetime_vip=bool(doc.get("is_lifetime_vip")),
+        referred_by=doc.get("referred_by"),
+        referrals=doc.get("referrals") or [],
+        successful_referrals=doc.get("successful_referrals", 0),
+        bonus_downloads=doc.get("bonus_downloads", DEFAULT_BONUS_DOWNLOADS),
+        achievements=doc.get("achievements") or {},
+        last_interaction=parse_datetime(doc.get("last_interaction")),
+    )
+
+# ============ المستخدمون ============
+
+async def generate_referral_code():
+    """توليد كود إحالة فريد"""
+    while True:
+        code = 'REF' + ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
+        if not await _db.users.find_one({"referral_code": code}, {"_id": 1}):
+            return code
+
+def _duplicate_field(error: DuplicateKeyError):
+    """الحقل الذي سبب تكرار المفتاح (_id أو referral_code)"""
+    key_pattern = (error.details or {}).get("keyPattern") or {}
+    return next(iter(key_pattern), "_id")
+
+async def add_user(user_id: int, username: str, full_name: str):
+    """إضافة مستخدم جديد"""
+    try:
+        for _ in range(REFERRAL_CODE_RETRIES):
+            user = UserRecord(
+                user_id=user_id,
+                username=username,
+                full_name=full_name,
+                referral_code=await generate_referral_code(),
+                registration_date=datetime.now(),
+            )
+            try:
+                await _db.users.insert_one(_user_to_doc(user))
+            except DuplicateKeyError as e:
+                if _duplicate_field(e) == "referral_code":
+                    # الكود حُجز لمستخدم آخر بين التوليد والإضافة - كود جديد
+                    continue
+                # المستخدم موجود مسبقاً
+                return True
+            await _inc_stats(total=1, bonus_downloads=user.bonus_downloads)
+            logger.info(f"✅ تم إضافة المستخدم: {user_id}")
+            return True
+        logger.error(f"❌ تعذر توليد كود إحالة فريد للمستخدم: {user_id}")
+        return False
+    except Exception as e:
+        logger.error(f"❌ خطأ في إضافة المستخدم: {e}")
+        return False
+
+async def get_user(user_id: int):
+    """الحصول على بيانات المستخدم"""
+    doc = await _db.users.find_one({"_id": int(user_id)})
+    return _doc_to_user(doc) if doc else None
+
+async def get_all_users():
+    """الحصول على جميع المستخدمين (بدون الإحالات وسجل التحميلات)"""
+    return [_doc_to_user(doc) async for doc in _db.users.find({}, LIST_PROJECTION)]
+
+async def update_user_language(user_id: int, language: str):
+    """تحديث لغة المستخدم"""
+    try:
+        await _db.users.update_one({"_id": user_id}, {"$set": {"language": language}})
+        return True
+    except Exception as e:
+        logger.error(f"❌ خطأ: {e}")
+        return False
+
+async def get_user_language(user_id: int):
+    """الحصول على لغة المستخدم"""
+    doc = await _db.users.find_one({"_id": user_id}, {"language": 1})
+    return (doc.get("language") or 'ar') if doc else 'ar'
+
+async def register_referral(user_id: int, referral_code: str):
+    """تسجيل إحالة جديدة"""
+    try:
+        referrer = await _db.users.find_one({"referral_code": referral_code}, {"_id": 1})
+        if not referrer:
+            return False, "كود إحالة غير صحيح"
+
+        referrer_id = referrer["_id"]
+        if referrer_id == user_id:
+            return False, "لا يمكنك استخدام كود الإحالة الخاص بك"
+
+        await _db.users.update_one({"_id": user_id}, {"$set": {"referred_by": referrer_id}})
+        await _db.users.update_one({"_id": referrer_id}, {"$push": {"referrals": user_id}})
+        return True, "تم تسجيل الإحالة بنجاح"
+    except Exception as e:
+        logger.error(f"❌ خطأ: {e}")
+        return False, str(e)
+
+async def _record_download(user_id: int, day):
+    """زيادة العداد وخانة اليوم والمجموع الشهري ذرياً - يعيد المستند بعد التعديل"""
+    slot = _slot(day)
+    day_str = day.isoformat()
+    inc = {"download_count": 1, f"monthly_downloads.{day.strftime('%Y-%m')}": 1}
+    projection = {"download_count": 1, "referred_by": 1}
+    while True:
+        # نفس اليوم: زيادة الخانة
+        doc = await _db.users.find_one_and_update(
+            {"_id": user_id, f"ring.{slot}.day": day_str},
+            {"$inc": {**inc, f"ring.{slot}.count": 1}},
+            projection=projection, return_document=ReturnDocument.AFTER,
+        )
+        if doc:
+            return doc
+        # يوم جديد: استبدال الخانة القديمة (المجموع الشهري محفوظ مسبقاً)
+        doc = await _db.users.find_one_and_update(
+            {"_id": user_id, f"ring.{slot}.day": {"$ne": day_str}},
+            {"$inc": inc, "$set": {f"ring.{slot}": {"day": day_str, "count": 1}}},
+            projection=projection, return_document=ReturnDocument.AFTER,
+        )
+        if doc:
+            return doc
+        # المستخدم غير موجود، أو طلب متزامن أنشأ الخانة للتو - إعادة المحاولة
+        if not await _db.users.find_one({"_id": user_id}, {"_id": 1}):
+            return None
+
+async def increment_download_count(user_id: int):
+    """زيادة عداد التحميل"""
+    try:
+        doc = await _record_download(user_id, datetime.now().date())
+        if not doc:
+            return True
+        await _inc_stats(downloads=1)
+
+        if doc.get("download_count") == 10 and doc.get("referred_by"):
+            referrer = await _db.users.find_one_and_update(
+                {"_id": doc["referred_by"]},
+                {"$inc": {"bonus_downloads": 10, "successful_referrals": 1}},
+                projection={"_id": 1},
+            )
+            if referrer:
+                await _inc_stats(bonus_downloads=10, successful_referrals=1)
+        return True
+    except Exception as e:
+        logger.error(f"❌ خطأ: {e}")
+        return False
+
+async def get_daily_download_count(user_id: int):
+    """عدد التحميلات اليومية"""
+    today = datetime.now().date()
+    doc = await _db.users.find_one({"_id": user_id}, {f"ring.{_slot(today)}": 1})
+    return _ring_count(doc, today) if doc else 0
+
+async def get_bonus_downloads(user_id: int):
+    """الحصول على التحميلات الإضافية"""
+    doc = await _db.users.find_one({"_id": user_id}, {"bonus_downloads": 1})
+    return doc.get("bonus_downloads", 0) if doc else 0
+
+async def use_bonus_download(user_id: int):
+    """استخدام تحميل من الرصيد الاحتياطي (الشرط والخصم في عملية واحدة)"""
+    try:
+        doc = await _db.users.find_one_and_update(
+            {"_id": user_id, "bonus_downloads": {"$gt": 0}},
+            {"$inc": {"bonus_downloads": -1}},
+            projection={"_id": 1},
+        )
+        if not doc:
+            return False
+        await _inc_stats(bonus_downloads=-1)
+        return True
+    except Exception as e:
+        logger.error(f"❌ خطأ: {e}")
+        return False
+
+async def is_subscribed(user_id: int):
+    """التحقق من اشتراك VIP"""
+    doc = await _db.users.find_one({"_id": user_id}, {"is_lifetime_vip": 1, "subscription_end": 1})
+    return bool(doc) and _doc_to_user(doc).has_active_subscription()
+
+async def add_subscription(user_id: int, days: int):
+    """إضافة اشتراك VIP"""
+    try:
+        while True:
+            doc = await _db.users.find_one({"_id": user_id}, {"subscription_end": 1})
+            if not doc:
+                return False
+            current_end = doc.get("subscription_end")
+            now = datetime.now()
+            base = current_end if current_end and current_end > now else now
+            # تحديث مشروط بالقيمة المقروءة - إعادة المحاولة عند تعديل متزامن
+            result = await _db.users.update_one(
+                {"_id": user_id, "subscription_end": current_end},
+                {"$set": {"subscription_end": base + timedelta(days=days)}},
+            )
+            if result.modified_count:
+                break
+        if not current_end:
+            await _inc_stats(vip=1)
+        return True
+    except Exception as e:
+        logger.error(f"❌ خطأ: {e}")
+        return False
+
+async def set_lifetime_vip(user_id: int):
+    """تعيين VIP مدى الحياة"""
+    try:
+        before = await _db.users.find_one_and_update(
+            {"_id": user_id},
+            {"$set": {"is_lifetime_vip": True}},
+            projection={"is_lifetime_vip": 1},
+            return_document=ReturnDocument.BEFORE,
+        )
+        if before and not before.get("is_lifetime_vip"):
+            await _inc_stats(lifetime_vip=1)
+        return True
+    except Exception as e:
+        logger.error(f"❌ خطأ: {e}")
+        return False
+
+def is_admin(user_id: int):
+    """التحقق من صلاحيات الأدمن (من متغيرات البيئة - لا يحتاج قاعدة البيانات)"""
+    admin_ids = os.getenv("ADMIN_IDS", "").split(",")
+    return str(user_id) in admin_ids
+
+async def get_entitlements(user_id: int):
+    """اللغة وحالة VIP/الأدمن والاستخدام اليومي والرصيد الإضافي بقراءة واحدة"""
+    doc = await _db.users.find_one({"_id": user_id}, ENTITLEMENT_PROJECTION)
+    if not doc:
+        return Entitlements(user_id=user_id, exists=False, is_admin=is_admin(user_id))
+    now = datetime.now()
+    return Entitlements(
+        user_id=user_id,
+        exists=True,
+        language=doc.get("language") or 'ar',
+        is_admin=is_admin(user_id),
+        is_vip=_doc_to_user(doc).has_active_subscription(now),
+        daily_downloads=_ring_count(doc, now.date()),
+        bonus_downloads=doc.get("bonus_downloads", 0),
+    )
+
+# ============ حجز حصة التحميل ============
+
+# معرف الحجز -> (معرف المستخدم، النوع: daily/bonus/unlimited، وقت الانتهاء) - في ذاكرة العملية كما في database.py
+_reservations = {}
+_reservation_lock = asyncio.Lock()
+_reservation_ids = count(1)
+
+def _expire_reservations(now):
+    """حذف الحجوزات المنتهية (يُستدعى تحت القفل)"""
+    for reservation_id in [r for r, (_, _, expires) in _reservations.items() if expires <= now]:
+        del _reservations[reservation_id]
+
+def _held_reservations(user_id, kind):
+    return sum(1 for uid, k, _ in _reservations.values() if uid == user_id and k == kind)
+
+async def reserve_download(user_id: int, daily_limit: int, allow_bonus: bool = False):
+    """حجز تحميل من الحصة اليومية أو الرصيد الإضافي بخطوة واحدة - يعيد معرف الحجز أو None"""
+    async with _reservation_lock:
+        now = time.monotonic()
+        _expire_reservations(now)
+        entitlements = await get_entitlements(user_id)
+        if not entitlements.exists:
+            return None
+
+        if entitlements.is_unlimited:
+            kind = "unlimited"
+        elif entitlements.daily_downloads + _held_reservations(user_id, "daily") < daily_limit:
+            kind = "daily"
+        elif allow_bonus and entitlements.bonus_downloads - _held_reservations(user_id, "bonus") > 0:
+            kind = "bonus"
+        else:
+            return None
+
+        reservation_id = next(_reservation_ids)
+        _reservations[reservation_id] = (user_id, kind, now + DOWNLOAD_RESERVATION_TTL)
+        return reservation_id
+
+def get_reservation_kind(reservation_id):
+    """نوع الحجز (daily/bonus/unlimited) أو None إن لم يعد موجوداً (في الذاكرة - لا يحتاج await)"""
+    reservation = _reservations.get(reservation_id)
+    return reservation[1] if reservation else None
+
+async def commit_download(reservation_id):
+    """
+    تأكيد الحجز بعد نجاح التحميل: احتساب التحميل وخصم الرصيد الإضافي إن لزم
+    يعيد None إن لم يعد الحجز موجوداً (انتهت صلاحيته)، وFalse إن فشل التحديث دون احتساب
+    """
+    async with _reservation_lock:
+        reservation = _reservations.get(reservation_id)
+        if not reservation:
+            return None
+        user_id, kind, _ = reservation
+        ok = True
+        if kind == "bonus" and not await use_bonus_download(user_id):
+            logger.warning(f"⚠️ تعذر خصم الرصيد الإضافي للمستخدم {user_id}")
+            ok = False
+        elif kind != "unlimited":
+            ok = await increment_download_count(user_id)
+        # الحذف بعد تحديث التخزين حتى لا تظهر الحصة فارغة لحجز متزامن
+        del _reservations[reservation_id]
+        return ok
+
+async def release_download(reservation_id):
+    """إلغاء الحجز دون احتساب (فشل التحليل/التحميل أو رفض الطلب)"""
+    if reservation_id is None:
+        return False
+    async with _reservation_lock:
+        return _reservations.pop(reservation_id, None) is not None
+
+# ============ الإحصائيات ============
+
+async def _count_users():
+    """إعادة عد كاملة للعدادات بتجميع واحد على الخادم"""
+    pipeline = [{"$group": {
+        "_id": None,
+        "total": {"$sum": 1},
+        "vip": {"$sum": {"$cond": [{"$ifNull": ["$subscription_end", False]}, 1, 0]}},
+        "lifetime_vip": {"$sum": {"$cond": ["$is_lifetime_vip", 1, 0]}},
+        "downloads": {"$sum": "$download_count"},
+        "successful_referrals": {"$sum": "$successful_referrals"},
+        "bonus_downloads": {"$sum": "$bonus_downloads"},
+    }}]
+    cursor = _db.users.aggregate(pipeline)
+    if asyncio.iscoroutine(cursor):
+        cursor = await cursor
+    result = {k: 0 for k in STATS_FIELDS}
+    async for row in cursor:
+        result.update({k: row.get(k, 0) for k in STATS_FIELDS})
+    return result
+
+async def verify_counters():
+    """مقارنة العدادات بإعادة عد كاملة وتصحيحها عند الاختلاف"""
+    actual = await _count_users()
+    stats = await _get_stats()
+    mismatched = {k: (stats[k], v) for k, v in actual.items() if stats[k] != v}
+    if mismatched:
+        logger.warning(f"⚠️ تصحيح العدادات: {mismatched}")
+        await _db.stats.update_one({"_id": STATS_ID}, {"$set": actual}, upsert=True)
+    return not mismatched
+
+async def get_total_downloads_count():
+    """إجمالي التحميلات"""
+    return (await _get_stats())["downloads"]
+
+async def get_users_count():
+    """عدد المستخدمين"""
+    stats = await _get_stats()
+    return {
+        "total": stats["total"],
+        "vip": stats["vip"],
+        "lifetime_vip": stats["lifetime_vip"],
+        "free": stats["total"] - stats["vip"] - stats["lifetime_vip"],
+    }
+
+async def get_referral_statistics():
+    """إحصائيات الإحالات"""
+    stats = await _get_stats()
+    return {
+        'total_successful_referrals': stats["successful_referrals"],
+        'total_bonus_downloads': stats["bonus_downloads"],
+        'lifetime_vip_count': stats["lifetime_vip"],
+    }
+
+async def get_top_referrers(limit: int = 20):
+    """أكثر المحيلين"""
+    cursor = _db.users.find(
+        {"successful_referrals": {"$gt": 0}}, LIST_PROJECTION
+    ).sort([("successful_referrals", DESCENDING), ("_id", ASCENDING)]).limit(limit)
+    return [_doc_to_user(doc) async for doc in cursor]
+
+async def get_referrer_rank(user_id: int):
+    """ترتيب المستخدم بين المحيلين (1 = الأول) أو None إن لم تكن لديه إحالات ناجحة"""
+    doc = await _db.users.find_one({"_id": user_id}, {"successful_referrals": 1})
+    referrals = doc.get("successful_referrals", 0) if doc else 0
+    if referrals <= 0:
+        return None
+    return await _db.users.count_documents({"successful_referrals": {"$gt": referrals}}) + 1
+
+async def get_referrers_count():
+    """عدد المستخدمين الذين لديهم إحالة ناجحة واحدة على الأقل"""
+    return await _db.users.count_documents({"successful_referrals": {"$gt": 0}})
+
+# ============ الإعدادات والنشاط ============
+
+async def is_logo_enabled():
+    """حالة اللوجو"""
+    doc = await _db.config.find_one({"_id": "logo_enabled"})
+    return doc["value"] if doc else True
+
+async def set_logo_status(enabled: bool):
+    """تفعيل/تعطيل اللوجو"""
+    try:
+        await _db.config.update_one({"_id": "logo_enabled"}, {"$set": {"value": enabled}}, upsert=True)
+        return True
+    except Exception as e:
+        logger.error(f"❌ خطأ: {e}")
+        return False
+
+async def save_user_interactions(interactions: dict):
+    """حفظ آخر تفاعل لمجموعة مستخدمين بعملية bulk_write واحدة"""
+    if not interactions:
+        return True
+    try:
+        await _db.users.bulk_write([
+            UpdateOne({"_id": user_id}, {"$set": {"last_interaction": parse_datetime(timestamp)}})
+            for user_id, timestamp in interactions.items()
+        ], ordered=False)
+        return True
+    except Exception as e:
+        logger.error(f"❌ خطأ: {e}")
+        return False
+
+async def get_user_by_referral_code(referral_code: str):
+    """الحصول على المستخدم من كود الإحالة"""
+    doc = await _db.users.find_one({"referral_code": referral_code})
+    return _doc_to_user(doc) if doc else None
+
+async def get_user_by_username(username: str):
+    """الحصول على المستخدم من اليوزر نيم (بدون حساسية لحالة الأحرف)"""
+    doc = await _db.users.find_one({"username_lower": username.lstrip('@').lower()})
+    return _doc_to_user(doc) if doc else None
+
+# ============ الترحيل من JSON ============
+
+async def migrate_from_json(json_path="temp_database.json", journal_path=None, batch_size=1000):
+    """ترحيل متدفق من JSON (اللقطة ثم سجل التغييرات) - آمن لإعادة التشغيل: استبدال بالمعرف"""
+    from itertools import chain
+    from database_sqlite import _iter_snapshot, _iter_journal
+
+    journal_path = journal_path or os.path.splitext(json_path)[0] + ".journal"
+    sources = [_iter_journal(journal_path + ".compacting"), _iter_journal(journal_path)]
+    if os.path.exists(json_path):
+        sources.insert(0, _iter_snapshot(json_path))
+
+    migrated = 0
+    batch = []
+    for kind, key, value in chain(*sources):
+        if kind == "user":
+            doc = _user_to_doc(UserRecord.from_dict(value))
+            batch.append(UpdateOne({"_id": doc["_id"]}, {"$set": doc}, upsert=True))
+            migrated += 1
+        else:
+            await _db.config.update_one({"_id": key}, {"$set": {"value": value}}, upsert=True)
+        if len(batch) >= batch_size:
+            await _db.users.bulk_write(batch, ordered=False)
+            batch = []
+            logger.info(f"📦 تم ترحيل {migrated} مستخدم...")
+    if batch:
+        await _db.users.bulk_write(batch, ordered=False)
+
+    await _db.stats.update_one({"_id": STATS_ID}, {"$set": await _count_users()}, upsert=True)
+    logger.info(f"✅ اكتمل الترحيل: {migrated} مستخدم")
+    return migrated
+
+async def _main(args):
+    if not await init_db():
+        sys.exit(1)
+    try:
+        await migrate_from_json(args[0] if args else "temp_database.json")
+    finally:
+        await close_db()
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "migrate":
+        print(__doc__)
+        sys.exit(1)
+    asyncio.run(_main(sys.argv[2:]))
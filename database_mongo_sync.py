@@ -0,0 +1,127 @@
+"""
+واجهة متزامنة لـ database_mongo.py بنفس أسماء database_sqlite.py (DB_BACKEND=mongo)
+
+معالجات البوت تستدعي دوال database بشكل متزامن، وdatabase_mongo كلها awaitable.
+العميل غير المتزامن يعمل في حلقة أحداث خاصة على خيط منفصل (mongo-loop)، وكل دالة هنا
+ترسل الاستدعاء لتلك الحلقة وتنتظر نتيجته - نفس سلوك SQLite من جهة المستدعي.
+"""
+import asyncio
+import logging
+import threading
+from functools import wraps
+
+import database_mongo as mdb
+
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "init_db",
+    "close_db",
+    "flush_db",
+    "generate_referral_code",
+    "add_user",
+    "get_user",
+    "get_all_users",
+    "update_user_language",
+    "get_user_language",
+    "register_referral",
+    "increment_download_count",
+    "get_daily_download_count",
+    "get_bonus_downloads",
+    "use_bonus_download",
+    "is_subscribed",
+    "add_subscription",
+    "set_lifetime_vip",
+    "get_total_downloads_count",
+    "get_users_count",
+    "get_referral_statistics",
+    "get_top_referrers",
+    "is_logo_enabled",
+    "set_logo_status",
+    "save_user_interactions",
+    "get_user_by_referral_code",
+    "get_user_by_username",
+    "verify_counters",
+    "get_referrer_rank",
+    "get_referrers_count",
+    "compact_download_history",
+    "get_entitlements",
+]
+
+_loop = None
+_thread = None
+_loop_lock = threading.Lock()
+
+def _get_loop():
+    """حلقة الأحداث الخاصة بـ MongoDB - تُشغّل مرة واحدة عند أول استدعاء"""
+    global _loop, _thread
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _thread = threading.Thread(target=_loop.run_forever, name="mongo-loop", daemon=True)
+            _thread.start()
+        return _loop
+
+def _run(coro):
+    """تنفيذ coroutine على حلقة MongoDB وانتظار النتيجة"""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result()
+
+def _sync(func):
+    """نسخة متزامنة من دالة database_mongo"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        return _run(func(*args, **kwargs))
+    return wrapper
+
+def init_db():
+    """تهيئة الاتصال والفهارس على حلقة MongoDB"""
+    return _run(mdb.init_db())
+
+def close_db():
+    """إغلاق العميل ثم إيقاف حلقة MongoDB"""
+    global _loop, _thread
+    with _loop_lock:
+        loop, thread = _loop, _thread
+        _loop = _thread = None
+    if loop is None:
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(mdb.close_db(), loop).result()
+    except Exception as e:
+        logger.error(f"❌ خطأ في إغلاق MongoDB: {e}")
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+def compact_download_history():
+    """سجل التحميلات في MongoDB حلقة ثابتة الحجم - لا يوجد شيء للضغط"""
+    return 0
+
+flush_db = _sync(mdb.flush_db)
+generate_referral_code = _sync(mdb.generate_referral_code)
+add_user = _sync(mdb.add_user)
+get_user = _sync(mdb.get_user)
+get_all_users = _sync(mdb.get_all_users)
+update_user_language = _sync(mdb.update_user_language)
+get_user_language = _sync(mdb.get_user_language)
+register_referral = _sync(mdb.register_referral)
+increment_download_count = _sync(mdb.increment_download_count)
+get_daily_download_count = _sync(mdb.get_daily_download_count)
+get_bonus_downloads = _sync(mdb.get_bonus_downloads)
+use_bonus_download = _sync(mdb.use_bonus_download)
+is_subscribed = _sync(mdb.is_subscribed)
+add_subscription = _sync(mdb.add_subscription)
+set_lifetime_vip = _sync(mdb.set_lifetime_vip)
+get_total_downloads_count = _sync(mdb.get_total_downloads_count)
+get_users_count = _sync(mdb.get_users_count)
+get_referral_statistics = _sync(mdb.get_referral_statistics)
+get_top_referrers = _sync(mdb.get_top_referrers)
+is_logo_enabled = _sync(mdb.is_logo_enabled)
+set_logo_status = _sync(mdb.set_logo_status)
+save_user_interactions = _sync(mdb.save_user_interactions)
+get_user_by_referral_code = _sync(mdb.get_user_by_referral_code)
+get_user_by_username = _sync(mdb.get_user_by_username)
+verify_counters = _sync(mdb.verify_counters)
+get_referrer_rank = _sync(mdb.get_referrer_rank)
+get_referrers_count = _sync(mdb.get_referrers_count)
+get_entitlements = _sync(mdb.get_entitlements)
@@ -0,0 +1,854 @@
+"""
+قاعدة بيانات SQLite بنفس واجهة database.py
+تُفعّل عبر DB_BACKEND=sqlite
+
+الترحيل من ملف JSON (قراءة متدفقة بدون تحميل الملف كاملاً):
+    python database_sqlite.py migrate [temp_database.json] [database.sqlite3]
+"""
+import os
+import sys
+import json
+import random
+import string
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import db_snapshot
+from models import (
+    UserRecord, Entitlements, DAILY_HISTORY_DAYS, DEFAULT_BONUS_DOWNLOADS,
+    parse_datetime as _parse_datetime, empty_download_ring,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SQLITE_DB_FILE = os.getenv("SQLITE_DB_FILE", "database.sqlite3")
+
+__all__ = [
+    "init_db",
+    "close_db",
+    "flush_db",
+    "generate_referral_code",
+    "add_user",
+    "get_user",
+    "get_all_users",
+    "update_user_language",
+    "get_user_language",
+    "register_referral",
+    "increment_download_count",
+    "get_daily_download_count",
+    "get_bonus_downloads",
+    "use_bonus_download",
+    "is_subscribed",
+    "add_subscription",
+    "set_lifetime_vip",
+    "get_total_downloads_count",
+    "get_users_count",
+    "get_referral_statistics",
+    "get_top_referrers",
+    "is_logo_enabled",
+    "set_logo_status",
+    "save_user_interactions",
+    "get_user_by_referral_code",
+    "get_user_by_username",
+    "verify_counters",
+    "get_referrer_rank",
+    "get_referrers_count",
+    "compact_download_history",
+    "get_entitlements",
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    username TEXT,
+    full_name TEXT,
+    referral_code TEXT UNIQUE,
+    language TEXT NOT NULL DEFAULT 'ar',
+    registration_date TEXT,
+    download_count INTEGER NOT NULL DEFAULT 0,
+    subscription_end TEXT,
+    is_lifetime_vip INTEGER NOT NULL DEFAULT 0,
+    referred_by INTEGER,
+    successful_referrals INTEGER NOT NULL DEFAULT 0,
+    bonus_downloads INTEGER NOT NULL DEFAULT 50,
+    achievements TEXT NOT NULL DEFAULT '{}',
+    last_interaction TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_users_username ON users(username COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_users_subscription_end ON users(subscription_end);
+CREATE INDEX IF NOT EXISTS idx_users_referred_by ON users(referred_by);
+CREATE INDEX IF NOT EXISTS idx_users_successful_referrals ON users(successful_referrals);
+
+CREATE TABLE IF NOT EXISTS daily_downloads (
+    user_id INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_daily_downloads_day ON daily_downloads(day);
+
+-- الأيام الأقدم من نافذة السجل تُحذف، ومجاميعها محفوظة هنا
+CREATE TABLE IF NOT EXISTS monthly_downloads (
+    user_id INTEGER NOT NULL,
+    month TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, month)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS config (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+
+-- عدادات إجمالية في صف واحد تحدّثها المشغلات (triggers) مع كل تعديل
+CREATE TABLE IF NOT EXISTS stats (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    total INTEGER NOT NULL DEFAULT 0,
+    vip INTEGER NOT NULL DEFAULT 0,
+    lifetime_vip INTEGER NOT NULL DEFAULT 0,
+    downloads INTEGER NOT NULL DEFAULT 0,
+    successful_referrals INTEGER NOT NULL DEFAULT 0,
+    bonus_downloads INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_stats_insert AFTER INSERT ON users BEGIN
+    UPDATE stats SET
+        total = total + 1,
+        vip = vip + (NEW.subscription_end IS NOT NULL),
+        lifetime_vip = lifetime_vip + NEW.is_lifetime_vip,
+        downloads = downloads + NEW.download_count,
+        successful_referrals = successful_referrals + NEW.successful_referrals,
+        bonus_downloads = bonus_downloads + NEW.bonus_downloads
+    WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_stats_delete AFTER DELETE ON users BEGIN
+    UPDATE stats SET
+        total = total - 1,
+        vip = vip - (OLD.subscription_end IS NOT NULL),
+        lifetime_vip = lifetime_vip - OLD.is_lifetime_vip,
+        downloads = downloads - OLD.download_count,
+        successful_referrals = successful_referrals - OLD.successful_referrals,
+        bonus_downloads = bonus_downloads - OLD.bonus_downloads
+    WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_stats_update AFTER UPDATE OF
+    subscription_end, is_lifetime_vip, download_count, successful_referrals, bonus_downloads
+ON users BEGIN
+    UPDATE stats SET
+        vip = vip + (NEW.subscription_end IS NOT NULL) - (OLD.subscription_end IS NOT NULL),
+        lifetime_vip = lifetime_vip + NEW.is_lifetime_vip - OLD.is_lifetime_vip,
+        downloads = downloads + NEW.download_count - OLD.download_count,
+        successful_referrals = successful_referrals + NEW.successful_referrals - OLD.successful_referrals,
+        bonus_downloads = bonus_downloads + NEW.bonus_downloads - OLD.bonus_downloads
+    WHERE id = 1;
+END;
+"""
+
+SQL_RECOUNT = """
+SELECT COUNT(*) AS total,
+       COUNT(subscription_end) AS vip,
+       COALESCE(SUM(is_lifetime_vip), 0) AS lifetime_vip,
+       COALESCE(SUM(download_count), 0) AS downloads,
+       COALESCE(SUM(successful_referrals), 0) AS successful_referrals,
+       COALESCE(SUM(bonus_downloads), 0) AS bonus_downloads
+FROM users
+"""
+SQL_GET_STATS = "SELECT * FROM stats WHERE id = 1"
+STATS_COLUMNS = ("total", "vip", "lifetime_vip", "downloads", "successful_referrals", "bonus_downloads")
+
+# الاستعلامات ثابتة ومعاملاتها منفصلة - sqlite3 يحتفظ بها كـ prepared statements
+SQL_GET_USER = "SELECT * FROM users WHERE user_id = ?"
+SQL_GET_LANGUAGE = "SELECT language FROM users WHERE user_id = ?"
+SQL_GET_BONUS = "SELECT bonus_downloads FROM users WHERE user_id = ?"
+SQL_GET_SUBSCRIPTION = "SELECT is_lifetime_vip, subscription_end FROM users WHERE user_id = ?"
+# الإحالات (0) وأيام السجل (1) والمجاميع الشهرية (2) لمستخدم واحد في استعلام واحد
+SQL_GET_HISTORY = """
+SELECT 0 AS kind, user_id AS key, registration_date AS value FROM users WHERE referred_by = ?
+UNION ALL SELECT 1, day, count FROM daily_downloads WHERE user_id = ? AND day > ?
+UNION ALL SELECT 2, month, count FROM monthly_downloads WHERE user_id = ?
+ORDER BY kind, value
+"""
+# مسار التحميل: الحقول اللازمة للصلاحيات وعدد تحميلات اليوم فقط (بدون الإحالات والسجل)
+SQL_GET_ENTITLEMENTS = """
+SELECT u.language, u.is_lifetime_vip, u.subscription_end, u.bonus_downloads, COALESCE(d.count, 0) AS daily
+FROM users u LEFT JOIN daily_downloads d ON d.user_id = u.user_id AND d.day = ?
+WHERE u.user_id = ?
+"""
+SQL_GET_DAILY_COUNT = "SELECT count FROM daily_downloads WHERE user_id = ? AND day = ?"
+SQL_CODE_EXISTS = "SELECT 1 FROM users WHERE referral_code = ?"
+SQL_BY_CODE = "SELECT * FROM users WHERE referral_code = ?"
+SQL_BY_USERNAME = "SELECT * FROM users WHERE username = ? COLLATE NOCASE ORDER BY registration_date LIMIT 1"
+SQL_INSERT_USER = """
+INSERT OR IGNORE INTO users (user_id, username, full_name, referral_code, language, registration_date)
+VALUES (?, ?, ?, ?, 'ar', ?)
+"""
+SQL_UPSERT_USER = """
+INSERT OR REPLACE INTO users (
+    user_id, username, full_name, referral_code, language, registration_date,
+    download_count, subscription_end, is_lifetime_vip, referred_by,
+    successful_referrals, bonus_downloads, achievements, last_interaction
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+SQL_UPSERT_DAILY = "INSERT OR REPLACE INTO daily_downloads (user_id, day, count) VALUES (?, ?, ?)"
+SQL_INCREMENT_DAILY = """
+INSERT INTO daily_downloads (user_id, day, count) VALUES (?, ?, 1)
+ON CONFLICT(user_id, day) DO UPDATE SET count = count + 1
+"""
+SQL_INCREMENT_MONTHLY = """
+INSERT INTO monthly_downloads (user_id, month, count) VALUES (?, ?, ?)
+ON CONFLICT(user_id, month) DO UPDATE SET count = count + excluded.count
+"""
+# قاعدة بيانات أُنشئت قبل monthly_downloads: أيام السجل غير محسوبة في المجاميع الشهرية بعد
+SQL_BACKFILL_MONTHLY = """
+INSERT INTO monthly_downloads (user_id, month, count)
+SELECT user_id, substr(day, 1, 7), SUM(count) FROM daily_downloads WHERE true
+GROUP BY user_id, substr(day, 1, 7)
+ON CONFLICT(user_id, month) DO UPDATE SET count = count + excluded.count
+"""
+SQL_UPSERT_MONTHLY = "INSERT OR REPLACE INTO monthly_downloads (user_id, month, count) VALUES (?, ?, ?)"
+SQL_SET_CONFIG = "INSERT OR REPLACE INTO config (key, value) VALUES (?, ?)"
+SQL_GET_CONFIG = "SELECT value FROM config WHERE key = ?"
+
+# إصدار المخطط في PRAGMA user_version (ترحيلات تُنفذ مرة واحدة)
+SCHEMA_VERSION = 1
+
+_conn = None
+_lock = threading.RLock()
+
+def _connect(path=None):
+    """فتح اتصال SQLite بوضع WAL"""
+    conn = sqlite3.connect(
+        path or SQLITE_DB_FILE,
+        isolation_level=None,
+        check_same_thread=False,
+        cached_statements=256,
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    # INSERT OR REPLACE يحذف الصف القديم - نحتاج تشغيل مشغل الحذف لتبقى العدادات صحيحة
+    conn.execute("PRAGMA recursive_triggers=ON")
+    had_monthly = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'monthly_downloads'"
+    ).fetchone() is not None
+    conn.executescript(SCHEMA)
+    _migrate_schema(conn, had_monthly)
+    if conn.execute("INSERT OR IGNORE INTO stats (id) VALUES (1)").rowcount:
+        # قاعدة بيانات قديمة بدون صف العدادات - عدّ أولي واحد
+        _write_stats(conn, conn.execute(SQL_RECOUNT).fetchone())
+    return conn
+
+def _migrate_schema(conn, had_monthly):
+    """ترحيلات المخطط حسب user_version - داخل معاملة حتى لا تُنفذ مرتين"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < 1 and not had_monthly:
+            # قبل إضافة الجدول لم يُحسب أي تحميل شهرياً - كل الأيام تُجمع قبل أن يحذفها الضغط
+            backfilled = conn.execute(SQL_BACKFILL_MONTHLY).rowcount
+            if backfilled:
+                logger.info(f"📦 تم حساب {backfilled} مجموع شهري من سجل التحميلات القديم")
+        if version < SCHEMA_VERSION:
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+def _write_stats(conn, counts):
+    conn.execute(
+        "UPDATE stats SET " + ", ".join(f"{c} = ?" for c in STATS_COLUMNS) + " WHERE id = 1",
+        tuple(counts[c] for c in STATS_COLUMNS)
+    )
+
+def _db():
+    """الاتصال المشترك (يُفتح عند أول استخدام)"""
+    global _conn
+    if _conn is None:
+        with _lock:
+            if _conn is None:
+                _conn = _connect()
+    return _conn
+
+class _transaction:
+    """معاملة كتابة واحدة (BEGIN IMMEDIATE ... COMMIT)"""
+    def __enter__(self):
+        _lock.acquire()
+        conn = _db()
+        conn.execute("BEGIN IMMEDIATE")
+        return conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            _db().execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            _lock.release()
+        return False
+
+def _query_one(sql, params):
+    with _lock:
+        return _db().execute(sql, params).fetchone()
+
+def _format_datetime(value):
+    value = _parse_datetime(value)
+    return value.isoformat() if value else None
+
+def _row_to_user(row, full=True):
+    """تحويل صف إلى UserRecord (full=False بدون الإحالات وسجل التحميلات)"""
+    user = UserRecord(
+        user_id=row["user_id"],
+        username=row["username"],
+        full_name=row["full_name"],
+        referral_code=row["referral_code"],
+        language=row["language"],
+        registration_date=_parse_datetime(row["registration_date"]),
+        download_count=row["download_count"],
+        subscription_end=_parse_datetime(row["subscription_end"]),
+        is_lifetime_vip=bool(row["is_lifetime_vip"]),
+        referred_by=row["referred_by"],
+        successful_referrals=row["successful_referrals"],
+        bonus_downloads=row["bonus_downloads"],
+        achievements=json.loads(row["achievements"] or "{}"),
+        last_interaction=_parse_datetime(row["last_interaction"]),
+    )
+
+    if full:
+        user_id = row["user_id"]
+        with _lock:
+            rows = _db().execute(SQL_GET_HISTORY, (user_id, user_id, _history_cutoff(), user_id)).fetchall()
+        ring = empty_download_ring()
+        for kind, key, value in rows:
+            if kind == 0:
+                user.referrals.append(key)
+            elif kind == 1:
+                day = datetime.strptime(key, '%Y-%m-%d').date()
+                ring[day.toordinal() % DAILY_HISTORY_DAYS] = [key, value]
+            else:
+                user.monthly_downloads[key] = value
+        user.recent_downloads = ring
+    return user
+
+def _history_cutoff():
+    """آخر يوم خارج نافذة السجل"""
+    return (datetime.now().date() - timedelta(days=DAILY_HISTORY_DAYS)).isoformat()
+
+def init_db():
+    """تهيئة قاعدة البيانات"""
+    try:
+        _db()
+        logger.info(f"✅ قاعدة بيانات SQLite جاهزة ({SQLITE_DB_FILE})")
+        return True
+    except Exception as e:
+        logger.error(f"❌ خطأ: {e}")
+        return False
+
+def close_db():
+    """إغلاق الاتصال"""
+    global _conn
+    with _lock:
+        if _conn is not None:
+            _conn.close()
+            _conn = None
+
+def flush_db(timeout: float = None):
+    """كل معاملة تُحفظ عند COMMIT - لا يوجد شيء معلق"""
+    return True
+
+def generate_referral_code():
+    """توليد كود إحالة فريد"""
+    while True:
+        code = 'REF' + ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
+        if not _query_one(SQL_CODE_EXISTS, (code,)):
+            return code
+
+def add_user(user_id: int, username: str, full_name: str):
+    """إضافة مستخدم جديد"""
+    try:
+        with _transaction() as conn:
+            if conn.execute("SELECT 1 FROM users WHERE user_id = ?", (user_id,)).fetchone():
+                return True
+            conn.execute(SQL_INSERT_USER, (
+                user_id, username, full_name, generate_referral_code(), datetime.now().isoformat()
+            ))
+        logger.info(f"✅ تم إضافة المستخدم: {user_id}")
+        return True
+    except Exception as e:
+        logger.error(f"❌ خطأ في إضافة المستخدم: {e}")
+        return False
+
+def get_user(user_id: int):
+    """الحصول على بيانات المستخدم"""
+    row = _query_one(SQL_GET_USER, (user_id,))
+    return _row_to_user(row) if row else None
+
+def is_admin(user_id: int):
+    """التحقق من صلاحيات الأدمن (من متغيرات البيئة - لا يحتاج قاعدة البيانات)"""
+    admin_ids = os.getenv("ADMIN_IDS", "").split(",")
+    return str(user_id) in admin_ids
+
+def get_entitlements(user_id: int):
+    """اللغة وحالة VIP/الأدمن والاستخدام اليومي والرصيد الإضافي باستعلام واحد"""
+    now = datetime.now()
+    row = _query_one(SQL_GET_ENTITLEMENTS, (now.strftime('%Y-%m-%d'), user_id))
+    if not row:
+        return Entitlements(user_id=user_id, exists=False, is_admin=is_admin(user_id))
+    subscription_end = _parse_datetime(row["subscription_end"])
+    return Entitlements(
+        user_id=user_id,
+        exists=True,
+        language=row["language"] or 'ar',
+        is_admin=is_admin(user_id),
+        is_vip=bool(row["is_lifetime_vip"]) or bool(subscription_end and subscription_end > now),
+        daily_downloads=row["daily"],
+        bonus_downloads=row["bonus_downloads"],
+    )
+
+def get_all_users():
+    """الحصول على جميع المستخدمين (بدون قوائم الإحالة والتحميلات اليومية)"""
+    with _lock:
+        rows = _db().execute("SELECT * FROM users ORDER BY registration_date").fetchall()
+    return [_row_to_user(row, full=False) for row in rows]
+
+def update_user_language(user_id: int, language: str):
+    """تحديث لغة المستخدم"""
+    try:
+        with _transaction() as conn:
+            conn.execute("UPDATE users SET language = ? WHERE user_id = ?", (language, user_id))
+        return True
+    except Exception as e:
+        logger.error(f"❌ خطأ: {e}")
+        return False
+
+def get_user_language(user_id: int):
+    """الحصول على لغة المستخدم"""
+    row = _query_one(SQL_GET_LANGUAGE, (user_id,))
+    return row["language"] if row and row["language"] else 'ar'
+
+def register_referral(user_id: int, referral_code: str):
+    """تسجيل إحالة جديدة"""
+    try:
+        with _transaction() as conn:
+            referrer = conn.execute("SELECT user_id FROM users WHERE referral_code = ?", (referral_code,)).fetchone()
+
+            if not referrer:
+                return False, "كود إحالة غير صحيح"
+
+            referrer_id = referrer["user_id"]
+
+            if referrer_id == user_id:
+                return False, "لا يمكنك استخدام كود الإحالة الخاص بك"
+
+            conn.execute("UPDATE users SET referred_by = ? WHERE user_id = ?", (referrer_id, user_id))
+
+        return True, "تم تسجيل الإحالة بنجاح"
+    except Exception as e:
+        logger.error(f"❌ خطأ: {e}")
+        return False, str(e)
+
+def increment_download_count(user_id: int):
+    """زيادة عداد التحميل"""
+    try:
+        now = datetime.now()
+        today = now.strftime('%Y-%m-%d')
+
+        with _transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE users SET download_count = download_count + 1 WHERE user_id = ?", (user_id,)
+            )
+            if cursor.rowcount == 0:
+                return True
+
+            conn.execute(SQL_INCREMENT_DAILY, (user_id, today))
+            conn.execute(SQL_INCREMENT_MONTHLY, (user_id, now.strftime('%Y-%m'), 1))
+
+            row = conn.execute(
+                "SELECT download_count, referred_by FROM users WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            if row["download_count"] == 10 and row["referred_by"]:
+                conn.execute(
+                    "UPDATE users SET bonus_downloads = bonus_downloads + 10, "
+                    "successful_referrals = successful_referrals + 1 WHERE user_id = ?",
+                    (row["referred_by"],)
+                )
+
+        return True
+    except Exception as e:
+        logger.error(f"❌ خطأ: {e}")
+        return False
+
+def compact_download_history():
+    """حذف الأيام الأقدم من نافذة السجل (مجاميعها موجودة في monthly_downloads)"""
+    with _transaction() as conn:
+        deleted = conn.execute("DELETE FROM daily_downloads WHERE day <= ?", (_history_cutoff(),)).rowcount
+    if deleted:
+        logger.info(f"🗜️ تم حذف {deleted} يوم قديم من سجل التحميلات")
+    return deleted
+
+def get_daily_download_count(user_id: int):
+    """عدد التحميلات اليومية"""
+    today = datetime.now().strftime('%Y-%m-%d')
+    row = _query_one(SQL_GET_DAILY_COUNT, (user_id, today))
+    return row["count"] if row else 0
+
+def get_bonus_downloads(user_id: int):
+    """الحصول على التحميلات الإضافية"""
+    row = _query_one(SQL_GET_BONUS, (user_id,))
+    return row["bonus_downloads"] if row else 0
+
+def use_bonus_download(user_id: int):
+    """استخدام تحميل من الرصيد الاحتياطي"""
+    try:
+        with _transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE users SET bonus_downloads = bonus_downloads - 1 "
+                "WHERE user_id = ? AND bonus_downloads > 0", (user_id,)
+            )
+            return cursor.rowcount > 0
+    except Exception as e:
+        logger.error(f"❌ خطأ: {e}")
+        return False
+
+def is_subscribed(user_id: int):
+    """التحقق من اشتراك VIP"""
+    row = _query_one(SQL_GET_SUBSCRIPTION, (user_id,))
+    if not row:
+        return False
+
+    if row["is_lifetime_vip"]:
+        return True
+
+    subscription_end = _parse_datetime(row["subscription_end"])
+    return bool(subscription_end and subscription_end > datetime.now())
+
+def add_subscription(user_id: int, days: int):
+    """إضافة اشتراك VIP"""
+    try:
+        with _transaction() as conn:
+            row = conn.execute("SELECT subscription_end FROM users WHERE user_id = ?", (user_id,)).fetchone()
+            if not row:
+                return False
+
+            current_end = _parse_datetime(row["subscription_end"])
+
+            if current_end and current_end > datetime.now():
+                new_end = current_end + timedelta(days=days)
+            else:
+                new_end = datetime.now() + timedelta(days=days)
+
+            conn.execute(
+                "UPDATE users SET subscription_end = ? WHERE user_id = ?", (new_end.isoformat(), user_id)
+            )
+
+        return True
+    except Exception as e:
+        logger.error(f"❌ خطأ: {e}")
+        return False
+
+def set_lifetime_vip(user_id: int):
+    """تعيين VIP مدى الحياة"""
+    try:
+        with _transaction() as conn:
+            conn.execute("UPDATE users SET is_lifetime_vip = 1 WHERE user_id = ?", (user_id,))
+        return True
+    except Exception as e:
+        logger.error(f"❌ خطأ: {e}")
+        return False
+
+def verify_counters():
+    """مقارنة صف العدادات بإعادة عد كاملة وتصحيحه عند الاختلاف"""
+    with _transaction() as conn:
+        actual = conn.execute(SQL_RECOUNT).fetchone()
+        stored = conn.execute(SQL_GET_STATS).fetchone()
+        mismatched = {c: (stored[c], actual[c]) for c in STATS_COLUMNS if stored[c] != actual[c]}
+        if mismatched:
+            logger.warning(f"⚠️ تصحيح العدادات: {mismatched}")
+            _write_stats(conn, actual)
+    return not mismatched
+
+def get_total_downloads_count():
+    """إجمالي التحميلات"""
+    return _query_one(SQL_GET_STATS, ())["downloads"]
+
+def get_users_count():
+    """عدد المستخدمين"""
+    row = _query_one(SQL_GET_STATS, ())
+    total, vip, lifetime_vip = row["total"], row["vip"], row["lifetime_vip"]
+
+    return {
+        "total": total,
+        "vip": vip,
+        "lifetime_vip": lifetime_vip,
+        "free": total - vip - lifetime_vip
+    }
+
+def get_referral_statistics():
+    """إحصائيات الإحالات"""
+    row = _query_one(SQL_GET_STATS, ())
+
+    return {
+        'total_successful_referrals': row["successful_referrals"],
+        'total_bonus_downloads': row["bonus_downloads"],
+        'lifetime_vip_count': row["lifetime_vip"]
+    }
+
+def get_top_referrers(limit: int = 20):
+    """أكثر المحيلين"""
+    with _lock:
+        rows = _db().execute(
+            "SELECT * FROM users WHERE successful_referrals > 0 "
+            "ORDER BY successful_referrals DESC, user_id ASC LIMIT ?", (limit,)
+        ).fetchall()
+    return [_row_to_user(row, full=False) for row in rows]
+
+def get_referrer_rank(user_id: int):
+    """ترتيب المستخدم بين المحيلين (1 = الأول) أو None إن لم تكن لديه إحالات ناجحة"""
+    row = _query_one("SELECT successful_referrals FROM users WHERE user_id = ?", (user_id,))
+    if not row or row["successful_referrals"] <= 0:
+        return None
+    ahead = _query_one(
+        "SELECT COUNT(*) AS ahead FROM users WHERE successful_referrals > ?", (row["successful_referrals"],)
+    )
+    return ahead["ahead"] + 1
+
+def get_referrers_count():
+    """عدد المستخدمين الذين لديهم إحالة ناجحة واحدة على الأقل"""
+    return _query_one("SELECT COUNT(*) AS total FROM users WHERE successful_referrals > 0", ())["total"]
+
+def is_logo_enabled():
+    """حالة اللوجو"""
+    row = _query_one(SQL_GET_CONFIG, ('logo_enabled',))
+    return json.loads(row["value"]) if row else True
+
+def set_logo_status(enabled: bool):
+    """تفعيل/تعطيل اللوجو"""
+    try:
+        with _transaction() as conn:
+            conn.execute(SQL_SET_CONFIG, ('logo_enabled', json.dumps(enabled)))
+        return True
+    except Exception as e:
+        logger.error(f"❌ خطأ: {e}")
+        return False
+
+def save_user_interactions(interactions: dict):
+    """حفظ آخر تفاعل لمجموعة مستخدمين في معاملة واحدة"""
+    try:
+        with _transaction() as conn:
+            conn.executemany(
+                "UPDATE users SET last_interaction = ? WHERE user_id = ?",
+                [(_format_datetime(timestamp), user_id) for user_id, timestamp in interactions.items()]
+            )
+        return True
+    except Exception as e:
+        logger.error(f"❌ خطأ: {e}")
+        return False
+
+def get_user_by_referral_code(referral_code: str):
+    """الحصول على المستخدم من كود الإحالة"""
+    row = _query_one(SQL_BY_CODE, (referral_code,))
+    return _row_to_user(row) if row else None
+
+def get_user_by_username(username: str):
+    """الحصول على المستخدم من اليوزر نيم (بدون حساسية لحالة الأحرف)"""
+    row = _query_one(SQL_BY_USERNAME, (username.lstrip('@'),))
+    return _row_to_user(row) if row else None
+
+# ============ الترحيل من JSON ============
+
+def _iter_json_users(path, chunk_size=1 << 16):
+    """
+    قراءة متدفقة لملف JSON بصيغة {"users": {...}, "config": {...}}
+    تُرجع ("user", id, data) أو ("config", key, value) دون تحميل الملف كاملاً
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buf = ""
+        pos = 0
+        eof = False
+
+        def fill():
+            nonlocal buf, pos, eof
+            chunk = f.read(chunk_size)
+            if not chunk:
+                eof = True
+            buf = buf[pos:] + chunk
+            pos = 0
+
+        def skip(chars=" \t\r\n"):
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos] in chars:
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return
+                fill()
+
+        def expect(char):
+            nonlocal pos
+            skip()
+            if pos >= len(buf) or buf[pos] != char:
+                raise ValueError(f"JSON غير صالح: متوقع '{char}'")
+            pos += 1
+
+        def value():
+            nonlocal pos
+            skip()
+            while True:
+                try:
+                    obj, end = decoder.raw_decode(buf, pos)
+                    # القيمة المكتملة يجب ألا تنتهي عند حد المخزن (إلا في نهاية الملف)
+                    if end < len(buf) or eof:
+                        pos = end
+                        return obj
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                fill()
+
+        def items():
+            """مفاتيح وقيم كائن JSON واحداً تلو الآخر"""
+            nonlocal pos
+            expect('{')
+            skip()
+            if buf[pos:pos + 1] == '}':
+                pos += 1
+                return
+            while True:
+                key = value()
+                expect(':')
+                yield key
+                skip(" \t\r\n")
+                if buf[pos:pos + 1] == ',':
+                    pos += 1
+                    continue
+                expect('}')
+                return
+
+        fill()
+        for section in items():
+            if section == "users":
+                for user_id in items():
+                    yield "user", user_id, value()
+            elif section == "config":
+                for key, config_value in value().items():
+                    yield "config", key, config_value
+            else:
+                value()
+
+def _iter_snapshot(path):
+    """قراءة اللقطة بصيغتها: ثنائية (db_snapshot) أو JSON متدفق"""
+    if db_snapshot.is_snapshot_file(path):
+        with open(path, 'rb') as f:
+            yield from db_snapshot.iter_file_records(f)
+    else:
+        yield from _iter_json_users(path)
+
+def _iter_journal(path):
+    """قراءة سجل التغييرات (من وضع JSON + سجل)"""
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get('op') == 'user':
+                yield "user", record['id'], record['data']
+            elif record.get('op') == 'config':
+                yield "config", record['key'], record['value']
+
+def _write_user(conn, user):
+    """كتابة مستخدم بصيغة JSON إلى الجداول"""
+    user_id = int(user["user_id"])
+    conn.execute(SQL_UPSERT_USER, (
+        user_id,
+        user.get("username"),
+        user.get("full_name"),
+        user.get("referral_code"),
+        user.get("language", "ar"),
+        _format_datetime(user.get("registration_date")),
+        user.get("download_count", 0),
+        _format_datetime(user.get("subscription_end")),
+        1 if user.get("is_lifetime_vip") else 0,
+        user.get("referred_by"),
+        user.get("successful_referrals", 0),
+        user.get("bonus_downloads", DEFAULT_BONUS_DOWNLOADS),
+        json.dumps(user.get("achievements", {}), ensure_ascii=False),
+        user.get("last_interaction"),
+    ))
+    # الصيغة القديمة: قاموس كل الأيام -> آخر الأيام + مجاميع شهرية
+    legacy = user.get("daily_downloads")
+    if legacy:
+        cutoff = _history_cutoff()
+        monthly = {}
+        for day, count in legacy.items():
+            monthly[day[:7]] = monthly.get(day[:7], 0) + count
+        conn.executemany(SQL_UPSERT_DAILY, [(user_id, d, c) for d, c in legacy.items() if d > cutoff])
+        conn.executemany(SQL_UPSERT_MONTHLY, [(user_id, m, c) for m, c in monthly.items()])
+
+    for slot in user.get("recent_downloads") or []:
+        if slot[0]:
+            conn.execute(SQL_UPSERT_DAILY, (user_id, slot[0], slot[1]))
+    monthly = user.get("monthly_downloads") or {}
+    if monthly:
+        conn.executemany(SQL_UPSERT_MONTHLY, [(user_id, m, c) for m, c in monthly.items()])
+
+def migrate_from_json(json_path="temp_database.json", sqlite_path=None, journal_path=None, batch_size=1000):
+    """
+    ترحيل متدفق من JSON (اللقطة ثم سجل التغييرات) إلى SQLite
+    آمن لإعادة التشغيل: كل مستخدم يُكتب بـ INSERT OR REPLACE
+    """
+    journal_path = journal_path or os.path.splitext(json_path)[0] + ".journal"
+    conn = _connect(sqlite_path)
+    sources = []
+    if os.path.exists(json_path):
+        sources.append(_iter_snapshot(json_path))
+    sources.append(_iter_journal(journal_path + ".compacting"))
+    sources.append(_iter_journal(journal_path))
+
+    migrated = 0
+    pending = 0
+    try:
+        conn.execute("BEGIN")
+        for source in sources:
+            for kind, key, value in source:
+                if kind == "user":
+                    _write_user(conn, value)
+                    migrated += 1
+                else:
+                    conn.execute(SQL_SET_CONFIG, (key, json.dumps(value)))
+                pending += 1
+                if pending >= batch_size:
+                    conn.execute("COMMIT")
+                    conn.execute("BEGIN")
+                    pending = 0
+                    logger.info(f"📦 تم ترحيل {migrated} سجل مستخدم...")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    logger.info(f"✅ اكتمل الترحيل: {migrated} سجل مستخدم")
+    return migrated
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "migrate":
+        print(__doc__)
+        sys.exit(1)
+
+    args = sys.argv[2:]
+    migrate_from_json(
+        json_path=args[0] if len(args) > 0 else "temp_database.json",
+        sqlite_path=args[1] if len(args) > 1 else None,
+    )
@@ -0,0 +1,261 @@
+"""
+صيغة لقطة ثنائية مضغوطة لقاعدة بيانات JSON (database.py)
+
+البنية:
+    رأس: MAGIC (4 بايت) + الإصدار (1) + الترميز (1) + عدد المستخدمين (4)
+    ثم إطارات: طول (4 بايت) + محتوى - الإطار الأول للإعدادات ثم إطارات من FRAME_USERS مستخدم
+    الترميز: msgpack إن كانت الحزمة مثبتة، وإلا JSON مضغوط (بدون مسافات)
+
+التحويل للفحص والتصحيح:
+    python db_snapshot.py to-json temp_database.json.bin temp_database.json
+    python db_snapshot.py to-binary temp_database.json temp_database.json.bin
+
+قياس التحميل والحفظ مقارنة بـ JSON الحالي:
+    python db_snapshot.py bench [عدد المستخدمين]
+"""
+import gc
+import os
+import sys
+import json
+import time
+import struct
+from contextlib import contextmanager
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MAGIC = b"BTDB"
+VERSION = 1
+
+CODEC_MSGPACK = 1
+CODEC_JSON = 2
+
+# عدد المستخدمين في كل إطار: إطارات صغيرة تسمح بالقراءة المتدفقة، وكبيرة تقلل كلفة كل استدعاء
+FRAME_USERS = 1000
+
+_HEADER = struct.Struct(">4sBBI")
+_FRAME = struct.Struct(">I")
+
+def _codec_functions(codec):
+    """دوال الترميز وفك الترميز لكل نوع"""
+    if codec == CODEC_MSGPACK:
+        if msgpack is None:
+            raise RuntimeError("اللقطة مرمزة بـ msgpack لكن الحزمة غير مثبتة (pip install msgpack)")
+        return (
+            lambda obj: msgpack.packb(obj, use_bin_type=True),
+            lambda raw: msgpack.unpackb(raw, raw=False, strict_map_key=False),
+        )
+    if codec == CODEC_JSON:
+        return (
+            lambda obj: json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8'),
+            lambda raw: json.loads(raw),
+        )
+    raise ValueError(f"ترميز غير معروف: {codec}")
+
+@contextmanager
+def paused_gc():
+    """إيقاف جامع القمامة أثناء فك ترميز ملايين الكائنات (لا توجد دورات مرجعية هنا)"""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def default_codec():
+    return CODEC_MSGPACK if msgpack is not None else CODEC_JSON
+
+def is_snapshot(prefix: bytes):
+    """هل البيانات تبدأ برأس اللقطة الثنائية؟"""
+    return prefix[:len(MAGIC)] == MAGIC
+
+def is_snapshot_file(path):
+    if not os.path.exists(path):
+        return False
+    with open(path, 'rb') as f:
+        return is_snapshot(f.read(len(MAGIC)))
+
+def encode(users: dict, config: dict, codec: int = None):
+    """ترميز {معرف: قاموس مستخدم} والإعدادات إلى بايتات"""
+    codec = codec or default_codec()
+    pack, _ = _codec_functions(codec)
+    parts = [_HEADER.pack(MAGIC, VERSION, codec, len(users))]
+
+    def add_frame(obj):
+        payload = pack(obj)
+        parts.append(_FRAME.pack(len(payload)))
+        parts.append(payload)
+
+    add_frame(config)
+    items = list(users.items())
+    for start in range(0, len(items), FRAME_USERS):
+        add_frame(items[start:start + FRAME_USERS])
+    return b"".join(parts)
+
+def _read_header(header: bytes):
+    """التحقق من رأس اللقطة - يعيد نوع الترميز"""
+    if len(header) < _HEADER.size:
+        raise ValueError("ليست لقطة ثنائية")
+    magic, version, codec, _count = _HEADER.unpack_from(header, 0)
+    if magic != MAGIC:
+        raise ValueError("ليست لقطة ثنائية")
+    if version > VERSION:
+        raise ValueError(f"إصدار لقطة غير مدعوم: {version}")
+    return codec
+
+def _frame_records(codec, frames):
+    """السجلات من الإطارات: الإطار الأول للإعدادات ثم إطارات المستخدمين"""
+    _, unpack = _codec_functions(codec)
+    first = True
+    for payload in frames:
+        obj = unpack(payload)
+        if first:
+            first = False
+            for key, value in obj.items():
+                yield "config", key, value
+        else:
+            for uid, user in obj:
+                yield "user", uid, user
+
+def iter_records(raw: bytes):
+    """فك الترميز بشكل متدفق: ("config", مفتاح، قيمة) ثم ("user", معرف، قاموس)"""
+    codec = _read_header(raw)
+
+    def frames():
+        offset = _HEADER.size
+        while offset < len(raw):
+            (length,) = _FRAME.unpack_from(raw, offset)
+            offset += _FRAME.size
+            yield raw[offset:offset + length]
+            offset += length
+
+    yield from _frame_records(codec, frames())
+
+def iter_file_records(f):
+    """مثل iter_records لكن من ملف مفتوح إطاراً بإطار - الذاكرة بحجم إطار واحد وليس الملف كاملاً"""
+    codec = _read_header(f.read(_HEADER.size))
+
+    def frames():
+        while True:
+            prefix = f.read(_FRAME.size)
+            if not prefix:
+                return
+            if len(prefix) < _FRAME.size:
+                raise ValueError("لقطة مقطوعة")
+            (length,) = _FRAME.unpack(prefix)
+            payload = f.read(length)
+            if len(payload) < length:
+                raise ValueError("لقطة مقطوعة")
+            yield payload
+
+    yield from _frame_records(codec, frames())
+
+def decode(raw: bytes):
+    """فك ترميز اللقطة كاملة إلى {"users": {...}, "config": {...}}"""
+    data = {"users": {}, "config": {}}
+    for kind, key, value in iter_records(raw):
+        if kind == "config":
+            data["config"][key] = value
+        else:
+            data["users"][key] = value
+    return data
+
+def read_file(path):
+    """فك ترميز ملف لقطة كاملة بدون قراءة الملف في الذاكرة دفعة واحدة"""
+    data = {"users": {}, "config": {}}
+    with open(path, 'rb') as f:
+        for kind, key, value in iter_file_records(f):
+            if kind == "config":
+                data["config"][key] = value
+            else:
+                data["users"][key] = value
+    return data
+
+# ============ أدوات سطر الأوامر ============
+
+def to_json(src, dst):
+    """تحويل لقطة ثنائية إلى JSON مقروء"""
+    data = read_file(src)
+    with open(dst, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    print(f"✅ {src} -> {dst} ({len(data['users'])} مستخدم)")
+
+def to_binary(src, dst, codec=None):
+    """تحويل ملف JSON إلى لقطة ثنائية"""
+    with open(src, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    raw = encode(data.get("users", {}), data.get("config", {}), codec)
+    with open(dst, 'wb') as f:
+        f.write(raw)
+    print(f"✅ {src} -> {dst} ({len(data.get('users', {}))} مستخدم، {len(raw) / 1024 / 1024:.1f}MB)")
+
+def _synthetic_users(count):
+    """مستخدمون وهميون بنفس شكل UserRecord.to_dict"""
+    users = {}
+    for i in range(1, count + 1):
+        users[str(i)] = {
+            "user_id": i,
+            "username": f"user{i}",
+            "full_name": f"مستخدم تجريبي {i}",
+            "referral_code": f"REF{i:08d}",
+            "language": "ar" if i % 3 else "en",
+            "registration_date": "2025-01-01T12:00:00.000000",
+            "download_count": i % 97,
+            "recent_downloads": [[f"2025-06-0{d + 1}", d] for d in range(7)],
+            "monthly_downloads": {"2025-05": i % 40, "2025-06": i % 11},
+            "subscription_end": "2025-12-31T00:00:00" if i % 20 == 0 else None,
+            "is_lifetime_vip": i % 500 == 0,
+            "referred_by": i // 10 or None,
+            "referrals": list(range(i * 10, i * 10 + 10)) if i < count // 10 else [],
+            "successful_referrals": i % 7,
+            "bonus_downloads": 50,
+            "achievements": {},
+            "last_interaction": "2025-06-07T09:30:00.000000",
+        }
+    return users
+
+def _timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+def bench(count=100_000):
+    """مقارنة زمن الحفظ/التحميل والحجم بين JSON الحالي والصيغ المضغوطة"""
+    users = _synthetic_users(count)
+    config = {"logo_enabled": True}
+    data = {"users": users, "config": config}
+
+    formats = [
+        ("json indent=2", lambda: json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8'),
+         lambda raw: json.loads(raw)),
+        ("binary json", lambda: encode(users, config, CODEC_JSON), decode),
+    ]
+    if msgpack is not None:
+        formats.append(("binary msgpack", lambda: encode(users, config, CODEC_MSGPACK), decode))
+
+    print(f"📊 {count} مستخدم")
+    print(f"{'الصيغة':<16} {'الحجم MB':>10} {'حفظ s':>8} {'تحميل s':>8}")
+    results = {}
+    for name, save, load in formats:
+        raw, save_time = _timed(save)
+        with paused_gc():
+            loaded, load_time = _timed(lambda: load(raw))
+        assert len(loaded["users"]) == count
+        results[name] = {"size_mb": len(raw) / 1024 / 1024, "save_s": save_time, "load_s": load_time}
+        print(f"{name:<16} {len(raw) / 1024 / 1024:>10.1f} {save_time:>8.2f} {load_time:>8.2f}")
+    return results
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == "to-json" and len(sys.argv) == 4:
+        to_json(sys.argv[2], sys.argv[3])
+    elif command == "to-binary" and len(sys.argv) == 4:
+        to_binary(sys.argv[2], sys.argv[3])
+    elif command == "bench":
+        bench(int(sys.argv[2]) if len(sys.argv) > 2 else 100_000)
+    else:
+        print(__doc__)
+        sys.exit(1)
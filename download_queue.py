@@ -0,0 +1,153 @@
+"""
+طابور التحميلات: عدد محدود من التحميلات المتزامنة مع مسار أولوية لمشتركي VIP
+
+- DOWNLOAD_WORKERS تحميل يعمل في نفس الوقت، والباقي ينتظر في مسارين: VIP ومجاني
+- منع التجويع: بعد DOWNLOAD_VIP_BURST تحميلات VIP متتالية يأخذ المجاني دوراً،
+  وأي طلب مجاني انتظر أكثر من DOWNLOAD_FREE_MAX_WAIT ثانية يتقدم
+- الطابور محدود (DOWNLOAD_QUEUE_MAX): عند امتلائه يُرفض الطلب بـ QueueFull
+- كل الدوال تُستدعى من حلقة الأحداث فقط
+"""
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", 3))
+DOWNLOAD_QUEUE_MAX = int(os.getenv("DOWNLOAD_QUEUE_MAX", 100))
+DOWNLOAD_VIP_BURST = int(os.getenv("DOWNLOAD_VIP_BURST", 4))
+DOWNLOAD_FREE_MAX_WAIT = int(os.getenv("DOWNLOAD_FREE_MAX_WAIT", 120))
+
+# خيوط التحميل منفصلة عن المنفذ الافتراضي (التحليل وقاعدة البيانات) وبنفس عدد الأماكن
+executor = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix="download")
+
+class QueueFull(Exception):
+    """الطابور ممتلئ - يجب رفض الطلب"""
+
+class Ticket:
+    """طلب واحد في الطابور"""
+    __slots__ = ("vip", "future", "enqueued_at", "on_position", "position")
+
+    def __init__(self, vip, on_position):
+        self.vip = vip
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+        self.on_position = on_position
+        self.position = None
+
+_running = set()
+_vip_waiting = deque()
+_free_waiting = deque()
+_vip_streak = 0
+_stats = {"granted": 0, "rejected": 0, "max_wait_vip": 0.0, "max_wait_free": 0.0}
+
+def _free_turn(vip_left, free_head, streak, now):
+    """هل الدور للمجاني: لا يوجد VIP، أو انتظر طويلاً، أو أخذ VIP دفعته كاملة"""
+    return free_head is not None and (
+        not vip_left
+        or now - free_head.enqueued_at >= DOWNLOAD_FREE_MAX_WAIT
+        or streak >= DOWNLOAD_VIP_BURST
+    )
+
+def _pick_next():
+    """اختيار الطلب التالي: VIP أولاً مع دور مضمون للمجاني"""
+    global _vip_streak
+    free_head = _free_waiting[0] if _free_waiting else None
+    if _free_turn(len(_vip_waiting), free_head, _vip_streak, time.monotonic()):
+        _vip_streak = 0
+        return _free_waiting.popleft()
+    if _vip_waiting:
+        _vip_streak = _vip_streak + 1 if _free_waiting else 0
+        return _vip_waiting.popleft()
+    return None
+
+def _service_order():
+    """ترتيب الخدمة المتوقع لكل المنتظرين بنفس قواعد _pick_next"""
+    vip, free = list(_vip_waiting), list(_free_waiting)
+    streak, now = _vip_streak, time.monotonic()
+    order, vi, fi = [], 0, 0
+    while vi < len(vip) or fi < len(free):
+        free_head = free[fi] if fi < len(free) else None
+        if _free_turn(len(vip) - vi, free_head, streak, now):
+            streak = 0
+            order.append(free_head)
+            fi += 1
+        else:
+            streak = streak + 1 if free_head else 0
+            order.append(vip[vi])
+            vi += 1
+    return order
+
+def _grant(ticket: Ticket):
+    _running.add(ticket)
+    _stats["granted"] += 1
+    waited = time.monotonic() - ticket.enqueued_at
+    lane = "max_wait_vip" if ticket.vip else "max_wait_free"
+    _stats[lane] = max(_stats[lane], waited)
+    ticket.future.set_result(ticket)
+
+def _notify_positions():
+    """إعادة حساب ترتيب كل المنتظرين وإبلاغ من تغيّر ترتيبه فقط"""
+    for position, ticket in enumerate(_service_order(), start=1):
+        if ticket.on_position and position != ticket.position:
+            ticket.position = position
+            asyncio.get_running_loop().create_task(_safe_callback(ticket.on_position, position))
+
+async def _safe_callback(callback, position):
+    try:
+        await callback(position)
+    except Exception as e:
+        logger.warning(f"⚠️ فشل تحديث ترتيب الطابور: {e}")
+
+def _dispatch():
+    """منح الأماكن الفارغة ثم تحديث ترتيب المنتظرين"""
+    while len(_running) < DOWNLOAD_WORKERS:
+        ticket = _pick_next()
+        if ticket is None:
+            break
+        _grant(ticket)
+    _notify_positions()
+
+async def acquire(vip: bool, on_position=None):
+    """انتظار مكان للتحميل - يعيد Ticket يُمرَّر إلى release"""
+    if len(_vip_waiting) + len(_free_waiting) >= DOWNLOAD_QUEUE_MAX:
+        _stats["rejected"] += 1
+        raise QueueFull()
+    ticket = Ticket(vip, on_position)
+    (_vip_waiting if vip else _free_waiting).append(ticket)
+    if len(_running) < DOWNLOAD_WORKERS:
+        _dispatch()
+    else:
+        # طلب VIP جديد يؤخر المنتظرين في المسار المجاني - كل من تغيّر ترتيبه يُبلَّغ
+        _notify_positions()
+    try:
+        return await ticket.future
+    except asyncio.CancelledError:
+        # أُلغي الطلب أثناء الانتظار: حذفه من الطابور أو تحرير مكانه إن مُنح للتو
+        lane = _vip_waiting if vip else _free_waiting
+        if ticket in lane:
+            lane.remove(ticket)
+            _notify_positions()
+        else:
+            release(ticket)
+        raise
+
+def release(ticket: Ticket):
+    """تحرير مكان التحميل (None أو تحرير مكرر لا أثر له)"""
+    if ticket is None or ticket not in _running:
+        return
+    _running.discard(ticket)
+    _dispatch()
+
+def get_stats():
+    """عدد التحميلات الجارية والمنتظرة في كل مسار"""
+    return {
+        **_stats,
+        "workers": DOWNLOAD_WORKERS,
+        "running": len(_running),
+        "vip_waiting": len(_vip_waiting),
+        "free_waiting": len(_free_waiting),
+    }
@@ -35,19 +35,19 @@ async def show_account_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # معلومات المستخدم
-    username = user_data.get('username', 'N/A')
-    full_name = user_data.get('full_name', 'User')
-    registration_date = user_data.get('registration_date', datetime.now())
-    download_count = user_data.get('download_count', 0)
-    referral_code = user_data.get('referral_code', 'N/A')
-    referrals_count = len(user_data.get('referrals', []))
-    successful_referrals = user_data.get('successful_referrals', 0)
+    username = user_data.username or 'N/A'
+    full_name = user_data.full_name or 'User'
+    registration_date = user_data.registration_date or datetime.now()
+    download_count = user_data.download_count
+    referral_code = user_data.referral_code or 'N/A'
+    referrals_count = len(user_data.referrals)
+    successful_referrals = user_data.successful_referrals
     bonus_downloads = get_bonus_downloads(user_id)
     
     # حالة الاشتراك
     is_vip = is_subscribed(user_id)
-    is_lifetime = user_data.get('is_lifetime_vip', False)
-    subscription_end = user_data.get('subscription_end')
+    is_lifetime = user_data.is_lifetime_vip
+    subscription_end = user_data.subscription_end
     
     # التحميلات اليومية
     daily_downloads = get_daily_download_count(user_id)
@@ -8,17 +8,25 @@ from telegram.ext import (
     MessageHandler,
     filters,
 )
-from datetime import datetime, timedelta
+from datetime import datetime
 
 from database import (
     get_all_users,
     get_user,
+    get_user_by_username,
     add_subscription,
     is_admin,
     get_user_language,
-    get_total_downloads_count
+    get_total_downloads_count,
+    get_users_count,
+    get_activity_buffer_size,
+    wait_until_durable
 )
 from utils import get_message, escape_markdown
+import media_cache
+import info_cache
+import single_flight
+import download_queue
 
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -76,20 +84,29 @@ async def show_statistics(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    all_users = get_all_users()
-    total_users = len(all_users)
-    
-    vip_users = [u for u in all_users if u.get('subscription_end')]
-    total_vip = len(vip_users)
+    users_count = get_users_count()
+    total_users = users_count['total']
+    total_vip = users_count['vip']
     
     total_downloads = get_total_downloads_count()
+    cache_stats = media_cache.get_stats()
+    info_stats = info_cache.get_stats()
+    flight_stats = single_flight.get_stats()
+    queue_stats = download_queue.get_stats()
     
     stats_text = (
         "📊 **إحصائيات البوت**\n\n"
         f"👥 إجمالي المستخدمين: `{total_users}`\n"
         f"⭐ مشتركين VIP: `{total_vip}`\n"
         f"🆓 مستخدمين مجانيين: `{total_users - total_vip}`\n"
-        f"📥 إجمالي التحميلات: `{total_downloads}`\n\n"
+        f"📥 إجمالي التحميلات: `{total_downloads}`\n"
+        f"⏳ نشاطات بانتظار الحفظ: `{get_activity_buffer_size()}`\n"
+        f"⚡ كاش الملفات: `{cache_stats['entries']}` ملف، إصابة `{cache_stats['hit_rate']:.0%}` "
+        f"(`{cache_stats['hits']}`/`{cache_stats['hits'] + cache_stats['misses']}`)\n"
+        f"🔎 كاش التحليل: `{info_stats['entries']}` رابط، إصابة `{info_stats['hit_rate']:.0%}`\n"
+        f"🔗 تحميلات جارية: `{flight_stats['in_flight']}` (منتظرون عليها: `{flight_stats['followers']}`)\n"
+        f"🚦 الطابور: `{queue_stats['running']}`/`{queue_stats['workers']}` يعمل، "
+        f"بانتظار VIP `{queue_stats['vip_waiting']}` ومجاني `{queue_stats['free_waiting']}`\n\n"
         f"📅 التاريخ: {datetime.now().strftime('%Y-%m-%d %H:%M')}"
     )
     
@@ -143,12 +160,9 @@ async def receive_user_id(update: Update, context: ContextTypes.DEFAULT_TYPE):
         username = user_input.replace('@', '')  # إزالة @ إذا وجدت
         
         # البحث عن المستخدم بالـ username
-        all_users = get_all_users()
-        for user in all_users:
-            if user.get('username') == username:
-                user_id = user.get('user_id')
-                user_data = user
-                break
+        user_data = get_user_by_username(username)
+        if user_data:
+            user_id = user_data.user_id
         
         if not user_id:
             await update.message.reply_text(
@@ -182,8 +196,8 @@ async def receive_user_id(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     context.user_data['upgrade_target_id'] = user_id
     
-    user_name = user_data.get('full_name', 'غير معروف')
-    username = user_data.get('username', 'لا يوجد')
+    user_name = user_data.full_name or 'غير معروف'
+    username = user_data.username or 'لا يوجد'
     
     text = (
         f"✅ تم العثور على المستخدم:\n\n"
@@ -220,11 +234,14 @@ async def receive_days(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ حدث خطأ! أعد المحاولة.")
         return ConversationHandler.END
     
-    subscription_end = datetime.now() + timedelta(days=days)
-    
-    if add_subscription(user_id, subscription_end):
+    if add_subscription(user_id, days):
+        # الترقية مدفوعة - نتأكد من حفظها على القرص قبل تأكيدها
+        await wait_until_durable(timeout=10)
+        
         user_data = get_user(user_id)
-        user_name = user_data.get('full_name', 'المستخدم')
+        user_name = user_data.full_name or 'المستخدم'
+        # الاشتراك الساري يُمدد - تاريخ الانتهاء الفعلي من قاعدة البيانات
+        subscription_end = user_data.subscription_end
         
         success_text = (
             f"✅ تمت الترقية بنجاح!\n\n"
@@ -288,10 +305,10 @@ async def list_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
     users_text = "👥 قائمة المستخدمين (آخر 20)\n\n"
     
     for idx, user in enumerate(all_users[-20:], 1):
-        user_id = user.get('user_id')
-        name = user.get('full_name', 'غير معروف')[:20]
-        username = user.get('username', 'لا يوجد')
-        is_vip = "⭐" if user.get('subscription_end') else "🆓"
+        user_id = user.user_id
+        name = (user.full_name or 'غير معروف')[:20]
+        username = user.username or 'لا يوجد'
+        is_vip = "⭐" if user.subscription_end else "🆓"
         
         users_text += f"{idx}. {is_vip} {user_id} - {name}\n"
     
@@ -392,12 +409,12 @@ async def send_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     for user in all_users:
         try:
             await context.bot.send_message(
-                chat_id=user['user_id'],
+                chat_id=user.user_id,
                 text=message_text
             )
             success_count += 1
         except Exception as e:
-            logger.error(f"فشل إرسال لـ {user['user_id']}: {e}")
+            logger.error(f"فشل إرسال لـ {user.user_id}: {e}")
             failed_count += 1
     
     result_text = (
@@ -1,22 +1,28 @@
 import os
-import asyncio
+import uuid
 import time
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-import yt_dlp
 import logging
 
 from database import (
-    is_subscribed,
-    get_user,
     increment_download_count,
-    get_user_language,
-    is_admin,
-    get_daily_download_count,
-    get_bonus_downloads,
-    use_bonus_download
+    get_entitlements,
+    get_update_entitlements,
+    reserve_download,
+    get_reservation_kind,
+    commit_download,
+    release_download
 )
 from utils import get_message, clean_filename, get_config, format_file_size, format_duration
+import media_cache
+import info_cache
+import url_canonical
+import single_flight
+import download_queue
+import ytdlp_runner
+from progress_reporter import ProgressReporter
+import upload_stream
 
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -29,9 +35,9 @@ if not os.path.exists(VIDEO_PATH):
     os.makedirs(VIDEO_PATH)
 
 class DownloadProgressTracker:
-    """تتبع تقدم التحميل مع عداد نسبة مئوية"""
-    def __init__(self, message, lang):
-        self.message = message
+    """تتبع تقدم التحميل مع عداد نسبة مئوية - يُستدعى من خيط التحميل ويرسل عبر ProgressReporter"""
+    def __init__(self, reporter, lang):
+        self.reporter = reporter
         self.lang = lang
         self.last_update_time = 0
         self.last_percentage = -1
@@ -81,15 +87,20 @@ class DownloadProgressTracker:
                         f"⚡ {speed_text}"
                     )
                     
-                    try:
-                        loop = asyncio.get_event_loop()
-                        loop.create_task(self.message.edit_text(update_text))
-                    except:
-                        pass
+                    self.reporter.report(update_text)
                         
             except Exception as e:
                 logger.warning(f"خطأ في تحديث التقدم: {e}")
     
+    def upload_hook(self, sent, total):
+        """تقدم الرفع الحقيقي (البايتات المقروءة أثناء الإرسال)"""
+        percentage = int(sent * 100 / total)
+        self.reporter.report(
+            f"📤 جاري الرفع...\n\n"
+            f"{self._create_progress_bar(percentage)}\n\n"
+            f"📦 {sent / (1024 * 1024):.1f} / {total / (1024 * 1024):.1f} MB"
+        )
+    
     def _create_progress_bar(self, percentage):
         filled = int(percentage / 5)
         empty = 20 - filled
@@ -114,8 +125,8 @@ def is_adult_content(url: str, title: str = "") -> bool:
     
     return False
 
-async def send_log_to_channel(context: ContextTypes.DEFAULT_TYPE, user, video_info: dict, file_path: str):
-    """إرسال سجل التحميل إلى قناة اللوج"""
+async def send_log_to_channel(context: ContextTypes.DEFAULT_TYPE, user, video_info: dict, file_path: str, file_id: str = None):
+    """إرسال سجل التحميل إلى قناة اللوج (من الملف أو من file_id عند الإرسال من الكاش)"""
     if not LOG_CHANNEL_ID:
         return
 
@@ -142,26 +153,38 @@ async def send_log_to_channel(context: ContextTypes.DEFAULT_TYPE, user, video_in
     )
 
     try:
+        if file_id:
+            await context.bot.send_video(
+                chat_id=LOG_CHANNEL_ID,
+                video=file_id,
+                caption=log_caption[:1024]
+            )
+            return
         with open(file_path, 'rb') as video_file:
             await context.bot.send_video(
                 chat_id=LOG_CHANNEL_ID,
-                video=video_file,
+                video=upload_stream.media_source(context.bot, video_file),
                 caption=log_caption[:1024]
             )
     except Exception as e:
         logger.error(f"❌ فشل إرسال الفيديو إلى قناة السجل: {e}")
 
-async def show_quality_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, url: str, info_dict: dict):
+async def show_quality_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, url: str, info_dict: dict, reservation_id=None):
     """عرض قائمة اختيار الجودة - مبسطة"""
-    user_id = update.effective_user.id
-    lang = get_user_language(user_id)
+    lang = get_update_entitlements(update, context).language
     
     title = info_dict.get('title', 'فيديو')[:50]
     duration = format_duration(info_dict.get('duration', 0))
     
+    # رابط جديد يلغي الطلب السابق الذي لم تُختر جودته
+    previous = context.user_data.get('pending_download')
+    if previous:
+        release_download(previous.get('reservation'))
+    
     context.user_data['pending_download'] = {
         'url': url,
-        'info': info_dict
+        'info': info_dict,
+        'reservation': reservation_id
     }
     
     keyboard = [
@@ -197,21 +220,23 @@ async def handle_quality_selection(update: Update, context: ContextTypes.DEFAULT
     
     url = pending_data['url']
     info_dict = pending_data['info']
+    reservation_id = pending_data.get('reservation')
     
     del context.user_data['pending_download']
     
     await query.edit_message_text("⏳ جاري التحضير...")
     
-    await download_video_with_quality(update, context, url, info_dict, quality_choice)
+    await download_video_with_quality(update, context, url, info_dict, quality_choice, reservation_id)
 
 def get_ydl_opts_for_platform(url: str, quality: str = 'best'):
     """
     إعدادات yt-dlp محسّنة حسب المنصة
     """
     # تحديد المنصة
-    is_facebook = 'facebook.com' in url or 'fb.watch' in url or 'fb.com' in url
-    is_instagram = 'instagram.com' in url
-    is_tiktok = 'tiktok.com' in url
+    platform = url_canonical.detect_platform(url)
+    is_facebook = platform == 'facebook'
+    is_instagram = platform == 'instagram'
+    is_tiktok = platform == 'tiktok'
     
     # الجودة
     quality_formats = {
@@ -266,32 +291,174 @@ def get_ydl_opts_for_platform(url: str, quality: str = 'best'):
     
     return ydl_opts
 
-async def download_video_with_quality(update: Update, context: ContextTypes.DEFAULT_TYPE, url: str, info_dict: dict, quality: str):
+def build_caption(context: ContextTypes.DEFAULT_TYPE, info_dict: dict, is_audio: bool, is_subscribed_user: bool, file_size: int):
+    """نص وصف الفيديو/الصوت المرسل"""
+    title = info_dict.get('title', 'video')
+    duration = info_dict.get('duration', 0)
+    uploader = (info_dict.get('uploader') or 'Unknown')[:40]
+    return (
+        f"🎬 {title[:50]}\n\n"
+        f"👤 {uploader}\n"
+        f"⏱️ {format_duration(duration)} | 📦 {format_file_size(file_size)}\n"
+        f"{'🎵' if is_audio else '🎥'} {'💎 VIP' if is_subscribed_user else '🆓 مجاني'}\n\n"
+        f"✨ بواسطة @{context.bot.username}"
+    )[:1024]
+
+async def send_cached_media(update: Update, context: ContextTypes.DEFAULT_TYPE, cached: dict, caption: str, info_dict: dict):
+    """إعادة إرسال ملف سبق رفعه عبر file_id - يعيد الرسالة أو None إن لم يعد صالحاً"""
+    try:
+        if cached['kind'] == 'audio':
+            return await context.bot.send_audio(
+                chat_id=update.effective_chat.id,
+                audio=cached['file_id'],
+                caption=caption,
+                reply_to_message_id=update.effective_message.message_id
+            )
+        return await context.bot.send_video(
+            chat_id=update.effective_chat.id,
+            video=cached['file_id'],
+            caption=caption,
+            reply_to_message_id=update.effective_message.message_id,
+            supports_streaming=True,
+            duration=info_dict.get('duration')
+        )
+    except Exception as e:
+        logger.warning(f"⚠️ file_id من الكاش غير صالح، سيتم التحميل من جديد: {e}")
+        return None
+
+def _sent_file_id(message):
+    """file_id من رسالة الفيديو/الصوت المرسلة"""
+    media = message and (message.video or message.audio or message.document)
+    return media.file_id if media else None
+
+async def finish_delivery(update: Update, context: ContextTypes.DEFAULT_TYPE, entitlements, reservation_id):
+    """بعد الإرسال: تأكيد حجز الحصة وإبلاغ المستخدم المجاني بالمتبقي"""
+    is_limited = not entitlements.is_admin and not entitlements.is_vip
+    # تأكيد الحجز؛ إن انتهت صلاحيته (None) يُحتسب التحميل مباشرة كما في السابق
+    if commit_download(reservation_id) is None and is_limited:
+        increment_download_count(entitlements.user_id)
+    
+    if is_limited:
+        # قراءة بعد التأكيد: تحميلات المستخدم المتزامنة تغيّر العدد عن اللقطة الأولى
+        remaining = FREE_USER_DOWNLOAD_LIMIT - get_entitlements(entitlements.user_id).daily_downloads
+        if remaining > 0:
+            await context.bot.send_message(
+                chat_id=update.effective_chat.id,
+                text=f"ℹ️ تبقى لك {remaining} تحميلات مجانية اليوم"
+            )
+
+async def follow_flight(update: Update, context: ContextTypes.DEFAULT_TYPE, flight, processing_message, url: str, info_dict: dict, quality: str, entitlements, reservation_id):
+    """نفس الفيديو قيد التحميل لمستخدم آخر: متابعة تقدمه ثم إرسال نفس الملف عبر file_id"""
+    user = update.callback_query.from_user if update.callback_query else update.message.from_user
+    is_audio = quality == 'audio'
+    flight.listeners.append(processing_message)
+    
+    try:
+        try:
+            result = await single_flight.wait(flight)
+        except single_flight.FlightAbandoned:
+            # أُرسل الملف للقائد بدون file_id يمكن مشاركته: تحميل مستقل لهذا المستخدم
+            flight.listeners.remove(processing_message)
+            try:
+                await processing_message.delete()
+            except:
+                pass
+            await download_video_with_quality(update, context, url, info_dict, quality, reservation_id)
+            return
+        
+        caption = build_caption(context, info_dict, is_audio, entitlements.is_vip, result['file_size'])
+        if not await send_cached_media(update, context, result, caption, info_dict):
+            raise Exception("فشل إرسال الملف المشترك")
+        
+        try:
+            await processing_message.delete()
+        except:
+            pass
+        
+        await finish_delivery(update, context, entitlements, reservation_id)
+        if result['kind'] == 'video':
+            await send_log_to_channel(context, user, info_dict, None, file_id=result['file_id'])
+    
+    except single_flight.FlightFailed as e:
+        logger.error(f"❌ فشل التحميل المشترك: {e}")
+        if isinstance(e.__cause__, download_queue.QueueFull):
+            error_text = "⏳ البوت مشغول جداً الآن! حاول مرة أخرى بعد دقائق."
+        else:
+            error_text = "❌ فشل التحميل!\n\nتأكد من أن الرابط صحيح ويمكن الوصول إليه."
+        try:
+            await processing_message.edit_text(error_text)
+        except:
+            pass
+    
+    except Exception as e:
+        logger.error(f"❌ فشل التحميل المشترك: {e}")
+        try:
+            await processing_message.edit_text("❌ فشل التحميل!\n\nتأكد من أن الرابط صحيح ويمكن الوصول إليه.")
+        except:
+            pass
+    
+    finally:
+        if processing_message in flight.listeners:
+            flight.listeners.remove(processing_message)
+        release_download(reservation_id)
+
+async def download_video_with_quality(update: Update, context: ContextTypes.DEFAULT_TYPE, url: str, info_dict: dict, quality: str, reservation_id=None):
     """تحميل الفيديو بالجودة المختارة"""
     
     user = update.callback_query.from_user if update.callback_query else update.message.from_user
-    user_id = user.id
-    lang = get_user_language(user_id)
+    entitlements = get_update_entitlements(update, context)
+    lang = entitlements.language
     
-    is_user_admin = is_admin(user_id)
-    is_subscribed_user = is_subscribed(user_id)
+    is_user_admin = entitlements.is_admin
+    is_subscribed_user = entitlements.is_vip
     
     from database import is_logo_enabled
     logo_enabled = is_logo_enabled()
     config = get_config()
     
+    is_audio = quality == 'audio'
+    logo_path = config.get("LOGO_PATH")
+    apply_logo = bool(
+        not is_audio and logo_enabled and not is_subscribed_user and not is_user_admin
+        and logo_path and os.path.exists(logo_path)
+    )
+    
+    # نفس المحتوى بنفس الجودة والعلامة المائية سبق رفعه: إعادة الإرسال بـ file_id بدون تحميل
+    content_key = url_canonical.content_key_from_info(info_dict, url)
+    variant = media_cache.watermark_variant(logo_path) if apply_logo else "clean"
+    cached = media_cache.get(content_key, quality, variant)
+    if cached:
+        caption = build_caption(context, info_dict, is_audio, is_subscribed_user, cached['file_size'])
+        if await send_cached_media(update, context, cached, caption, info_dict):
+            logger.info(f"⚡ إرسال من الكاش: {content_key} ({quality})")
+            try:
+                await finish_delivery(update, context, entitlements, reservation_id)
+                if cached['kind'] == 'video':
+                    await send_log_to_channel(context, user, info_dict, None, file_id=cached['file_id'])
+            finally:
+                release_download(reservation_id)
+            return
+        media_cache.invalidate(content_key, quality, variant)
+    
     processing_message = await context.bot.send_message(
         chat_id=update.effective_chat.id,
         text="📥 جاري التحميل...\n\n⬜⬜⬜⬜⬜⬜⬜⬜⬜⬜⬜⬜⬜⬜⬜⬜⬜⬜⬜⬜ 0%"
     )
     
+    # نفس الفيديو قيد التحميل الآن: الانضمام للتحميل الجاري بدل تحميل ثانٍ
+    flight, is_leader = single_flight.join((content_key, quality, variant))
+    if not is_leader:
+        await follow_flight(update, context, flight, processing_message, url, info_dict, quality, entitlements, reservation_id)
+        return
+    flight.listeners.append(processing_message)
+    
     title = info_dict.get('title', 'video')
     safe_title = clean_filename(title)[:50]
     
-    is_audio = quality == 'audio'
     ext = 'mp3' if is_audio else 'mp4'
     
-    output_filename = f"{safe_title}.{ext}"
+    # اسم فريد لكل تحميل حتى لا تتصادم ملفات الطلبات المتزامنة
+    output_filename = f"{safe_title}_{uuid.uuid4().hex[:8]}.{ext}"
     output_path = os.path.join(VIDEO_PATH, output_filename)
     
     ydl_opts = get_ydl_opts_for_platform(url, quality)
@@ -315,18 +482,23 @@ async def download_video_with_quality(update: Update, context: ContextTypes.DEFA
             'preferedformat': 'mp4',
         })
     
-    # إضافة progress hook
-    progress_tracker = DownloadProgressTracker(processing_message, lang)
-    ydl_opts['progress_hooks'] = [progress_tracker.progress_hook]
+    # تحديثات التقدم لكل المنتظرين: آخر حالة فقط وضمن ميزانية التعديلات العامة
+    progress = ProgressReporter(flight.listeners)
+    progress_tracker = DownloadProgressTracker(progress, lang)
     
     new_filepath = None
     temp_watermarked_path = None
+    ticket = None
+    
+    async def show_queue_position(position):
+        lane_text = "💎 أولوية VIP" if is_user_admin or is_subscribed_user else "⭐ اشترك في VIP لتجاوز الانتظار"
+        progress.report(f"⏳ في قائمة الانتظار - ترتيبك: {position}\n\n{lane_text}")
     
     try:
-        loop = asyncio.get_event_loop()
+        # انتظار مكان في طابور التحميل (مسار VIP له الأولوية)
+        ticket = await download_queue.acquire(is_user_admin or is_subscribed_user, show_queue_position)
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            await loop.run_in_executor(None, lambda: ydl.download([url]))
+        await ytdlp_runner.download(url, ydl_opts, info_dict, progress_tracker.progress_hook)
         
         # البحث عن الملف الناتج
         possible_extensions = ['mp3', 'mp4', 'webm', 'm4a', 'mkv']
@@ -341,10 +513,9 @@ async def download_video_with_quality(update: Update, context: ContextTypes.DEFA
         
         logger.info(f"✅ تم التحميل: {new_filepath}")
         
-        logo_path = config.get("LOGO_PATH")
         final_video_path = new_filepath
         
-        if not is_audio and logo_enabled and not is_subscribed_user and not is_user_admin and logo_path and os.path.exists(logo_path):
+        if apply_logo:
             from utils import apply_animated_watermark
             
             temp_watermarked_path = new_filepath.replace(f".{ext}", f"_watermarked.{ext}")
@@ -357,55 +528,35 @@ async def download_video_with_quality(update: Update, context: ContextTypes.DEFA
         file_size = os.path.getsize(final_video_path)
         total_mb = file_size / (1024 * 1024)
         
-        await processing_message.edit_text(
+        progress.report(
             f"📤 جاري الرفع...\n\n"
             f"⬜⬜⬜⬜⬜⬜⬜⬜⬜⬜⬜⬜⬜⬜⬜⬜⬜⬜⬜⬜ 0%\n\n"
             f"📦 الحجم: {total_mb:.1f} MB"
         )
         
         if file_size > 2 * 1024 * 1024 * 1024:
+            await progress.aclose()
             await processing_message.edit_text("❌ الملف كبير جداً! (أكثر من 2GB)")
+            single_flight.finish(flight, error=Exception("الملف كبير جداً"))
             return
         
         duration = info_dict.get('duration', 0)
-        uploader = info_dict.get('uploader', 'Unknown')[:40]
-        
-        caption_text = (
-            f"🎬 {title[:50]}\n\n"
-            f"👤 {uploader}\n"
-            f"⏱️ {format_duration(duration)} | 📦 {format_file_size(file_size)}\n"
-            f"{'🎵' if is_audio else '🎥'} {'💎 VIP' if is_subscribed_user else '🆓 مجاني'}\n\n"
-            f"✨ بواسطة @{context.bot.username}"
-        )
-        
-        # محاكاة تقدم الرفع
-        for progress in [25, 50, 75]:
-            await asyncio.sleep(0.3)
-            filled = int(progress / 5)
-            empty = 20 - filled
-            bar = f"{'🟩' * filled}{'⬜' * empty}"
-            
-            try:
-                await processing_message.edit_text(
-                    f"📤 جاري الرفع...\n\n"
-                    f"{bar} {progress}%\n\n"
-                    f"📦 الحجم: {total_mb:.1f} MB"
-                )
-            except:
-                pass
+        caption_text = build_caption(context, info_dict, is_audio, is_subscribed_user, file_size)
         
         with open(final_video_path, 'rb') as file:
+            # رفع متدفق: التقدم من البايتات المرسلة فعلاً
+            upload = upload_stream.media_source(context.bot, file, progress_tracker.upload_hook)
             if is_audio:
-                await context.bot.send_audio(
+                sent_message = await context.bot.send_audio(
                     chat_id=update.effective_chat.id,
-                    audio=file,
+                    audio=upload,
                     caption=caption_text[:1024],
                     reply_to_message_id=update.effective_message.message_id
                 )
             else:
                 sent_message = await context.bot.send_video(
                     chat_id=update.effective_chat.id,
-                    video=file,
+                    video=upload,
                     caption=caption_text[:1024],
                     reply_to_message_id=update.effective_message.message_id,
                     supports_streaming=True,
@@ -422,25 +573,43 @@ async def download_video_with_quality(update: Update, context: ContextTypes.DEFA
                         logger.error(f"❌ فشل التوجيه: {e}")
         
         logger.info(f"✅ تم الإرسال بنجاح")
+        await progress.aclose()
+        
+        file_id = _sent_file_id(sent_message)
+        if file_id:
+            kind = 'audio' if is_audio else 'video'
+            media_cache.put(content_key, quality, variant, file_id, kind, file_size, info_dict)
+            # المنتظرون على نفس التحميل يستلمون نفس الملف
+            single_flight.finish(flight, {'file_id': file_id, 'kind': kind, 'file_size': file_size})
+        else:
+            # لا file_id للمشاركة: المنتظرون يحمّلون بأنفسهم بدل استلام خطأ
+            single_flight.abandon(flight)
         
         try:
             await processing_message.delete()
         except:
             pass
         
-        if not is_user_admin and not is_subscribed_user:
-            increment_download_count(user_id)
-            remaining = FREE_USER_DOWNLOAD_LIMIT - get_daily_download_count(user_id)
-            if remaining > 0:
-                await context.bot.send_message(
-                    chat_id=update.effective_chat.id,
-                    text=f"ℹ️ تبقى لك {remaining} تحميلات مجانية اليوم"
-                )
+        await finish_delivery(update, context, entitlements, reservation_id)
         
-        await send_log_to_channel(context, user, info_dict, final_video_path)
+        # الفيديو مرفوع بالفعل: السجل يُرسل بـ file_id بدلاً من رفع الملف مرة ثانية
+        log_file_id = file_id if not is_audio else None
+        await send_log_to_channel(context, user, info_dict, final_video_path, file_id=log_file_id)
         
+    except download_queue.QueueFull as e:
+        logger.warning("⚠️ طابور التحميل ممتلئ - تم رفض الطلب")
+        await progress.aclose()
+        # المنتظرون يعرضون نفس الرسالة من الخطأ المشترك
+        single_flight.finish(flight, error=e)
+        try:
+            await processing_message.edit_text("⏳ البوت مشغول جداً الآن! حاول مرة أخرى بعد دقائق.")
+        except:
+            pass
+    
     except Exception as e:
         logger.error(f"❌ خطأ: {e}", exc_info=True)
+        await progress.aclose()
+        single_flight.finish(flight, error=e)
         error_text = f"❌ فشل التحميل!\n\nتأكد من أن الرابط صحيح ويمكن الوصول إليه."
         
         try:
@@ -452,6 +621,10 @@ async def download_video_with_quality(update: Update, context: ContextTypes.DEFA
             )
     
     finally:
+        # فشل التحميل: إعادة الحصة المحجوزة (لا أثر بعد التأكيد)
+        release_download(reservation_id)
+        download_queue.release(ticket)
+        single_flight.finish(flight)
         for filepath in [new_filepath, temp_watermarked_path]:
             if filepath and os.path.exists(filepath):
                 try:
@@ -464,137 +637,154 @@ async def handle_download(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """معالج تحميل الفيديوهات - يدعم جميع المنصات مع نظام البونص"""
     user = update.message.from_user
     user_id = user.id
-    url = update.message.text.strip()
-    lang = get_user_language(user_id)
-    user_data = get_user(user_id)
+    entitlements = get_update_entitlements(update, context)
+    lang = entitlements.language
     
-    if not user_data:
+    if not entitlements.exists:
         await update.message.reply_text("❌ لم يتم العثور على بياناتك. الرجاء إرسال /start")
         return
+    
+    # توحيد الرابط (مع تتبع الروابط المختصرة): نفس الفيديو بأي شكل يصل لنفس الكاش
+    # canonical.key للكاش فقط؛ yt-dlp يستلم رابط المستخدم بدون معاملات التتبع (list=، index= ...)
+    canonical = await url_canonical.canonicalize_async(update.message.text)
+    url = canonical.source
 
-    is_user_admin = is_admin(user_id)
-    is_subscribed_user = is_subscribed(user_id)
+    is_user_admin = entitlements.is_admin
+    is_subscribed_user = entitlements.is_vip
     config = get_config()
     
     if is_adult_content(url):
         await update.message.reply_text("🚫 محتوى محظور! هذا الموقع محظور.")
         return
     
+    # حجز تحميل من الحصة اليومية أو الرصيد الإضافي قبل التحليل (روابط متزامنة لا تتجاوز الحد)
+    reservation_id = reserve_download(
+        user_id, FREE_USER_DOWNLOAD_LIMIT,
+        allow_bonus=context.user_data.get('use_bonus_approved', False)
+    )
+    
     # التحقق من الحد اليومي مع نظام البونص
-    if not is_user_admin and not is_subscribed_user:
-        daily_count = get_daily_download_count(user_id)
-        bonus_downloads = get_bonus_downloads(user_id)
+    if reservation_id is None:
+        bonus_downloads = entitlements.bonus_downloads
         
-        if daily_count >= FREE_USER_DOWNLOAD_LIMIT:
-            # وصل للحد اليومي - التحقق من البونص
-            if context.user_data.get('use_bonus_approved'):
-                # تم الموافقة - استخدام البونص
-                if use_bonus_download(user_id):
-                    remaining = get_bonus_downloads(user_id)
-                    await update.message.reply_text(
-                        f"✅ تم استخدام تحميل من رصيدك الإضافي!\n"
-                        f"المتبقي: {remaining} تحميل 💎"
-                    )
-                    context.user_data['use_bonus_approved'] = False
-                    # المتابعة للتحميل
-                else:
-                    await update.message.reply_text("❌ فشل استخدام البونص!")
-                    return
-            elif bonus_downloads > 0:
-                # لديه رصيد إضافي - عرض خيار الاستخدام
-                keyboard = [
-                    [InlineKeyboardButton(
-                        f"💎 استخدام رصيد إضافي ({bonus_downloads} متبقي)",
-                        callback_data="use_bonus"
-                    )],
-                    [InlineKeyboardButton(
-                        "⭐ اشترك في VIP",
-                        callback_data="subscription_menu"
-                    )],
-                    [InlineKeyboardButton(
-                        "👥 ادعو أصدقاء (+10/صديق)",
-                        callback_data="referral_menu"
-                    )]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                if lang == 'ar':
-                    text = (
-                        f"⚠️ لقد وصلت للحد اليومي ({FREE_USER_DOWNLOAD_LIMIT} فيديوهات)!\n\n"
-                        f"💎 لديك {bonus_downloads} تحميل إضافي\n\n"
-                        f"💡 يمكنك:\n"
-                        f"• استخدام رصيدك الإضافي\n"
-                        f"• الاشتراك في VIP للتحميلات غير المحدودة\n"
-                        f"• دعوة أصدقاء للحصول على +10 تحميلات لكل صديق"
-                    )
-                else:
-                    text = (
-                        f"⚠️ Daily limit reached ({FREE_USER_DOWNLOAD_LIMIT} videos)!\n\n"
-                        f"💎 You have {bonus_downloads} bonus downloads\n\n"
-                        f"💡 You can:\n"
-                        f"• Use your bonus downloads\n"
-                        f"• Subscribe to VIP for unlimited downloads\n"
-                        f"• Invite friends to get +10 downloads per friend"
-                    )
-                
-                await update.message.reply_text(text, reply_markup=reply_markup)
-                context.user_data['pending_download_url'] = url
-                return
+        if context.user_data.get('use_bonus_approved'):
+            # تمت الموافقة لكن الرصيد محجوز بالكامل لتحميلات أخرى
+            await update.message.reply_text("❌ فشل استخدام البونص!")
+            return
+        elif bonus_downloads > 0:
+            # لديه رصيد إضافي - عرض خيار الاستخدام
+            keyboard = [
+                [InlineKeyboardButton(
+                    f"💎 استخدام رصيد إضافي ({bonus_downloads} متبقي)",
+                    callback_data="use_bonus"
+                )],
+                [InlineKeyboardButton(
+                    "⭐ اشترك في VIP",
+                    callback_data="subscription_menu"
+                )],
+                [InlineKeyboardButton(
+                    "👥 ادعو أصدقاء (+10/صديق)",
+                    callback_data="referral_menu"
+                )]
+            ]
+            reply_markup = InlineKeyboardMarkup(keyboard)
+            
+            if lang == 'ar':
+                text = (
+                    f"⚠️ لقد وصلت للحد اليومي ({FREE_USER_DOWNLOAD_LIMIT} فيديوهات)!\n\n"
+                    f"💎 لديك {bonus_downloads} تحميل إضافي\n\n"
+                    f"💡 يمكنك:\n"
+                    f"• استخدام رصيدك الإضافي\n"
+                    f"• الاشتراك في VIP للتحميلات غير المحدودة\n"
+                    f"• دعوة أصدقاء للحصول على +10 تحميلات لكل صديق"
+                )
             else:
-                # ليس لديه رصيد إضافي
-                keyboard = [
-                    [InlineKeyboardButton(
-                        "⭐ اشترك في VIP",
-                        callback_data="subscription_menu"
-                    )],
-                    [InlineKeyboardButton(
-                        "👥 ادعو أصدقاء (+10/صديق)",
-                        callback_data="referral_menu"
-                    )]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                if lang == 'ar':
-                    text = (
-                        f"🚫 وصلت للحد اليومي ({FREE_USER_DOWNLOAD_LIMIT} فيديوهات)!\n\n"
-                        f"💡 يمكنك:\n"
-                        f"• الانتظار حتى الغد 🕐\n"
-                        f"• الاشتراك في VIP للتحميلات غير المحدودة ⭐\n"
-                        f"• دعوة أصدقائك للحصول على +10 تحميلات لكل صديق 👥"
-                    )
-                else:
-                    text = (
-                        f"🚫 Daily limit reached ({FREE_USER_DOWNLOAD_LIMIT} videos)!\n\n"
-                        f"💡 You can:\n"
-                        f"• Wait until tomorrow 🕐\n"
-                        f"• Subscribe to VIP for unlimited downloads ⭐\n"
-                        f"• Invite friends to get +10 downloads per friend 👥"
-                    )
-                
-                await update.message.reply_text(text, reply_markup=reply_markup)
-                return
+                text = (
+                    f"⚠️ Daily limit reached ({FREE_USER_DOWNLOAD_LIMIT} videos)!\n\n"
+                    f"💎 You have {bonus_downloads} bonus downloads\n\n"
+                    f"💡 You can:\n"
+                    f"• Use your bonus downloads\n"
+                    f"• Subscribe to VIP for unlimited downloads\n"
+                    f"• Invite friends to get +10 downloads per friend"
+                )
+            
+            await update.message.reply_text(text, reply_markup=reply_markup)
+            context.user_data['pending_download_url'] = url
+            return
+        else:
+            # ليس لديه رصيد إضافي
+            keyboard = [
+                [InlineKeyboardButton(
+                    "⭐ اشترك في VIP",
+                    callback_data="subscription_menu"
+                )],
+                [InlineKeyboardButton(
+                    "👥 ادعو أصدقاء (+10/صديق)",
+                    callback_data="referral_menu"
+                )]
+            ]
+            reply_markup = InlineKeyboardMarkup(keyboard)
+            
+            if lang == 'ar':
+                text = (
+                    f"🚫 وصلت للحد اليومي ({FREE_USER_DOWNLOAD_LIMIT} فيديوهات)!\n\n"
+                    f"💡 يمكنك:\n"
+                    f"• الانتظار حتى الغد 🕐\n"
+                    f"• الاشتراك في VIP للتحميلات غير المحدودة ⭐\n"
+                    f"• دعوة أصدقائك للحصول على +10 تحميلات لكل صديق 👥"
+                )
+            else:
+                text = (
+                    f"🚫 Daily limit reached ({FREE_USER_DOWNLOAD_LIMIT} videos)!\n\n"
+                    f"💡 You can:\n"
+                    f"• Wait until tomorrow 🕐\n"
+                    f"• Subscribe to VIP for unlimited downloads ⭐\n"
+                    f"• Invite friends to get +10 downloads per friend 👥"
+                )
+            
+            await update.message.reply_text(text, reply_markup=reply_markup)
+            return
+    elif get_reservation_kind(reservation_id) == "bonus":
+        # تم الموافقة - الرصيد يُخصم عند اكتمال التحميل
+        remaining = entitlements.bonus_downloads - 1
+        await update.message.reply_text(
+            f"✅ تم استخدام تحميل من رصيدك الإضافي!\n"
+            f"المتبقي: {remaining} تحميل 💎"
+        )
+        context.user_data['use_bonus_approved'] = False
     
     processing_message = await update.message.reply_text("🔍 جاري التحليل...")
     
+    # رابط حُلّل مؤخراً أو سبق رفعه: النتيجة المحفوظة تكفي لقائمة الجودة بدون yt-dlp
+    cached_info = info_cache.get(canonical.key)
+    if not cached_info and canonical.content_id:
+        cached_info = media_cache.get_info(canonical.key)
+    
     try:
-        # إعدادات التحليل
-        ydl_opts = get_ydl_opts_for_platform(url)
-        ydl_opts['skip_download'] = True  # فقط للتحليل
-        
-        loop = asyncio.get_event_loop()
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info_dict = await loop.run_in_executor(None, lambda: ydl.extract_info(url, download=False))
+        if cached_info:
+            info_dict = cached_info
+            logger.info(f"⚡ تحليل من الكاش: {canonical.key}")
+        else:
+            # إعدادات التحليل
+            ydl_opts = get_ydl_opts_for_platform(url)
+            ydl_opts['skip_download'] = True  # فقط للتحليل
+            
+            info_dict = await ytdlp_runner.extract_info(url, ydl_opts)
+            
+            if not info_dict.get('is_live'):
+                info_cache.put(canonical.key, canonical.platform, info_dict)
         
         title = info_dict.get('title', 'فيديو')
         duration = info_dict.get('duration', 0)
         
         if is_adult_content(url, title):
+            release_download(reservation_id)
             await processing_message.edit_text("🚫 محتوى محظور!")
             return
         
         max_free_duration = config.get("MAX_FREE_DURATION", 600)
         if not is_user_admin and not is_subscribed_user and duration and duration > max_free_duration:
+            release_download(reservation_id)
             keyboard = [[InlineKeyboardButton(
                 "⭐ اشترك الآن",
                 url="https://t.me/YourChannelHere"
@@ -608,10 +798,11 @@ async def handle_download(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         await processing_message.delete()
         
-        await show_quality_menu(update, context, url, info_dict)
+        await show_quality_menu(update, context, url, info_dict, reservation_id)
         
     except Exception as e:
         logger.error(f"❌ خطأ في التحليل: {e}", exc_info=True)
+        release_download(reservation_id)
         error_msg = str(e)
         
         # رسائل خطأ مخصصة
@@ -646,8 +837,7 @@ async def handle_use_bonus_callback(update: Update, context: ContextTypes.DEFAUL
     query = update.callback_query
     await query.answer()
     
-    user_id = query.from_user.id
-    lang = get_user_language(user_id)
+    lang = get_update_entitlements(update, context).language
     
     # تفعيل علامة استخدام البونص
     context.user_data['use_bonus_approved'] = True
@@ -5,9 +5,14 @@ from telegram.ext import ContextTypes
 from database import (
     get_user,
     get_user_language,
-    get_all_users
+    get_all_users,
+    get_top_referrers,
+    get_referrer_rank,
+    get_referrers_count
 )
 
+LEADERBOARD_SIZE = 10
+
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -28,13 +33,13 @@ async def show_referral_menu(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
     
     # معلومات الإحالة
-    referral_code = user_data.get('referral_code', 'N/A')
+    referral_code = user_data.referral_code or 'N/A'
     bot_username = context.bot.username
     referral_link = f"https://t.me/{bot_username}?start={referral_code}"
     
-    referrals_count = len(user_data.get('referrals', []))
-    successful_referrals = user_data.get('successful_referrals', 0)
-    bonus_downloads = user_data.get('bonus_downloads', 0)
+    referrals_count = len(user_data.referrals)
+    successful_referrals = user_data.successful_referrals
+    bonus_downloads = user_data.bonus_downloads
     
     # بناء الرسالة
     if lang == 'ar':
@@ -68,6 +73,7 @@ async def show_referral_menu(update: Update, context: ContextTypes.DEFAULT_TYPE)
         keyboard = [
             [InlineKeyboardButton("👥 قائمة الأصدقاء", callback_data='ref_friends_list')],
             [InlineKeyboardButton("🏆 إنجازاتي", callback_data='ref_achievements')],
+            [InlineKeyboardButton("🥇 لوحة المتصدرين", callback_data='ref_leaderboard')],
             [InlineKeyboardButton("🔙 العودة", callback_data='main_menu')],
         ]
     else:
@@ -101,6 +107,7 @@ async def show_referral_menu(update: Update, context: ContextTypes.DEFAULT_TYPE)
         keyboard = [
             [InlineKeyboardButton("👥 Friends List", callback_data='ref_friends_list')],
             [InlineKeyboardButton("🏆 My Achievements", callback_data='ref_achievements')],
+            [InlineKeyboardButton("🥇 Leaderboard", callback_data='ref_leaderboard')],
             [InlineKeyboardButton("🔙 Back", callback_data='main_menu')],
         ]
     
@@ -124,7 +131,7 @@ async def show_friends_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not user_data:
         return
     
-    referrals = user_data.get('referrals', [])
+    referrals = user_data.referrals
     
     if not referrals:
         if lang == 'ar':
@@ -149,9 +156,9 @@ async def show_friends_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
         for idx, ref_id in enumerate(referrals[:20], 1):
             ref_user = get_user(ref_id)
             if ref_user:
-                username = ref_user.get('username', 'N/A')
-                full_name = ref_user.get('full_name', 'User')
-                download_count = ref_user.get('download_count', 0)
+                username = ref_user.username or 'N/A'
+                full_name = ref_user.full_name or 'User'
+                download_count = ref_user.download_count
                 
                 # حالة الإحالة
                 if download_count >= 10:
@@ -189,9 +196,9 @@ async def show_achievements(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not user_data:
         return
     
-    successful_referrals = user_data.get('successful_referrals', 0)
-    achievements = user_data.get('achievements', {})
-    is_lifetime_vip = user_data.get('is_lifetime_vip', False)
+    successful_referrals = user_data.successful_referrals
+    achievements = user_data.achievements
+    is_lifetime_vip = user_data.is_lifetime_vip
     
     if lang == 'ar':
         text = (
@@ -263,6 +270,55 @@ async def show_achievements(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode='Markdown'
     )
 
+async def show_leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """عرض لوحة المتصدرين في الإحالات"""
+    query = update.callback_query
+    await query.answer()
+    
+    user_id = query.from_user.id
+    lang = get_user_language(user_id)
+    
+    top_referrers = get_top_referrers(LEADERBOARD_SIZE)
+    my_rank = get_referrer_rank(user_id)
+    total_referrers = get_referrers_count()
+    
+    medals = {1: "🥇", 2: "🥈", 3: "🥉"}
+    
+    if lang == 'ar':
+        text = "🥇 لوحة المتصدرين\n\n"
+        empty_text = "لا يوجد محيلون بعد - كن الأول! 🚀"
+        no_rank_text = "📍 ترتيبك: لم تحصل على إحالة ناجحة بعد"
+        rank_text = "📍 ترتيبك: #{rank} من {total}"
+        back_text = "🔙 العودة"
+    else:
+        text = "🥇 Leaderboard\n\n"
+        empty_text = "No referrers yet - be the first! 🚀"
+        no_rank_text = "📍 Your rank: no successful referrals yet"
+        rank_text = "📍 Your rank: #{rank} of {total}"
+        back_text = "🔙 Back"
+    
+    if not top_referrers:
+        text += empty_text + "\n"
+    
+    for idx, referrer in enumerate(top_referrers, 1):
+        name = (referrer.full_name or 'User')[:20]
+        badge = medals.get(idx, f"{idx}.")
+        text += f"{badge} {name} - {referrer.successful_referrals} 🎯\n"
+    
+    text += "\n━━━━━━━━━━━━━━━\n"
+    if my_rank:
+        text += rank_text.format(rank=my_rank, total=total_referrers)
+    else:
+        text += no_rank_text
+    
+    keyboard = [[InlineKeyboardButton(back_text, callback_data='referral_menu')]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    await query.edit_message_text(
+        text,
+        reply_markup=reply_markup
+    )
+
 async def referral_callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """معالج callbacks الإحالة"""
     query = update.callback_query
@@ -273,4 +329,6 @@ async def referral_callback_handler(update: Update, context: ContextTypes.DEFAUL
     elif data == 'ref_friends_list':
         await show_friends_list(update, context)
     elif data == 'ref_achievements':
-        await show_achievements(update, context)
\ No newline at end of file
+        await show_achievements(update, context)
+    elif data == 'ref_leaderboard':
+        await show_leaderboard(update, context)
\ No newline at end of file
@@ -26,9 +26,9 @@ async def show_subscription_menu(update: Update, context: ContextTypes.DEFAULT_T
     
     # حالة الاشتراك الحالية
     is_vip = is_subscribed(user_id)
-    is_lifetime = user_data.get('is_lifetime_vip', False)
-    subscription_end = user_data.get('subscription_end')
-    successful_referrals = user_data.get('successful_referrals', 0)
+    is_lifetime = user_data.is_lifetime_vip
+    subscription_end = user_data.subscription_end
+    successful_referrals = user_data.successful_referrals
     
     # بناء الرسالة
     if lang == 'ar':
@@ -0,0 +1,143 @@
+"""
+كاش نتائج التحليل (extract_info) مشترك بين المستخدمين
+
+- المفتاح: الرابط الموحد من url_canonical (مثل youtube:<id>)
+- القيمة: نسخة مختصرة من info_dict (العنوان، المدة، الناشر، الأبعاد، الصيغ وأحجامها) بدون روابط الصيغ الموقّعة
+- مدة صلاحية لكل منصة، وحد أقصى للعناصر مع حذف الأقدم استخداماً (LRU)
+- حفظ اختياري على القرص (INFO_CACHE_FILE) ليبقى الكاش بعد إعادة التشغيل
+"""
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+INFO_CACHE_FILE = os.getenv("INFO_CACHE_FILE", "")
+INFO_CACHE_MAX_ENTRIES = int(os.getenv("INFO_CACHE_MAX_ENTRIES", 2000))
+INFO_CACHE_TTL = int(os.getenv("INFO_CACHE_TTL", 3600))
+# أقل فاصل بين عمليات الحفظ على القرص (الحفظ النهائي عند الإيقاف)
+INFO_CACHE_SAVE_INTERVAL = 60
+
+# البيانات الوصفية لبعض المنصات تتغير أسرع (عدادات، حذف، خصوصية) - قابلة للتعديل: INFO_CACHE_TTL_TIKTOK=900
+_PLATFORM_TTLS = {
+    "youtube": 6 * 3600,
+    "tiktok": 1800,
+    "instagram": 1800,
+    "facebook": 1800,
+    "twitter": 3600,
+}
+
+INFO_FIELDS = (
+    'extractor_key', 'id', 'title', 'duration', 'uploader', 'width', 'height',
+    'webpage_url', 'thumbnail', 'is_live', 'age_limit',
+)
+FORMAT_FIELDS = ('format_id', 'ext', 'width', 'height', 'fps', 'vcodec', 'acodec', 'abr', 'tbr', 'filesize', 'filesize_approx')
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # مفتاح -> {"info", "platform", "created"}
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+_loaded = False
+_dirty = False
+_last_save = 0.0
+
+def platform_ttl(platform: str):
+    """مدة صلاحية نتيجة التحليل لمنصة معينة"""
+    override = os.getenv(f"INFO_CACHE_TTL_{(platform or '').upper()}")
+    if override:
+        return int(override)
+    return _PLATFORM_TTLS.get(platform, INFO_CACHE_TTL)
+
+def prune_info(info_dict: dict):
+    """نسخة مختصرة من info_dict: الحقول المعروضة والصيغ بأحجامها فقط"""
+    pruned = {field: info_dict.get(field) for field in INFO_FIELDS if info_dict.get(field) is not None}
+    pruned['formats'] = [
+        {field: f.get(field) for field in FORMAT_FIELDS if f.get(field) is not None}
+        for f in info_dict.get('formats') or []
+    ]
+    return pruned
+
+def _load():
+    """تحميل الكاش من القرص مرة واحدة (يُستدعى تحت القفل)"""
+    global _loaded
+    if _loaded:
+        return
+    _loaded = True
+    if not INFO_CACHE_FILE or not os.path.exists(INFO_CACHE_FILE):
+        return
+    try:
+        with open(INFO_CACHE_FILE, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        now = time.time()
+        for key, entry in data.items():
+            if now - entry["created"] < platform_ttl(entry["platform"]):
+                _entries[key] = entry
+        logger.info(f"⚡ تم تحميل كاش التحليل: {len(_entries)} عنصر")
+    except Exception as e:
+        logger.error(f"❌ فشل تحميل كاش التحليل: {e}")
+
+def _save():
+    """حفظ ذري للكاش (يُستدعى تحت القفل)"""
+    global _dirty, _last_save
+    tmp_path = INFO_CACHE_FILE + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(_entries, f, ensure_ascii=False)
+    os.replace(tmp_path, INFO_CACHE_FILE)
+    _dirty = False
+    _last_save = time.time()
+
+def get(key: str):
+    """نتيجة تحليل محفوظة وصالحة أو None"""
+    with _lock:
+        _load()
+        entry = _entries.get(key)
+        if entry and time.time() - entry["created"] >= platform_ttl(entry["platform"]):
+            del _entries[key]
+            _stats["evictions"] += 1
+            entry = None
+        if not entry:
+            _stats["misses"] += 1
+            return None
+        _entries.move_to_end(key)
+        _stats["hits"] += 1
+        return dict(entry["info"])
+
+def put(key: str, platform: str, info_dict: dict):
+    """حفظ نتيجة تحليل (مختصرة) بعد extract_info"""
+    global _dirty
+    with _lock:
+        _load()
+        _entries[key] = {"info": prune_info(info_dict), "platform": platform, "created": time.time()}
+        _entries.move_to_end(key)
+        _stats["stores"] += 1
+        while len(_entries) > INFO_CACHE_MAX_ENTRIES:
+            _entries.popitem(last=False)
+            _stats["evictions"] += 1
+        _dirty = True
+        if INFO_CACHE_FILE and time.time() - _last_save >= INFO_CACHE_SAVE_INTERVAL:
+            try:
+                _save()
+            except Exception as e:
+                logger.error(f"❌ فشل حفظ كاش التحليل: {e}")
+
+def invalidate(key: str):
+    with _lock:
+        _entries.pop(key, None)
+
+def flush():
+    """حفظ التغييرات المعلقة عند الإيقاف"""
+    with _lock:
+        if INFO_CACHE_FILE and _dirty:
+            _save()
+
+def get_stats():
+    """إحصائيات الكاش: العدد، الإصابات، الإخفاقات، ونسبة الإصابة"""
+    with _lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        return {
+            **_stats,
+            "entries": len(_entries),
+            "hit_rate": _stats["hits"] / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,230 @@
+"""
+كاش file_id من تيليجرام: الرابط نفسه بنفس الجودة يُعاد إرساله فوراً بدون تحميل أو رفع
+
+المفتاح: (المحتوى، الجودة، نوع العلامة المائية) - المحتوى بصيغة url_canonical (مثل youtube:<id>)
+- حذف الأقدم استخداماً (LRU) عند تجاوز الحد، وانتهاء صلاحية بعد مدة (TTL)
+- تغيير ملف اللوجو يلغي كل النسخ التي تحمل اللوجو القديم
+- الحفظ على القرص في خيط خلفي مرة كل MEDIA_CACHE_SAVE_INTERVAL ثانية على الأكثر، وعند الإيقاف (flush)
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+MEDIA_CACHE_FILE = os.getenv("MEDIA_CACHE_FILE", "media_cache.json")
+MEDIA_CACHE_MAX_ENTRIES = int(os.getenv("MEDIA_CACHE_MAX_ENTRIES", 5000))
+MEDIA_CACHE_TTL = int(os.getenv("MEDIA_CACHE_TTL", 30 * 24 * 3600))
+# أقل فاصل بين عمليات الحفظ على القرص (الحفظ النهائي عند الإيقاف)
+MEDIA_CACHE_SAVE_INTERVAL = 60
+
+_lock = threading.Lock()
+# يرتّب عمليات الكتابة على القرص (يُؤخذ قبل _lock) حتى لا تكتب لقطة أقدم فوق أحدث
+_save_lock = threading.Lock()
+_entries = OrderedDict()
+_meta = {"logo_hash": None}
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "invalidations": 0}
+_loaded = False
+_dirty = False
+_last_save = 0.0
+_save_timer = None
+
+# بصمة اللوجو محفوظة حسب (المسار، وقت التعديل، الحجم) حتى لا يُقرأ الملف في كل طلب
+_logo_fingerprint = None
+_logo_hash = None
+
+def _load():
+    """تحميل الكاش من القرص مرة واحدة (يُستدعى تحت القفل)"""
+    global _loaded
+    if _loaded:
+        return
+    _loaded = True
+    if not os.path.exists(MEDIA_CACHE_FILE):
+        return
+    try:
+        with open(MEDIA_CACHE_FILE, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        _meta.update(data.get("meta", {}))
+        now = time.time()
+        for entry in sorted(data.get("entries", []), key=lambda e: e["last_used"]):
+            if now - entry["created"] < MEDIA_CACHE_TTL:
+                _entries[entry["key"]] = entry
+        logger.info(f"⚡ تم تحميل كاش الملفات: {len(_entries)} عنصر")
+    except Exception as e:
+        logger.error(f"❌ فشل تحميل كاش الملفات: {e}")
+
+def _write(snapshot):
+    """كتابة ذرية للقطة على القرص (خارج _lock)"""
+    tmp_path = MEDIA_CACHE_FILE + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f, ensure_ascii=False)
+    os.replace(tmp_path, MEDIA_CACHE_FILE)
+
+def _save():
+    """لقطة تحت القفل ثم الكتابة خارجه - حلقة الأحداث لا تنتظر القرص"""
+    global _dirty, _last_save, _save_timer
+    with _save_lock:
+        with _lock:
+            _save_timer = None
+            if not _loaded or not _dirty:
+                return
+            snapshot = {"meta": dict(_meta), "entries": [dict(entry) for entry in _entries.values()]}
+            _dirty = False
+            _last_save = time.time()
+        try:
+            _write(snapshot)
+        except Exception as e:
+            logger.error(f"❌ فشل حفظ كاش الملفات: {e}")
+            with _lock:
+                _dirty = True
+
+def _mark_dirty():
+    """تسجيل تغيير وجدولة الحفظ في الخلفية مرة كل MEDIA_CACHE_SAVE_INTERVAL على الأكثر (يُستدعى تحت القفل)"""
+    global _dirty, _save_timer
+    _dirty = True
+    if _save_timer is None:
+        delay = max(0.0, MEDIA_CACHE_SAVE_INTERVAL - (time.time() - _last_save))
+        _save_timer = threading.Timer(delay, _save)
+        _save_timer.daemon = True
+        _save_timer.start()
+
+def make_key(content_key: str, quality: str, variant: str):
+    return f"{content_key}|{quality}|{variant}"
+
+# حقول التحليل المحفوظة مع كل عنصر: تكفي لقائمة الجودة والوصف بدون إعادة التحليل
+INFO_FIELDS = ('extractor_key', 'id', 'title', 'duration', 'uploader', 'width', 'height', 'webpage_url')
+
+def summarize_info(info_dict: dict):
+    return {field: info_dict.get(field) for field in INFO_FIELDS if info_dict.get(field) is not None}
+
+def _file_hash(path):
+    global _logo_fingerprint, _logo_hash
+    stat = os.stat(path)
+    fingerprint = (path, stat.st_mtime_ns, stat.st_size)
+    if fingerprint != _logo_fingerprint:
+        with open(path, 'rb') as f:
+            _logo_hash = hashlib.sha1(f.read()).hexdigest()[:12]
+        _logo_fingerprint = fingerprint
+    return _logo_hash
+
+def watermark_variant(logo_path: str = None):
+    """نوع العلامة المائية: clean أو logo:<بصمة الملف> - وإلغاء نسخ اللوجو القديم عند تغيّره"""
+    if not logo_path or not os.path.exists(logo_path):
+        return "clean"
+    logo_hash = _file_hash(logo_path)
+    with _lock:
+        _load()
+        if _meta.get("logo_hash") != logo_hash:
+            if _meta.get("logo_hash") is not None:
+                _invalidate(lambda entry: entry["variant"].startswith("logo:"))
+                logger.info("🎨 تغيّر اللوجو - تم إلغاء النسخ المخزنة باللوجو القديم")
+            _meta["logo_hash"] = logo_hash
+            _mark_dirty()
+    return f"logo:{logo_hash}"
+
+def _invalidate(predicate):
+    """حذف العناصر المطابقة (يُستدعى تحت القفل)"""
+    stale = [key for key, entry in _entries.items() if predicate(entry)]
+    for key in stale:
+        del _entries[key]
+    _stats["invalidations"] += len(stale)
+    return len(stale)
+
+def get(content_key: str, quality: str, variant: str):
+    """البحث عن file_id محفوظ - يعيد العنصر أو None"""
+    global _dirty
+    key = make_key(content_key, quality, variant)
+    with _lock:
+        _load()
+        entry = _entries.get(key)
+        if entry and time.time() - entry["created"] >= MEDIA_CACHE_TTL:
+            del _entries[key]
+            _stats["evictions"] += 1
+            entry = None
+        if not entry:
+            _stats["misses"] += 1
+            return None
+        _entries.move_to_end(key)
+        entry["last_used"] = time.time()
+        entry["hits"] += 1
+        _stats["hits"] += 1
+        # آخر استخدام يُحفظ مع الحفظ التالي أو عند الإيقاف
+        _dirty = True
+        return dict(entry)
+
+def get_info(content_key: str, qualities=("best", "medium", "audio")):
+    """ملخص التحليل لمحتوى سبق رفعه بأي جودة - للبحث قبل التحليل"""
+    with _lock:
+        _load()
+        variants = ["clean"]
+        if _meta.get("logo_hash"):
+            variants.append(f"logo:{_meta['logo_hash']}")
+        now = time.time()
+        for quality in qualities:
+            for variant in variants:
+                entry = _entries.get(make_key(content_key, quality, variant))
+                if entry and entry.get("info") and now - entry["created"] < MEDIA_CACHE_TTL:
+                    return dict(entry["info"])
+    return None
+
+def put(content_key: str, quality: str, variant: str, file_id: str, kind: str, file_size: int = 0, info: dict = None):
+    """حفظ file_id بعد رفع ناجح (مع ملخص التحليل)"""
+    key = make_key(content_key, quality, variant)
+    now = time.time()
+    with _lock:
+        _load()
+        _entries[key] = {
+            "key": key,
+            "variant": variant,
+            "file_id": file_id,
+            "kind": kind,
+            "file_size": file_size,
+            "info": summarize_info(info) if info else None,
+            "created": now,
+            "last_used": now,
+            "hits": 0,
+        }
+        _entries.move_to_end(key)
+        _stats["stores"] += 1
+        while len(_entries) > MEDIA_CACHE_MAX_ENTRIES:
+            _entries.popitem(last=False)
+            _stats["evictions"] += 1
+        _mark_dirty()
+
+def invalidate(content_key: str, quality: str, variant: str):
+    """حذف عنصر واحد (مثلاً file_id لم يعد صالحاً لدى تيليجرام)"""
+    with _lock:
+        _load()
+        if _entries.pop(make_key(content_key, quality, variant), None) is not None:
+            _stats["invalidations"] += 1
+            _mark_dirty()
+
+def clear():
+    """مسح الكاش بالكامل"""
+    with _lock:
+        _load()
+        count = _invalidate(lambda entry: True)
+        _mark_dirty()
+    return count
+
+def flush():
+    """حفظ التغييرات المعلقة (وآخر استخدام للعناصر) عند الإيقاف"""
+    with _lock:
+        timer = _save_timer
+    if timer is not None:
+        timer.cancel()
+    _save()
+
+def get_stats():
+    """إحصائيات الكاش: العدد، الإصابات، الإخفاقات، ونسبة الإصابة"""
+    with _lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        return {
+            **_stats,
+            "entries": len(_entries),
+            "hit_rate": _stats["hits"] / lookups if lookups else 0.0,
+        }
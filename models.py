@@ -0,0 +1,162 @@
+"""
+نموذج بيانات المستخدم المشترك بين أنواع التخزين
+يُفك ترميزه مرة واحدة عند التحميل ويُرمّز مرة واحدة عند الحفظ
+"""
+from dataclasses import dataclass, field
+from datetime import datetime, date
+
+# سجل التحميلات لكل مستخدم: حلقة ثابتة الحجم للأيام الأخيرة + مجاميع شهرية
+DAILY_HISTORY_DAYS = 7
+
+# رصيد التحميلات الإضافية لكل مستخدم جديد (ولأي سجل محفوظ بدون الحقل)
+DEFAULT_BONUS_DOWNLOADS = 50
+
+def parse_datetime(value):
+    """تحويل نص ISO إلى datetime (أو None)"""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+def format_datetime(value):
+    """تحويل datetime إلى نص ISO (أو None)"""
+    return value.isoformat() if value else None
+
+def empty_download_ring():
+    """حلقة فارغة من DAILY_HISTORY_DAYS خانة [اليوم، العدد]"""
+    return [[None, 0] for _ in range(DAILY_HISTORY_DAYS)]
+
+@dataclass(slots=True, eq=False)
+class UserRecord:
+    """بيانات مستخدم واحد بحقول ثابتة (__slots__) بدل قاموس"""
+    user_id: int
+    username: str = None
+    full_name: str = None
+    referral_code: str = None
+    language: str = "ar"
+    registration_date: datetime = None
+    download_count: int = 0
+    recent_downloads: list = field(default_factory=list)
+    monthly_downloads: dict = field(default_factory=dict)
+    subscription_end: datetime = None
+    is_lifetime_vip: bool = False
+    referred_by: int = None
+    referrals: list = field(default_factory=list)
+    successful_referrals: int = 0
+    bonus_downloads: int = DEFAULT_BONUS_DOWNLOADS
+    achievements: dict = field(default_factory=dict)
+    last_interaction: datetime = None
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """فك ترميز قاموس JSON (يدعم سجل daily_downloads القديم)"""
+        record = cls(
+            user_id=data["user_id"],
+            username=data.get("username"),
+            full_name=data.get("full_name"),
+            referral_code=data.get("referral_code"),
+            language=data.get("language") or "ar",
+            registration_date=parse_datetime(data.get("registration_date")),
+            download_count=data.get("download_count", 0),
+            recent_downloads=data.get("recent_downloads") or [],
+            monthly_downloads=data.get("monthly_downloads") or {},
+            subscription_end=parse_datetime(data.get("subscription_end")),
+            is_lifetime_vip=bool(data.get("is_lifetime_vip")),
+            referred_by=data.get("referred_by"),
+            referrals=data.get("referrals") or [],
+            successful_referrals=data.get("successful_referrals", 0),
+            bonus_downloads=data.get("bonus_downloads", DEFAULT_BONUS_DOWNLOADS),
+            achievements=data.get("achievements") or {},
+            last_interaction=parse_datetime(data.get("last_interaction")),
+        )
+        legacy = data.get("daily_downloads")
+        if legacy:
+            record.merge_legacy_history(legacy)
+        return record
+
+    def to_dict(self):
+        """ترميز إلى قاموس قابل للحفظ كـ JSON"""
+        return {
+            "user_id": self.user_id,
+            "username": self.username,
+            "full_name": self.full_name,
+            "referral_code": self.referral_code,
+            "language": self.language,
+            "registration_date": format_datetime(self.registration_date),
+            "download_count": self.download_count,
+            "recent_downloads": self.recent_downloads,
+            "monthly_downloads": self.monthly_downloads,
+            "subscription_end": format_datetime(self.subscription_end),
+            "is_lifetime_vip": self.is_lifetime_vip,
+            "referred_by": self.referred_by,
+            "referrals": self.referrals,
+            "successful_referrals": self.successful_referrals,
+            "bonus_downloads": self.bonus_downloads,
+            "achievements": self.achievements,
+            "last_interaction": format_datetime(self.last_interaction),
+        }
+
+    def snapshot(self):
+        """to_dict بنسخ مستقلة من القوائم والقواميس - آمن للترميز خارج القفل"""
+        data = self.to_dict()
+        data["recent_downloads"] = [list(slot) for slot in self.recent_downloads]
+        data["monthly_downloads"] = dict(self.monthly_downloads)
+        data["referrals"] = list(self.referrals)
+        data["achievements"] = dict(self.achievements)
+        return data
+
+    def has_active_subscription(self, now: datetime = None):
+        """VIP مدى الحياة أو اشتراك لم ينتهِ"""
+        if self.is_lifetime_vip:
+            return True
+        return bool(self.subscription_end and self.subscription_end > (now or datetime.now()))
+
+    def record_download(self, day: date):
+        """تسجيل تحميل في حلقة الأيام الأخيرة وفي مجموع الشهر"""
+        if not self.recent_downloads:
+            self.recent_downloads = empty_download_ring()
+        slot = self.recent_downloads[day.toordinal() % DAILY_HISTORY_DAYS]
+        day_str = day.isoformat()
+        if slot[0] != day_str:
+            # الخانة لليوم نفسه قبل أسبوع - تُستبدل (المجموع الشهري محفوظ مسبقاً)
+            slot[0], slot[1] = day_str, 0
+        slot[1] += 1
+
+        month = day.strftime('%Y-%m')
+        self.monthly_downloads[month] = self.monthly_downloads.get(month, 0) + 1
+
+    def downloads_on(self, day: date):
+        """عدد تحميلات يوم معين من الحلقة - O(1)"""
+        if not self.recent_downloads:
+            return 0
+        slot = self.recent_downloads[day.toordinal() % DAILY_HISTORY_DAYS]
+        return slot[1] if slot[0] == day.isoformat() else 0
+
+    def merge_legacy_history(self, legacy: dict):
+        """دمج قاموس daily_downloads القديم (ينمو بلا حد) في الحلقة والمجاميع الشهرية"""
+        ring = self.recent_downloads or empty_download_ring()
+        cutoff = date.today().toordinal() - DAILY_HISTORY_DAYS
+        for day_str, count in legacy.items():
+            month = day_str[:7]
+            self.monthly_downloads[month] = self.monthly_downloads.get(month, 0) + count
+            day = date.fromisoformat(day_str)
+            if day.toordinal() > cutoff:
+                ring[day.toordinal() % DAILY_HISTORY_DAYS] = [day_str, count]
+        self.recent_downloads = ring
+
+@dataclass(slots=True, frozen=True)
+class Entitlements:
+    """لقطة صلاحيات المستخدم لتحديث واحد: تُحسب بقراءة واحدة وتُمرر لكل المعالجات"""
+    user_id: int
+    exists: bool
+    language: str = "ar"
+    is_admin: bool = False
+    is_vip: bool = False
+    daily_downloads: int = 0
+    bonus_downloads: int = 0
+
+    @property
+    def is_unlimited(self):
+        """الأدمن و VIP بدون حد يومي"""
+        return self.is_admin or self.is_vip
@@ -0,0 +1,105 @@
+"""
+إرسال تحديثات التقدم إلى تيليجرام بأمان من أي خيط وبدون استهلاك حد الـ API
+
+- report() تُستدعى من خيط التحميل أو من حلقة الأحداث، وتحتفظ بآخر حالة فقط
+- تعديل واحد على الأكثر قيد التنفيذ لكل ProgressReporter؛ الحالات الوسيطة تُدمج
+- ميزانية عامة لعدد التعديلات في الثانية لكل التحميلات النشطة (PROGRESS_EDITS_PER_SECOND)
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_EDITS_PER_SECOND = float(os.getenv("PROGRESS_EDITS_PER_SECOND", 8))
+
+class _EditBudget:
+    """دلو رموز مشترك: كل تعديل رسالة يستهلك رمزاً (داخل حلقة الأحداث فقط)"""
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+_budget = _EditBudget(PROGRESS_EDITS_PER_SECOND)
+_stats = {"submitted": 0, "edits": 0, "coalesced": 0}
+
+class ProgressReporter:
+    """تحديثات تقدم لمجموعة رسائل (القائد ومن ينتظر نفس التحميل)"""
+    def __init__(self, messages, loop=None):
+        # القائمة نفسها تُشارك مع single_flight: المنضمون يُضافون إليها أثناء التحميل
+        self.messages = messages
+        self.loop = loop or asyncio.get_running_loop()
+        self._lock = threading.Lock()
+        self._pending = None
+        self._last_text = None
+        self._drain_future = None
+        self._closed = False
+
+    def report(self, text: str):
+        """تسجيل آخر حالة وجدولة الإرسال إن لم يكن هناك إرسال جارٍ (آمنة من أي خيط)"""
+        with self._lock:
+            if self._closed:
+                return
+            _stats["submitted"] += 1
+            if self._pending is not None:
+                _stats["coalesced"] += 1
+            self._pending = text
+            if self._drain_future is not None:
+                return
+            self._drain_future = asyncio.run_coroutine_threadsafe(self._drain(), self.loop)
+
+    def _take_pending(self):
+        with self._lock:
+            text, self._pending = self._pending, None
+            if text is None or self._closed:
+                self._drain_future = None
+                return None
+            return text
+
+    async def _drain(self):
+        """إرسال آخر حالة حتى لا يبقى شيء معلق"""
+        while True:
+            text = self._take_pending()
+            if text is None:
+                return
+            if text == self._last_text:
+                continue
+            self._last_text = text
+            for message in list(self.messages):
+                await _budget.acquire()
+                if self._closed:
+                    break
+                try:
+                    await message.edit_text(text)
+                    _stats["edits"] += 1
+                except Exception as e:
+                    # "message is not modified" أو رسالة محذوفة - لا داعي لإيقاف التحميل
+                    logger.debug(f"تعذر تحديث رسالة التقدم: {e}")
+
+    async def aclose(self):
+        """إيقاف التحديثات وانتظار التعديل الجاري قبل الرسالة النهائية (من حلقة الأحداث)"""
+        with self._lock:
+            self._closed = True
+            self._pending = None
+            future = self._drain_future
+        if future is not None:
+            try:
+                await asyncio.wrap_future(future)
+            except Exception:
+                pass
+
+def get_stats():
+    """عدد التحديثات المطلوبة والمرسلة فعلاً والمدمجة"""
+    return dict(_stats, edits_per_second=PROGRESS_EDITS_PER_SECOND)
@@ -0,0 +1,79 @@
+"""
+سجل التحميلات الجارية (single-flight): تحميل واحد لعدة مستخدمين يطلبون نفس الفيديو
+
+أول طلب لمفتاح (المحتوى، الجودة، العلامة المائية) يصبح القائد وينفذ التحميل والرفع،
+والطلبات التالية خلال التنفيذ تنضم له وتتابع تقدمه ثم تستلم نفس النتيجة (file_id).
+كل الدوال تُستدعى من حلقة الأحداث فقط - لا حاجة لقفل.
+"""
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class FlightFailed(Exception):
+    """فشل تنفيذ القائد - المنضمون يستلمون نفس الخطأ (الأصلي في __cause__)"""
+
+class FlightAbandoned(FlightFailed):
+    """نجح القائد لكن بدون نتيجة قابلة للمشاركة - كل منتظر يحمّل بنفسه"""
+
+class Flight:
+    """تحميل جارٍ واحد ومن ينتظره"""
+    __slots__ = ("key", "future", "followers", "listeners")
+
+    def __init__(self, key):
+        self.key = key
+        self.future = asyncio.get_running_loop().create_future()
+        self.followers = 0
+        # رسائل التقدم لكل المنتظرين (القائد يحدّثها كلها)
+        self.listeners = []
+
+    @property
+    def done(self):
+        return self.future.done()
+
+_flights = {}
+
+def join(key):
+    """الانضمام لتحميل جارٍ أو بدء واحد جديد - يعيد (Flight، هل هو القائد)"""
+    flight = _flights.get(key)
+    if flight is not None and not flight.done:
+        flight.followers += 1
+        logger.info(f"🔗 انضمام لتحميل جارٍ: {key[0]} ({flight.followers} منتظر)")
+        return flight, False
+    flight = Flight(key)
+    _flights[key] = flight
+    return flight, True
+
+def finish(flight: Flight, result=None, error: Exception = None):
+    """إنهاء التحميل وإبلاغ المنتظرين - استدعاء إضافي بعد النتيجة لا أثر له"""
+    if _flights.get(flight.key) is flight:
+        del _flights[flight.key]
+    if flight.done:
+        return
+    if result is not None:
+        flight.future.set_result(result)
+    else:
+        failure = FlightFailed(str(error) if error else "لم يكتمل التحميل")
+        failure.__cause__ = error
+        flight.future.set_exception(failure)
+        # قراءة الخطأ تمنع تحذير asyncio عندما لا يوجد منتظرون
+        flight.future.exception()
+
+def abandon(flight: Flight):
+    """إنهاء التحميل بدون نتيجة مشتركة (مثلاً لا file_id) - المنتظرون يعيدون المحاولة بأنفسهم"""
+    if _flights.get(flight.key) is flight:
+        del _flights[flight.key]
+    if not flight.done:
+        flight.future.set_exception(FlightAbandoned("لا توجد نتيجة مشتركة"))
+        flight.future.exception()
+
+async def wait(flight: Flight):
+    """انتظار نتيجة القائد (إلغاء أحد المنتظرين لا يلغي التحميل)"""
+    return await asyncio.shield(flight.future)
+
+def get_stats():
+    """عدد التحميلات الجارية وعدد المنتظرين عليها"""
+    return {
+        "in_flight": len(_flights),
+        "followers": sum(flight.followers for flight in _flights.values()),
+    }
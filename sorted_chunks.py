@@ -0,0 +1,94 @@
+"""
+قائمة مرتبة مقسمة إلى أجزاء صغيرة (نفس فكرة sortedcontainers.SortedList)
+
+الإضافة والحذف: بحث ثنائي على آخر عنصر في كل جزء ثم داخل الجزء، والإزاحة داخل جزء واحد
+(CHUNK_SIZE عنصر على الأكثر) بدل إزاحة القائمة كلها كما في insort على list عادية.
+الترتيب (rank): جمع أطوال الأجزاء السابقة - عدد الأجزاء n / CHUNK_SIZE فقط.
+غير آمنة للخيوط: المستدعي يحمي الوصول بقفله.
+"""
+from bisect import bisect_left, bisect_right, insort
+
+CHUNK_SIZE = 512
+
+class SortedChunks:
+    """قائمة مرتبة من أجزاء - add/discard بتكلفة O(log n + CHUNK_SIZE)"""
+    __slots__ = ("_chunks", "_maxes", "_len")
+
+    def __init__(self, items=()):
+        self._chunks = []
+        self._maxes = []
+        self._len = 0
+        self.reset(items)
+
+    def reset(self, items=()):
+        """إعادة البناء من عناصر غير مرتبة"""
+        values = sorted(items)
+        self._chunks = [values[i:i + CHUNK_SIZE] for i in range(0, len(values), CHUNK_SIZE)]
+        self._maxes = [chunk[-1] for chunk in self._chunks]
+        self._len = len(values)
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            yield from chunk
+
+    def add(self, value):
+        """إضافة عنصر في موقعه"""
+        if not self._chunks:
+            self._chunks.append([value])
+            self._maxes.append(value)
+            self._len = 1
+            return
+        pos = bisect_right(self._maxes, value)
+        if pos == len(self._maxes):
+            # أكبر من كل العناصر: آخر جزء
+            pos -= 1
+            self._chunks[pos].append(value)
+            self._maxes[pos] = value
+        else:
+            insort(self._chunks[pos], value)
+        self._len += 1
+        chunk = self._chunks[pos]
+        if len(chunk) > 2 * CHUNK_SIZE:
+            # تقسيم الجزء الكبير إلى نصفين
+            half = chunk[CHUNK_SIZE:]
+            del chunk[CHUNK_SIZE:]
+            self._chunks.insert(pos + 1, half)
+            self._maxes[pos] = chunk[-1]
+            self._maxes.insert(pos + 1, half[-1])
+
+    def discard(self, value):
+        """حذف عنصر إن وُجد - يعيد True إن حُذف"""
+        pos = bisect_left(self._maxes, value)
+        if pos == len(self._maxes):
+            return False
+        chunk = self._chunks[pos]
+        idx = bisect_left(chunk, value)
+        if idx == len(chunk) or chunk[idx] != value:
+            return False
+        del chunk[idx]
+        self._len -= 1
+        if not chunk:
+            del self._chunks[pos]
+            del self._maxes[pos]
+        else:
+            self._maxes[pos] = chunk[-1]
+        return True
+
+    def bisect_left(self, value):
+        """عدد العناصر الأصغر من value"""
+        pos = bisect_left(self._maxes, value)
+        if pos == len(self._maxes):
+            return self._len
+        return sum(len(chunk) for chunk in self._chunks[:pos]) + bisect_left(self._chunks[pos], value)
+
+    def head(self, limit: int):
+        """أول limit عنصر بالترتيب"""
+        result = []
+        for chunk in self._chunks:
+            if len(result) >= limit:
+                break
+            result.extend(chunk[:limit - len(result)])
+        return result
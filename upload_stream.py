@@ -0,0 +1,67 @@
+"""
+رفع الملفات إلى تيليجرام بشكل متدفق مع تقدم حقيقي (البايتات المرسلة فعلاً)
+
+الملف لا يُقرأ كاملاً في الذاكرة: InputFile(read_file_handle=False) يمرّر مقبض الملف
+إلى httpx الذي يقرأه أجزاءً (64KB) أثناء الإرسال، وكل قراءة تُحسب كتقدم للرفع.
+مع خادم Bot API ذاتي (local_mode) يُمرَّر مسار الملف فقط ويقرؤه الخادم من القرص مباشرة.
+
+فحص الذاكرة: python benchmarks/check_upload_rss.py
+"""
+import os
+import logging
+from pathlib import Path
+
+from telegram import InputFile
+
+logger = logging.getLogger(__name__)
+
+# أقل تغيّر في النسبة المئوية قبل إبلاغ التقدم (القراءة تتم كل 64KB)
+UPLOAD_PROGRESS_STEP = 5
+
+class ProgressReader:
+    """غلاف قراءة فقط لملف مفتوح: يبلغ on_progress(المرسل، الإجمالي) مع تقدم القراءة"""
+    def __init__(self, file, on_progress=None, step: int = UPLOAD_PROGRESS_STEP):
+        self._file = file
+        self._on_progress = on_progress
+        self._step = step
+        self._last_percent = -step
+        self.name = getattr(file, 'name', 'upload')
+        self.total = os.fstat(file.fileno()).st_size
+
+    def read(self, size: int = -1):
+        chunk = self._file.read(size)
+        if self._on_progress and self.total:
+            sent = self._file.tell()
+            percent = int(sent * 100 / self.total)
+            if percent - self._last_percent >= self._step or (sent >= self.total and percent != self._last_percent):
+                self._last_percent = percent
+                try:
+                    self._on_progress(sent, self.total)
+                except Exception as e:
+                    logger.warning(f"خطأ في تحديث تقدم الرفع: {e}")
+        return chunk
+
+    # httpx يحسب الطول عبر fileno ويعيد المؤشر للبداية قبل الإرسال (وعند إعادة المحاولة)
+    def seek(self, offset: int, whence: int = os.SEEK_SET):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def close(self):
+        self._file.close()
+
+def input_file(file, on_progress=None, filename: str = None):
+    """InputFile متدفق من ملف مفتوح - يجب أن يبقى الملف مفتوحاً حتى انتهاء الطلب"""
+    reader = ProgressReader(file, on_progress)
+    return InputFile(reader, filename=filename or os.path.basename(reader.name), read_file_handle=False)
+
+def media_source(bot, file, on_progress=None):
+    """مصدر الرفع: مسار الملف لخادم Bot API ذاتي (local_mode) أو InputFile متدفق"""
+    if bot.local_mode:
+        # يتحول إلى file:// - يجب أن يرى الخادم نفس المسار (مجلد مشترك)
+        return Path(os.path.abspath(file.name))
+    return input_file(file, on_progress)
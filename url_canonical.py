@@ -0,0 +1,245 @@
+"""
+توحيد الروابط: نفس الفيديو بأي شكل رابط -> مفتاح ثابت (المنصة، معرف المحتوى)
+
+أمثلة لنفس المفتاح youtube:dQw4w9WgXcQ
+    https://youtu.be/dQw4w9WgXcQ?si=abc
+    https://m.youtube.com/watch?v=dQw4w9WgXcQ&feature=share
+    https://www.youtube.com/shorts/dQw4w9WgXcQ
+
+- حذف معاملات التتبع (utm_*, si, fbclid, igsh ...)
+- الروابط المختصرة (vm.tiktok.com, fb.watch ...) تُتبع تحويلاتها مرة واحدة مع كاش صغير
+- الروابط غير المعروفة: المفتاح هو الرابط بعد التنظيف
+- الرابط الموحد للكاش فقط: yt-dlp يستلم source (رابط المستخدم بدون تتبع) بكل معاملاته
+
+تجربة سريعة:
+    python url_canonical.py <رابط> [رابط...]
+"""
+import os
+import re
+import sys
+import time
+import asyncio
+import logging
+import threading
+import urllib.request
+from collections import OrderedDict, namedtuple
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+logger = logging.getLogger(__name__)
+
+URL_RESOLVE_SHORT_LINKS = os.getenv("URL_RESOLVE_SHORT_LINKS", "true").lower() == "true"
+URL_RESOLVE_TIMEOUT = float(os.getenv("URL_RESOLVE_TIMEOUT", 5))
+URL_RESOLVE_CACHE_SIZE = int(os.getenv("URL_RESOLVE_CACHE_SIZE", 2000))
+URL_RESOLVE_TTL = int(os.getenv("URL_RESOLVE_TTL", 24 * 3600))
+
+class CanonicalUrl(namedtuple("CanonicalUrl", "platform content_id url source")):
+    """نتيجة التوحيد - content_id يساوي None إن لم يُعرف معرف المحتوى، وsource الرابط الممرر لـ yt-dlp"""
+    __slots__ = ()
+
+    @property
+    def key(self):
+        """مفتاح الكاش: platform:content_id أو الرابط النظيف"""
+        if self.content_id:
+            return f"{self.platform}:{self.content_id}"
+        return self.url
+
+# ============ المنصات ============
+
+# النطاق (بدون www/m) -> اسم المنصة (نفس اسم extractor_key في yt-dlp بحروف صغيرة)
+_PLATFORM_HOSTS = {
+    "youtube.com": "youtube",
+    "youtu.be": "youtube",
+    "youtube-nocookie.com": "youtube",
+    "tiktok.com": "tiktok",
+    "instagram.com": "instagram",
+    "instagr.am": "instagram",
+    "facebook.com": "facebook",
+    "fb.com": "facebook",
+    "fb.watch": "facebook",
+    "twitter.com": "twitter",
+    "x.com": "twitter",
+}
+
+# نطاقات لا تحمل معرف المحتوى - يجب تتبع التحويل
+_SHORT_LINK_HOSTS = {"vm.tiktok.com", "vt.tiktok.com", "fb.watch", "t.co"}
+_SHORT_LINK_PATHS = (
+    ("tiktok.com", re.compile(r"^/t/")),
+    ("facebook.com", re.compile(r"^/share/")),
+)
+
+_HOST_PREFIXES = ("www.", "m.", "mobile.", "music.", "web.")
+
+_YOUTUBE_ID = r"([A-Za-z0-9_-]{11})"
+_PATH_PATTERNS = {
+    "youtube": [
+        re.compile(rf"^/(?:shorts|live|embed|v|e)/{_YOUTUBE_ID}"),
+    ],
+    "tiktok": [
+        re.compile(r"^/@[^/]+/(?:video|photo)/(\d+)"),
+        re.compile(r"^/v/(\d+)"),
+        re.compile(r"^/embed(?:/v2)?/(\d+)"),
+    ],
+    "instagram": [
+        re.compile(r"^/(?:[^/]+/)?(?:p|reel|reels|tv)/([A-Za-z0-9_-]+)"),
+    ],
+    "facebook": [
+        re.compile(r"^/(?:[^/]+/)?videos/(?:[^/]+/)?(\d+)"),
+        re.compile(r"^/reel/(\d+)"),
+    ],
+    "twitter": [
+        re.compile(r"^/(?:[^/]+|i/web)/status/(\d+)"),
+    ],
+}
+
+# معاملات تتبع عامة تُحذف من أي رابط (روابط المنصات المعروفة تُبنى من المعرف فقط)
+_TRACKING_PARAMS = {
+    "si", "fbclid", "gclid", "dclid", "msclkid", "igsh", "igshid", "mibextid", "mc_cid", "mc_eid",
+}
+
+# أسماء وحدات الاستخراج في yt-dlp التي تعود لنفس المنصة
+_EXTRACTOR_PLATFORMS = {"facebookreel": "facebook"}
+
+def _host(netloc: str):
+    host = netloc.lower().rsplit("@", 1)[-1].split(":", 1)[0]
+    for prefix in _HOST_PREFIXES:
+        if host.startswith(prefix):
+            return host[len(prefix):]
+    return host
+
+def detect_platform(url: str):
+    """اسم المنصة من نطاق الرابط (youtube, tiktok, ...) أو None"""
+    try:
+        host = _host(urlsplit(url.strip()).netloc)
+    except ValueError:
+        return None
+    for domain, platform in _PLATFORM_HOSTS.items():
+        if host == domain or host.endswith("." + domain):
+            return platform
+    return None
+
+def is_short_link(url: str):
+    """هل الرابط مختصر ولا يحمل معرف المحتوى؟"""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host in _SHORT_LINK_HOSTS:
+        return True
+    host = _host(host)
+    return any(host == domain and pattern.match(parts.path) for domain, pattern in _SHORT_LINK_PATHS)
+
+def _is_tracking(name: str):
+    name = name.lower()
+    return name in _TRACKING_PARAMS or name.startswith("utm_")
+
+def strip_tracking(url: str):
+    """رابط نظيف: https، نطاق بحروف صغيرة، بدون معاملات تتبع أو جزء #"""
+    url = url.strip()
+    if "://" not in url:
+        url = "https://" + url
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not _is_tracking(k)]
+    scheme = "https" if parts.scheme in ("http", "https") else parts.scheme
+    return urlunsplit((scheme, parts.netloc.lower(), parts.path or "/", urlencode(query), ""))
+
+def _content_id(platform: str, parts):
+    """معرف المحتوى من مسار الرابط ومعاملاته"""
+    host = _host(parts.netloc)
+    query = dict(parse_qsl(parts.query))
+    if platform == "youtube":
+        if host == "youtu.be":
+            match = re.match(rf"^/{_YOUTUBE_ID}", parts.path)
+            return match.group(1) if match else None
+        video_id = query.get("v", "")
+        if re.fullmatch(_YOUTUBE_ID, video_id):
+            return video_id
+    elif platform == "facebook" and query.get("v", "").isdigit():
+        return query["v"]
+    for pattern in _PATH_PATTERNS.get(platform, ()):
+        match = pattern.match(parts.path)
+        if match:
+            return match.group(1)
+    return None
+
+_CANONICAL_URLS = {
+    "youtube": "https://www.youtube.com/watch?v={}",
+    "twitter": "https://x.com/i/status/{}",
+    "facebook": "https://www.facebook.com/watch/?v={}",
+}
+
+def canonicalize(url: str):
+    """توحيد الرابط بدون اتصال بالشبكة (الروابط المختصرة تبقى كما هي)"""
+    source = cleaned = strip_tracking(url)
+    platform = detect_platform(cleaned)
+    content_id = _content_id(platform, urlsplit(cleaned)) if platform else None
+    if content_id and platform in _CANONICAL_URLS:
+        cleaned = _CANONICAL_URLS[platform].format(content_id)
+    elif content_id:
+        # المعرف في المسار: باقي المعاملات للمشاركة فقط
+        parts = urlsplit(cleaned)
+        cleaned = urlunsplit((parts.scheme, parts.netloc, parts.path, "", ""))
+    return CanonicalUrl(platform or _host(urlsplit(cleaned).netloc), content_id, cleaned, source)
+
+# ============ تتبع الروابط المختصرة ============
+
+_resolve_lock = threading.Lock()
+_resolved = OrderedDict()  # رابط مختصر -> (الرابط النهائي، وقت الحل)
+
+class _HeadRequest(urllib.request.Request):
+    def get_method(self):
+        return "HEAD"
+
+def _follow_redirects(url: str):
+    """الرابط النهائي بعد التحويلات (HEAD أولاً ثم GET لبعض المنصات التي ترفضه)"""
+    headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"}
+    try:
+        with urllib.request.urlopen(_HeadRequest(url, headers=headers), timeout=URL_RESOLVE_TIMEOUT) as response:
+            return response.geturl()
+    except Exception:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=URL_RESOLVE_TIMEOUT) as response:
+            return response.geturl()
+
+def resolve_short_link(url: str):
+    """تتبع تحويل رابط مختصر مع كاش - يعيد الرابط الأصلي عند الفشل"""
+    key = strip_tracking(url)
+    now = time.time()
+    with _resolve_lock:
+        cached = _resolved.get(key)
+        if cached and now - cached[1] < URL_RESOLVE_TTL:
+            _resolved.move_to_end(key)
+            return cached[0]
+
+    try:
+        target = _follow_redirects(key)
+    except Exception as e:
+        logger.warning(f"⚠️ فشل تتبع الرابط المختصر {key}: {e}")
+        return url
+
+    with _resolve_lock:
+        _resolved[key] = (target, now)
+        _resolved.move_to_end(key)
+        while len(_resolved) > URL_RESOLVE_CACHE_SIZE:
+            _resolved.popitem(last=False)
+    return target
+
+async def canonicalize_async(url: str, resolve: bool = URL_RESOLVE_SHORT_LINKS):
+    """توحيد الرابط مع تتبع الروابط المختصرة في خيط منفصل"""
+    if resolve and is_short_link(url):
+        loop = asyncio.get_running_loop()
+        url = await loop.run_in_executor(None, resolve_short_link, url)
+    return canonicalize(url)
+
+def content_key_from_info(info_dict: dict, url: str):
+    """مفتاح المحتوى بعد التحليل - نفس صيغة CanonicalUrl.key للمنصات المعروفة"""
+    extractor = (info_dict.get('extractor_key') or info_dict.get('extractor') or "").lower()
+    extractor = _EXTRACTOR_PLATFORMS.get(extractor, extractor)
+    video_id = info_dict.get('id')
+    if extractor and video_id:
+        return f"{extractor}:{video_id}"
+    return canonicalize(info_dict.get('webpage_url') or url).key
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    for arg in sys.argv[1:]:
+        result = asyncio.run(canonicalize_async(arg))
+        print(f"{arg}\n  -> {result.key}\n     {result.url}\n     {result.source}")
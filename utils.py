@@ -11,9 +11,14 @@ logger = logging.getLogger(__name__)
 MESSAGES = {}
 CONFIG = {}
 
+# الملفات تُقرأ عند أول استخدام وليس عند الاستيراد
+_config_loaded = False
+_messages_loaded = False
+
 def load_config():
     """يقوم بتحميل الإعدادات من ملف JSON"""
-    global CONFIG
+    global CONFIG, _config_loaded
+    _config_loaded = True
     try:
         if not os.path.exists('config.json'):
             logger.warning("⚠️ ملف config.json غير موجود. سيتم استخدام إعدادات افتراضية.")
@@ -41,7 +46,8 @@ def load_config():
 
 def load_messages():
     """يقوم بتحميل الرسائل من ملف JSON"""
-    global MESSAGES
+    global MESSAGES, _messages_loaded
+    _messages_loaded = True
     try:
         if not os.path.exists('messages.json'):
             logger.warning("⚠️ ملف messages.json غير موجود. سيتم استخدام رسائل افتراضية.")
@@ -76,6 +82,8 @@ def load_messages():
 
 def get_message(lang, key, **kwargs):
     """يجلب رسالة مترجمة بناءً على اللغة والمفتاح"""
+    if not _messages_loaded:
+        load_messages()
     if lang not in MESSAGES:
         lang = 'ar'
     
@@ -91,6 +99,8 @@ def get_message(lang, key, **kwargs):
 
 def get_config():
     """يجلب الإعدادات المحملة"""
+    if not _config_loaded:
+        load_config()
     return CONFIG
 
 def apply_animated_watermark(input_path, output_path, logo_path, size=150):
@@ -209,9 +219,6 @@ async def setup_bot_menu(bot):
     """يقوم بإعداد قائمة الأوامر (Menu) للبوت"""
     logger.info("📋 إعداد قائمة أوامر البوت...")
     
-    if not MESSAGES:
-        load_messages()
-    
     user_commands_ar = [
         BotCommand("start", get_message('ar', 'start_command_desc')),
         BotCommand("account", get_message('ar', 'account_command_desc')),
@@ -292,7 +299,3 @@ def validate_url(url: str) -> bool:
         r'(?::\d+)?'
         r'(?:/?|[/?]\S+)$', re.IGNORECASE)
     return url_pattern.match(url) is not None
-
-# تحميل عند الاستيراد
-load_config()
-load_messages()
\ No newline at end of file
@@ -0,0 +1,255 @@
+"""
+تشغيل yt-dlp (التحليل والتحميل) في خيوط أو في مجموعة عمليات منفصلة
+
+YTDLP_EXECUTOR=thread (افتراضي): خيوط داخل عملية البوت كما في السابق
+YTDLP_EXECUTOR=process: عمليات منفصلة - الاستخراج وقراءة HTTP ومعالجة الأجزاء لا تنافس
+    حلقة الأحداث على GIL. المهام وصفية قابلة للتسلسل (pickle)، وأحداث التقدم تعود عبر
+    طابور مشترك، وكل عملية تُستبدل بعد YTDLP_MAX_TASKS_PER_CHILD مهمة للحد من تضخم الذاكرة.
+"""
+import os
+import copy
+import time
+import asyncio
+import logging
+import threading
+import multiprocessing
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor
+from itertools import count
+from urllib.parse import urlsplit, parse_qs
+
+import download_queue
+
+logger = logging.getLogger(__name__)
+
+YTDLP_EXECUTOR = os.getenv("YTDLP_EXECUTOR", "thread").lower()
+YTDLP_MAX_TASKS_PER_CHILD = int(os.getenv("YTDLP_MAX_TASKS_PER_CHILD", 20))
+# عمليات إضافية للتحليل فوق أماكن التحميل (طابور التحميل لا يشغل أكثر من DOWNLOAD_WORKERS)
+YTDLP_EXTRACT_WORKERS = int(os.getenv("YTDLP_EXTRACT_WORKERS", 2))
+
+# أقصى عمر لنتيجة التحليل قبل إعادة الاستخراج (روابط الصيغ موقّعة وتنتهي صلاحيتها)
+INFO_MAX_AGE = int(os.getenv("INFO_MAX_AGE", 600))
+# هامش أمان قبل انتهاء صلاحية رابط الصيغة المعلن
+INFO_EXPIRY_MARGIN = 120
+# أقل فاصل بين أحداث التقدم المرسلة من العملية المنفصلة
+PROGRESS_INTERVAL = 0.5
+PROGRESS_FIELDS = ('status', 'downloaded_bytes', 'total_bytes', 'total_bytes_estimate', 'speed', 'eta', 'filename')
+
+# ============ تحميل yt-dlp ============
+
+# yt_dlp ثقيل (مئات وحدات الاستخراج) - يُستورد عند أول تحليل أو في خيط خلفي بعد بدء البوت
+_yt_dlp = None
+_yt_dlp_lock = threading.Lock()
+
+def _load_yt_dlp():
+    """استيراد yt_dlp وقائمة وحدات الاستخراج مرة واحدة"""
+    global _yt_dlp
+    with _yt_dlp_lock:
+        if _yt_dlp is None:
+            started = time.perf_counter()
+            import yt_dlp
+            from yt_dlp.extractor import gen_extractor_classes
+            gen_extractor_classes()
+            _yt_dlp = yt_dlp
+            logger.info(f"📦 تم تحميل yt-dlp في {(time.perf_counter() - started) * 1000:.0f}ms")
+    return _yt_dlp
+
+def warmup_yt_dlp():
+    """تحميل yt_dlp مسبقاً: في خيط خلفي، أو داخل عمليات المجموعة في وضع process"""
+    if YTDLP_EXECUTOR == "process":
+        pool = _get_pool()
+        for _ in range(_pool_size()):
+            pool.submit(_load_yt_dlp)
+        return
+    threading.Thread(target=_load_yt_dlp, name="yt-dlp-warmup", daemon=True).start()
+
+async def get_yt_dlp():
+    """الحصول على yt_dlp دون حجب حلقة الأحداث أثناء الاستيراد"""
+    if _yt_dlp is not None:
+        return _yt_dlp
+    return await asyncio.get_running_loop().run_in_executor(None, _load_yt_dlp)
+
+# ============ صلاحية نتيجة التحليل ============
+
+def _format_url_expiry(format_url: str):
+    """وقت انتهاء رابط الصيغة الموقّع إن كان معلناً (expire في يوتيوب، oe بالست عشري في انستغرام/فيسبوك)"""
+    query = parse_qs(urlsplit(format_url).query)
+    try:
+        if 'expire' in query:
+            return int(query['expire'][0])
+        if 'oe' in query:
+            return int(query['oe'][0], 16)
+    except ValueError:
+        pass
+    return None
+
+def is_info_fresh(info_dict: dict, now: float = None):
+    """هل نتيجة التحليل كاملة وحديثة بما يكفي للتحميل بدون استخراج جديد؟"""
+    now = now or time.time()
+    # ملخص الكاش أو نتيجة بلا صيغ لا يكفي للتحميل
+    if not info_dict.get('formats') and not info_dict.get('url'):
+        return False
+    epoch = info_dict.get('epoch')
+    if not epoch or now - epoch > INFO_MAX_AGE:
+        return False
+    format_urls = [f.get('url') for f in info_dict.get('formats') or [info_dict] if f.get('url')]
+    # نتيجة مختصرة من الكاش (صيغ بلا روابط) تحتاج استخراجاً جديداً
+    if not format_urls:
+        return False
+    expiries = [e for e in map(_format_url_expiry, format_urls) if e]
+    return not expiries or min(expiries) - now > INFO_EXPIRY_MARGIN
+
+def run_download(ydl, url: str, info_dict: dict):
+    """التحميل من نتيجة التحليل السابقة، مع الرجوع لاستخراج جديد إن انتهت صلاحيتها (يعمل في خيط أو عملية)"""
+    if info_dict and is_info_fresh(info_dict):
+        try:
+            ydl.process_ie_result(copy.deepcopy(info_dict), download=True)
+            return
+        except _yt_dlp.utils.DownloadError as e:
+            logger.warning(f"⚠️ فشل التحميل من نتيجة التحليل، إعادة الاستخراج: {e}")
+    ydl.download([url])
+
+# ============ المهام (قابلة للتسلسل) ============
+
+@dataclass(frozen=True)
+class ExtractJob:
+    """تحليل رابط بدون تحميل"""
+    url: str
+    ydl_opts: dict
+
+@dataclass(frozen=True)
+class DownloadJob:
+    """تحميل رابط (من نتيجة تحليل سابقة إن كانت صالحة) - ydl_opts بدون progress_hooks"""
+    url: str
+    ydl_opts: dict
+    info_dict: dict = None
+    job_id: int = 0
+    progress_queue: object = field(default=None, compare=False)
+
+def _run_extract(job: ExtractJob, sanitize: bool):
+    yt_dlp = _load_yt_dlp()
+    with yt_dlp.YoutubeDL(job.ydl_opts) as ydl:
+        info = ydl.extract_info(job.url, download=False)
+        # عبر العمليات: قاموس JSON نقي فقط (بدون كائنات yt-dlp الداخلية)
+        return ydl.sanitize_info(info, remove_private_keys=False) if sanitize else info
+
+def _run_download(job: DownloadJob, progress_hook=None):
+    yt_dlp = _load_yt_dlp()
+    ydl_opts = dict(job.ydl_opts)
+    if progress_hook:
+        ydl_opts['progress_hooks'] = [progress_hook]
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        run_download(ydl, job.url, job.info_dict)
+
+def _process_extract(job: ExtractJob):
+    """داخل العملية المنفصلة"""
+    return _run_extract(job, sanitize=True)
+
+def _process_download(job: DownloadJob):
+    """داخل العملية المنفصلة: أحداث التقدم تُرسل للطابور المشترك بمعدل محدود"""
+    last_sent = 0.0
+
+    def progress_hook(d):
+        nonlocal last_sent
+        now = time.monotonic()
+        if d.get('status') == 'downloading' and now - last_sent < PROGRESS_INTERVAL:
+            return
+        last_sent = now
+        job.progress_queue.put((job.job_id, {k: d.get(k) for k in PROGRESS_FIELDS}))
+
+    _run_download(job, progress_hook if job.progress_queue is not None else None)
+
+# ============ مجموعة العمليات ============
+
+_pool = None
+_manager = None
+_progress_queue = None
+_progress_hooks = {}
+_job_ids = count(1)
+_pool_lock = threading.Lock()
+
+def _pool_size():
+    return download_queue.DOWNLOAD_WORKERS + YTDLP_EXTRACT_WORKERS
+
+def _get_pool():
+    """إنشاء مجموعة العمليات وطابور التقدم عند أول استخدام"""
+    global _pool, _manager, _progress_queue
+    with _pool_lock:
+        if _pool is None:
+            # spawn: عمليات نظيفة بدون نسخة من حالة البوت (مطلوب أيضاً لـ max_tasks_per_child)
+            context = multiprocessing.get_context("spawn")
+            _manager = context.Manager()
+            _progress_queue = _manager.Queue()
+            workers = _pool_size()
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=context,
+                max_tasks_per_child=YTDLP_MAX_TASKS_PER_CHILD,
+            )
+            threading.Thread(target=_dispatch_progress, name="yt-dlp-progress", daemon=True).start()
+            logger.info(
+                f"🧩 تشغيل yt-dlp في {workers} عمليات "
+                f"(استبدال كل عملية بعد {YTDLP_MAX_TASKS_PER_CHILD} مهمة)"
+            )
+    return _pool
+
+def _dispatch_progress():
+    """تمرير أحداث التقدم القادمة من العمليات إلى hook كل مهمة (في خيط)"""
+    while True:
+        try:
+            item = _progress_queue.get()
+        except (EOFError, OSError):
+            return
+        if item is None:
+            return
+        job_id, event = item
+        hook = _progress_hooks.get(job_id)
+        if hook:
+            try:
+                hook(event)
+            except Exception as e:
+                logger.warning(f"خطأ في تحديث التقدم: {e}")
+
+# ============ الواجهة ============
+
+async def extract_info(url: str, ydl_opts: dict):
+    """تحليل الرابط (بدون تحميل) في الخيوط أو العمليات حسب YTDLP_EXECUTOR"""
+    job = ExtractJob(url, ydl_opts)
+    loop = asyncio.get_running_loop()
+    if YTDLP_EXECUTOR == "process":
+        return await loop.run_in_executor(_get_pool(), _process_extract, job)
+    await get_yt_dlp()
+    return await loop.run_in_executor(None, _run_extract, job, False)
+
+async def download(url: str, ydl_opts: dict, info_dict: dict = None, progress_hook=None):
+    """تحميل الرابط - progress_hook يُستدعى من خيط بأحداث التقدم في الوضعين"""
+    loop = asyncio.get_running_loop()
+    if YTDLP_EXECUTOR != "process":
+        await get_yt_dlp()
+        job = DownloadJob(url, ydl_opts, info_dict)
+        return await loop.run_in_executor(download_queue.executor, _run_download, job, progress_hook)
+
+    pool = _get_pool()
+    job_id = next(_job_ids)
+    job = DownloadJob(url, ydl_opts, info_dict, job_id, _progress_queue if progress_hook else None)
+    if progress_hook:
+        _progress_hooks[job_id] = progress_hook
+    try:
+        return await loop.run_in_executor(pool, _process_download, job)
+    finally:
+        _progress_hooks.pop(job_id, None)
+
+def shutdown():
+    """إيقاف مجموعة العمليات عند إيقاف البوت"""
+    global _pool, _manager
+    with _pool_lock:
+        if _pool is None:
+            return
+        # انتظار المهام الجارية فقط (wait=False مع استبدال العمليات يسبب أخطاء في concurrent.futures)
+        _pool.shutdown(wait=True, cancel_futures=True)
+        try:
+            _progress_queue.put(None)
+        except Exception:
+            pass
+        _manager.shutdown()
+        _pool = _manager = None